@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+import numpy as np
+from local_cache import LocalCache, CACHE_DIR
+from text_utils import normalize_text
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+# Cosine similarity a new question needs with a cached one to reuse its answer
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_HOURS", "24")) * 3600
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_MB", "64")) * 1024 * 1024
+# Written whenever the vectors in the index change; cached answers of older versions are dropped
+INDEX_VERSION_PATH = os.path.join(CACHE_DIR, "index_version")
+
+_cache = None
+_cache_lock = threading.Lock()
+# Per scope: the cache keys and a matrix of their normalized question embeddings
+_scopes = {}
+_scopes_lock = threading.Lock()
+_loaded_version = None
+
+def get_answer_cache():
+    """
+    Process-wide answer cache, opened on first use
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LocalCache("answers", ANSWER_CACHE_MAX_BYTES)
+        return _cache
+
+def get_index_version():
+    try:
+        with open(INDEX_VERSION_PATH) as f:
+            return f.read().strip() or "0"
+    except FileNotFoundError:
+        return "0"
+
+def bump_index_version():
+    """
+    Record that documents were ingested, changed or deleted; invalidates every cached answer
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    version = str(time.time_ns())
+    tmp_path = f"{INDEX_VERSION_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, INDEX_VERSION_PATH)
+    _sync_version()
+    return version
+
+def _sync_version():
+    # Drop entries of older index versions, in memory and on disk, when the version moves on
+    global _loaded_version
+    version = get_index_version()
+    with _scopes_lock:
+        if version == _loaded_version:
+            return version
+        _loaded_version = version
+        _scopes.clear()
+    cache = get_answer_cache()
+    stale = [key for key in cache.keys() if not key.startswith(f"{version}:")]
+    if stale:
+        cache.delete(stale)
+        print(f"Answer cache: dropped {len(stale)} answers from an older index version")
+    return version
+
+def answer_scope(category=None, type=None, brand=None, model_series=None, lang=None):
+    """
+    Answers are only shared between questions asked for the same equipment and language
+    """
+    scope = json.dumps([category, type, brand, model_series, lang or "None"])
+    return hashlib.sha256(scope.encode("utf-8")).hexdigest()[:16]
+
+def _question_hash(question):
+    return hashlib.sha256(normalize_text(question).lower().encode("utf-8")).hexdigest()
+
+def _load_scope(prefix):
+    # Called with _scopes_lock held
+    if prefix not in _scopes:
+        keys, vectors = [], []
+        for key, value in get_answer_cache().items(prefix):
+            keys.append(key)
+            vectors.append(np.frombuffer(base64.b64decode(json.loads(value)["embedding"]), dtype=np.float32))
+        matrix = np.vstack(vectors) if vectors else None
+        _scopes[prefix] = {"keys": keys, "matrix": matrix}
+    return _scopes[prefix]
+
+def _forget(prefix, key):
+    with _scopes_lock:
+        entry = _scopes.get(prefix)
+        if entry and key in entry["keys"]:
+            position = entry["keys"].index(key)
+            entry["keys"].pop(position)
+            entry["matrix"] = np.delete(entry["matrix"], position, axis=0) if entry["keys"] else None
+
+def _read(prefix, key):
+    value = get_answer_cache().get(key)
+    if value is None:
+        # Evicted by the LRU bound since the scope was loaded
+        _forget(prefix, key)
+        return None
+    entry = json.loads(value)
+    if time.time() - entry["created_at"] > ANSWER_CACHE_TTL_SECONDS:
+        get_answer_cache().delete([key])
+        _forget(prefix, key)
+        return None
+    return entry
+
+def lookup_answer(scope, question, query_embedding=None):
+    """
+    Cached (answer, source) for the same question, or for a similar one when query_embedding is given;
+    None on a miss
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    try:
+        prefix = f"{_sync_version()}:{scope}:"
+        entry = _read(prefix, prefix + _question_hash(question))
+        if entry is None and query_embedding is not None:
+            vector = np.asarray(query_embedding, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+            with _scopes_lock:
+                cached = _load_scope(prefix)
+                if cached["matrix"] is None:
+                    return None
+                similarities = cached["matrix"] @ vector
+                best = int(np.argmax(similarities))
+                similarity, key = float(similarities[best]), cached["keys"][best]
+            if similarity < ANSWER_CACHE_SIMILARITY:
+                return None
+            entry = _read(prefix, key)
+            if entry is not None:
+                print(f"Answer cache: similar question ({similarity:.3f}) {entry['question']!r}")
+        if entry is None:
+            return None
+        return entry["answer"], entry["source"]
+    except Exception as e:
+        print(f"Answer cache read error: {e}")
+        return None
+
+def store_answer(scope, question, query_embedding, answer, source):
+    if not ANSWER_CACHE_ENABLED or query_embedding is None:
+        return
+    try:
+        prefix = f"{_sync_version()}:{scope}:"
+        key = prefix + _question_hash(question)
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        get_answer_cache().put(key, json.dumps({
+            "question": question,
+            "answer": answer,
+            "source": source,
+            "embedding": base64.b64encode(vector.tobytes()).decode("ascii"),
+            "created_at": time.time(),
+        }).encode("utf-8"))
+        with _scopes_lock:
+            cached = _scopes.get(prefix)
+            if cached is not None and key not in cached["keys"]:
+                cached["keys"].append(key)
+                cached["matrix"] = vector[None, :] if cached["matrix"] is None else np.vstack([cached["matrix"], vector])
+    except Exception as e:
+        print(f"Answer cache write error: {e}")
+
+def clear_answers():
+    get_answer_cache().clear()
+    with _scopes_lock:
+        _scopes.clear()
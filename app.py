@@ -2,31 +2,49 @@ import streamlit as st
 import os
 import dotenv
 import pandas as pd
-from pdf_processor import process_pdf_and_upload, render_pdf_page_to_png_bytes
-from chatbot_utils import process_user_query, transcribe_audio, generate_audio_response
-from pinecone import Pinecone
+from chatbot_utils import process_user_query, transcribe_audio, synthesize_speech, join_speech_segments, speech_mime_type, speech_key
+from audio_cache import get_audio, cache_audio, get_audio_cache
+from embedding_cache import get_embedding_cache
+from ingest_manifest import clear_manifests, list_manifests
+from extraction_cache import list_entries as list_extraction_entries, invalidate as invalidate_extractions
+from job_queue import enqueue_job, get_jobs, ensure_workers, FINISHED_STATUSES, JOB_POLL_SECONDS
+from rate_limiter import limiter_stats
+from smalltalk import classifier_stats
+from answer_cache import bump_index_version, get_answer_cache, clear_answers
+from fixed_prompts import get_checks, get_suggested_questions, load_equipment
+from precomputed_answers import get_precomputed, precompute_status
+from json_stream import trim_partial_html
+from chat_history import compact_history, visible_messages
+from speech_stream import SpeechStream
+from lexical_index import get_lexical_index
+from vector_store import get_vector_store
+from reranker import reranker_stats, get_rerank_cache
+from clients import client_stats
+from document_equipment import list_document_equipment, get_document_equipment, set_document_equipment, EQUIPMENT_FIELDS
+import streamlit.components.v1 as components
 import base64
 import io
 from urllib.parse import unquote
 import re
+import uuid
 
-def pinecone_index_is_empty(pinecone_api_key, pinecone_index_name):
-    pc = Pinecone(api_key=pinecone_api_key)
-    index = pc.Index(pinecone_index_name)
-    stats = index.describe_index_stats()
-    return stats.get("total_vector_count", 0) == 0
+INDEX_STATS_TTL_SECONDS = int(os.getenv("INDEX_STATS_TTL_SECONDS", "30"))
 
-def get_index_stats(pinecone_api_key, pinecone_index_name):
-    """Get comprehensive index statistics"""
-    pc = Pinecone(api_key=pinecone_api_key)
-    index = pc.Index(pinecone_index_name)
-    stats = index.describe_index_stats()
-    return stats
+def vector_index_is_empty():
+    return get_index_stats().get("total_vector_count", 0) == 0
+
+@st.cache_data(ttl=INDEX_STATS_TTL_SECONDS, show_spinner=False)
+def get_index_stats():
+    """Get comprehensive index statistics; cached briefly so reruns do not each query the index"""
+    return get_vector_store().describe_stats()
+
+@st.cache_resource
+def start_ingestion_workers():
+    """Start the background ingestion workers once per server process"""
+    return ensure_workers()
 
 dotenv.load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
-pinecone_api_key = os.getenv("PINECONE_API_KEY")
-pinecone_index_name = os.getenv("PINECONE_INDEX_NAME")
 gemini_api_key = os.getenv("GEMINI_API_KEY")
 
 URL_LIST = [
@@ -77,6 +95,8 @@ def toggle_upload_chat():
 def change_model():
     st.session_state.change_transcription_model = not st.session_state.get("change_transcription_model", False)
 
+start_ingestion_workers()
+
 # ---- Enhanced CSS with better mobile support ----
 st.markdown(f"""
     <style>
@@ -360,6 +380,122 @@ if "verification_chat_open" not in st.session_state:
 if "selected_checklist" not in st.session_state:
     st.session_state.selected_checklist = None
 
+def chat_bubble_html(role, content):
+    """HTML of one chat bubble"""
+    css_class = "user-message" if role == "user" else "bot-message"
+    bubble_class = "user-bubble" if role == "user" else "bot-bubble"
+    return f"""
+        <div class="{css_class}">
+            <div class="chat-bubble {bubble_class}">
+                {content}
+            </div>
+        </div>
+    """
+
+def groundings_from_source(source):
+    """Grounding list for a chat message from the model's source metadata"""
+    if isinstance(source, dict) and source.get('source') and source.get('page'):
+        return [{'source': source.get('source'), 'page_number': source.get('page')}]
+    return []
+
+def queue_audio_playback(audio_bytes, mime_type):
+    """Append audio to a playback queue kept in the parent window, so consecutive segments play back to back"""
+    audio_src = f"data:{mime_type};base64,{base64.b64encode(audio_bytes).decode()}"
+    components.html(f"""
+        <script>
+            const w = window.parent;
+            w.ttsQueue = w.ttsQueue || [];
+            // Defined in the parent window so playback continues after this frame is removed on rerun
+            w.ttsPlayNext = w.ttsPlayNext || new w.Function(`
+                const src = window.ttsQueue.shift();
+                if (!src) {{ window.ttsPlaying = false; return; }}
+                window.ttsPlaying = true;
+                const audio = new Audio(src);
+                audio.onended = window.ttsPlayNext;
+                audio.onerror = window.ttsPlayNext;
+                audio.play().catch(window.ttsPlayNext);
+            `);
+            w.ttsQueue.push("{audio_src}");
+            if (!w.ttsPlaying) {{ w.ttsPlayNext(); }}
+        </script>
+    """, height=0)
+
+def answer_query(user_query, chat_key, rerank_key, instance, stream_container=None, speak=False):
+    """
+    Answer a chat query: fixed checklist/FAQ prompts from the precomputed store when it is fresh, otherwise live RAG.
+    With stream_container, the new user message and the answer are drawn there while the answer is generated.
+    With speak, the answer is also synthesized sentence by sentence while it is generated and played as it arrives.
+    Returns (answer, groundings, audio cache key or None).
+    """
+    selection = {
+        "category": st.session_state.get("category", None),
+        "type": st.session_state.get("type", None),
+        "brand": st.session_state.get("brand", None),
+        "model_series": st.session_state.get("model_series", None),
+    }
+
+    speech = None
+    if speak:
+        use_gemini = st.session_state.change_transcription_model
+
+        def play_segment(audio_bytes):
+            with stream_container:
+                queue_audio_playback(audio_bytes, speech_mime_type(use_gemini))
+
+        speech = SpeechStream(
+            lambda text: synthesize_speech(text, use_gemini),
+            on_segment=play_segment if stream_container is not None else None,
+        )
+
+    def finish(bot_reply, groundings, audio=None, audio_use_gemini=False):
+        # History keeps the audio cache key; the bytes stay in the audio cache
+        if audio is not None:
+            key = speech_key(bot_reply, audio_use_gemini)
+            cache_audio(key, audio)
+            return bot_reply, groundings, key
+        if speech is None:
+            return bot_reply, groundings, None
+        key = speech_key(bot_reply, use_gemini)
+        cached = get_audio(key) if not speech.segments else None
+        if cached is not None:
+            # Spoken before in full: replay without synthesizing anything
+            if stream_container is not None:
+                play_segment(cached)
+        else:
+            cache_audio(key, join_speech_segments(speech.finish(bot_reply), use_gemini))
+        return bot_reply, groundings, key
+
+    if isinstance(user_query, str):
+        precomputed = get_precomputed(user_query, **selection)
+        if precomputed is not None:
+            # Precomputed audio is synthesized with OpenAI; it is only used when the answer is spoken with OpenAI
+            audio = precomputed.get("audio") if speak and not use_gemini else None
+            if audio is not None and stream_container is not None:
+                play_segment(audio)
+            return finish(precomputed["answer"], groundings_from_source(precomputed["source"]), audio)
+
+    on_answer = None
+    if stream_container is not None:
+        with stream_container:
+            st.markdown(chat_bubble_html("user", st.session_state[chat_key][-1]["content"]), unsafe_allow_html=True)
+            answer_placeholder = st.empty()
+
+        def _stream_to_placeholder(partial_answer):
+            answer_placeholder.markdown(chat_bubble_html("assistant", trim_partial_html(partial_answer) + " ▌"), unsafe_allow_html=True)
+            if speech is not None:
+                speech.feed(partial_answer)
+        on_answer = _stream_to_placeholder
+
+    bot_reply, source = process_user_query(
+        user_query,
+        st.session_state[chat_key][:-1],  # previous messages for context
+        rerank=st.session_state.get(rerank_key, False),
+        is_side = True if instance == "side" else False,
+        on_answer=on_answer,
+        **selection,
+    )
+    return finish(bot_reply, groundings_from_source(source))
+
 def render_chat_assistant(instance="default"):
 
     # Namespaced keys (unique per instance)
@@ -391,18 +527,8 @@ def render_chat_assistant(instance="default"):
         chat_container = st.container()
 
         with chat_container:
-            for i, msg in enumerate(chat_history):
-                css_class = "user-message" if msg["role"] == "user" else "bot-message"
-                bubble_class = "user-bubble" if msg["role"] == "user" else "bot-bubble"
-
-                bubble_html = f"""
-                    <div class="{css_class}">
-                        <div class="chat-bubble {bubble_class}">
-                            {msg["content"]}
-                        </div>
-                    </div>
-                """
-                st.markdown(bubble_html, unsafe_allow_html=True)
+            for i, msg in visible_messages(chat_history):
+                st.markdown(chat_bubble_html(msg["role"], msg["content"]), unsafe_allow_html=True)
 
                 # Show source button per-instance and per-message (unique key)
                 if msg["role"] == "assistant" and msg.get("groundings"):
@@ -414,14 +540,17 @@ def render_chat_assistant(instance="default"):
                         if st.button("📄 View Source", key=f"view_source_{instance}_{i}"):
                             src_norm = normalize(src)
                             url = next(u for u in URL_LIST if normalize(os.path.basename(u)) == src_norm)
+                            # The ingestion stack (PyMuPDF, extraction SDKs) is only loaded when a source is opened
+                            from pdf_processor import render_pdf_page_to_png_bytes
                             png_bytes = render_pdf_page_to_png_bytes(url, page_number=int(page_no), zoom=2.0)
                             show_source_dialog(png_bytes)
-                if msg["role"] == "assistant" and msg.get("audio_byte"):
+                audio_bytes = get_audio(msg.get("audio_key")) if msg["role"] == "assistant" else None
+                if audio_bytes:
                     if not msg.get("played", False):
-                        st.audio(io.BytesIO(msg["audio_byte"]), autoplay=True)
+                        st.audio(io.BytesIO(audio_bytes), autoplay=True)
                         msg["played"] = True
                     else:
-                        st.audio(io.BytesIO(msg["audio_byte"]), autoplay=False)
+                        st.audio(io.BytesIO(audio_bytes), autoplay=False)
             
             # Auto-scroll anchor at the end of messages
             if chat_history:
@@ -513,17 +642,11 @@ def render_chat_assistant(instance="default"):
                         st.session_state[chat_key].append({"role": "user", "content": user_query if user_query.strip() != "" else " "})
                     # Process query
                     with st.spinner("🔍 Searching your documents..."):
-                        bot_reply, source = process_user_query(
-                            user_query,
-                            st.session_state[chat_key][:-1],
-                            rerank=st.session_state.get(rerank_key, False),
-                            category=st.session_state.get("category", None),
-                            type=st.session_state.get("type", None),
-                            brand=st.session_state.get("brand", None),
-                            model_series=st.session_state.get("model_series", None),
-                            is_side = True if instance == "side" else False 
+                        bot_reply, groundings, audio_key = answer_query(
+                            user_query, chat_key, rerank_key, instance, stream_container=chat_container, speak=True
                         )
-                        audio_byte = generate_audio_response(bot_reply)
+                        # Already played sentence by sentence while it was generated
+                        audio_played = True
                 else:
                     # Handle text input (either string from checklist or object.text from chat_input)
                     query_text = user_input if isinstance(user_input, str) else user_input.text.strip()
@@ -533,28 +656,12 @@ def render_chat_assistant(instance="default"):
 
                      # Process query
                     with st.spinner("🔍 Searching your documents..."):
-                        bot_reply, source = process_user_query(
-                            query_text,
-                            st.session_state[chat_key][:-1],  # previous messages for context
-                            rerank=st.session_state.get(rerank_key, False),
-                            category=st.session_state.get("category", None),
-                            type=st.session_state.get("type", None),
-                            brand=st.session_state.get("brand", None),
-                            model_series=st.session_state.get("model_series", None),
-                            is_side = True if instance == "side" else False 
-                        )
-                        audio_byte = None
-                # Prepare grounding metadata list from matches
-                groundings = []
-                if source.get('source') and source.get('page'):
-                    groundings.append({
-                        'source': source.get('source'),
-                        'page_number': source.get('page')
-                    })
+                        bot_reply, groundings, audio_key = answer_query(query_text, chat_key, rerank_key, instance, stream_container=chat_container)
+                        audio_played = False
 
                 # Add bot response to namespaced history
-                if audio_byte:
-                    st.session_state[chat_key].append({"role": "assistant", "content": bot_reply, "groundings": groundings, "audio_byte": audio_byte.getvalue()})
+                if audio_key:
+                    st.session_state[chat_key].append({"role": "assistant", "content": bot_reply, "groundings": groundings, "audio_key": audio_key, "played": audio_played})
                 else:
                     st.session_state[chat_key].append({"role": "assistant", "content": bot_reply, "groundings": groundings})
 
@@ -563,30 +670,12 @@ def render_chat_assistant(instance="default"):
                 st.session_state[chat_key].append({"role": "assistant", "content": error_msg})
                 st.error(f"Error processing query: {ex}")
 
+            compact_history(st.session_state[chat_key])
             st.rerun()
 
         # Frequently Asked Questions / Suggestions (expander - uses instance-specific state)
         with st.expander("💡 Frequently Asked Questions / Suggestions", expanded=st.session_state[faq_key]):
-            if st.session_state.get("category") == "HVAC":
-                suggested_questions = [
-                    "What are the key safety procedures described in the documents?",
-                    "Summarize maintenance schedule guidelines.",
-                    "I need contact details.",
-                    "Available temperature ranges?"
-                ]
-            elif st.session_state.get("category") == "CCTV System":
-                suggested_questions = [
-                        "Why is the camera not powering ON?",
-                        "Why is the camera not accessible on the network?",
-                        "Why is live video not displaying or freezing?",
-                        "Why are motion detection or alarm events not triggering?"]
-            else:
-                suggested_questions = [
-                    "What are the key safety procedures described in the documents?",
-                    "Summarize maintenance schedule guidelines.",
-                    "What are the contact details for emergency?",
-                    "Available temperature ranges?"
-                ]
+            suggested_questions = get_suggested_questions(st.session_state.get("category"))
 
             # Display questions in a single column layout
             for i, q in enumerate(suggested_questions):
@@ -595,31 +684,19 @@ def render_chat_assistant(instance="default"):
                     st.session_state[chat_key].append({"role": "user", "content": q})
                     try:
                         with st.spinner("🔍 Searching your documents..."):
-                            bot_reply, source = process_user_query(
-                                q,
-                                st.session_state[chat_key][:-1],
-                                rerank=st.session_state.get(rerank_key, False),
-                                category=st.session_state.get("category", None),
-                                type=st.session_state.get("type", None),
-                                brand=st.session_state.get("brand", None),
-                                model_series=st.session_state.get("model_series", None),
-                                is_side = True if instance == "side" else False 
-                            )
-
-                            groundings = []
-                            if source.get('source') and source.get('page'):
-                                groundings.append({
-                                    'source': source.get('source'),
-                                    'page_number': source.get('page')
-                                })
-
-                            st.session_state[chat_key].append({"role": "assistant", "content": bot_reply, "groundings": groundings})
+                            bot_reply, groundings, audio_key = answer_query(q, chat_key, rerank_key, instance, stream_container=chat_container)
+
+                            if audio_key:
+                                st.session_state[chat_key].append({"role": "assistant", "content": bot_reply, "groundings": groundings, "audio_key": audio_key, "played": False})
+                            else:
+                                st.session_state[chat_key].append({"role": "assistant", "content": bot_reply, "groundings": groundings})
                     except Exception as ex:
                         error_msg = f"Sorry, I encountered an error: {str(ex)}"
                         st.session_state[chat_key].append({"role": "assistant", "content": error_msg})
                         st.error(f"Error processing suggestion: {ex}")
 
                     # Auto-close the FAQ and rerun to show updated chat
+                    compact_history(st.session_state[chat_key])
                     st.session_state[faq_key] = False
                     st.rerun()
 
@@ -627,6 +704,75 @@ def render_chat_assistant(instance="default"):
 def show_source_dialog(png_bytes: bytes):
     st.image(png_bytes)
 
+EQUIPMENT_COLUMNS = {"category": "Category", "type": "Type", "brand": "Brand", "model_series": "Model / Series"}
+
+def equipment_picker(key, current=None):
+    """Multiselects for the equipment a document covers; each choice narrows the next, empty means any"""
+    current = current or {}
+    rows = load_equipment()
+    equipment = {}
+    for field in EQUIPMENT_FIELDS:
+        column = EQUIPMENT_COLUMNS[field]
+        options = list(rows[column].dropna().unique())
+        equipment[field] = st.multiselect(
+            column,
+            options,
+            default=[value for value in current.get(field, []) if value in options],
+            key=f"{key}_{field}",
+            placeholder="Any",
+        )
+        if equipment[field]:
+            rows = rows[rows[column].isin(equipment[field])]
+    return equipment
+
+JOB_STATUS_ICONS = {"queued": "🕒", "running": "⏳", "succeeded": "✅", "failed": "❌"}
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_upload_jobs():
+    """Poll the background jobs of this session and report them once they are all finished"""
+    jobs = get_jobs(st.session_state.upload_jobs)
+    for job in reversed(jobs):
+        progress = f"{job['pages_done']}/{job['pages_total']} pages" if job["pages_total"] else ""
+        st.markdown(f"""
+        <div class="upload-progress">
+            <strong>{JOB_STATUS_ICONS.get(job['status'], '')} {job['filename']}</strong> — {job['status']} {progress}
+        </div>
+        """, unsafe_allow_html=True)
+        if job["status"] == "running" and job["pages_total"]:
+            st.progress(job["pages_done"] / job["pages_total"])
+
+    if jobs and all(job["status"] in FINISHED_STATUSES for job in jobs):
+        success_count = 0
+        processing_errors = []
+        for job in reversed(jobs):
+            if job["status"] == "succeeded":
+                success_count += 1
+                st.session_state.processed_files.append({
+                    'name': job['filename'],
+                    'status': 'success'
+                })
+            else:
+                processing_errors.append(f"{job['filename']}: {job['error'] or 'Processing failed'}")
+                st.session_state.processed_files.append({
+                    'name': job['filename'],
+                    'status': 'error',
+                    'error': job['error'] or 'Processing failed'
+                })
+
+        # Update upload state based on results
+        if success_count == len(jobs):
+            st.session_state.upload_state = "completed"
+        elif success_count > 0:
+            st.session_state.upload_state = "partial"
+        else:
+            st.session_state.upload_state = "failed"
+        st.session_state.upload_summary = (success_count, len(jobs), processing_errors)
+        get_index_stats.clear()
+        st.session_state.upload_jobs = []
+
+        # Rerun the whole page to update button state
+        st.rerun(scope="app")
+
 # ---- Fixed Title ----
 st.markdown('<div class="fixed-title"></div>', unsafe_allow_html=True)
 st.markdown('<div class="main-content">', unsafe_allow_html=True)
@@ -638,6 +784,8 @@ if "upload_state" not in st.session_state:
     st.session_state.upload_state = "normal"
 if "processed_files" not in st.session_state:
     st.session_state.processed_files = []
+if "upload_jobs" not in st.session_state:
+    st.session_state.upload_jobs = []
 if "faq_open" not in st.session_state:
     st.session_state.faq_open = False
 
@@ -647,9 +795,9 @@ with st.sidebar:
     
     # Show index statistics
     try:
-        stats = get_index_stats(pinecone_api_key, pinecone_index_name)
+        stats = get_index_stats()
         total_vectors = stats.get("total_vector_count", 0)
-        print(f"{pinecone_index_name} Total Vectors :::::", total_vectors)
+        print(f"{get_vector_store().name} Total Vectors :::::", total_vectors)
         
         if total_vectors == 0:
             st.markdown("""
@@ -694,8 +842,37 @@ if page == "Upload PDFs":
     
     if uploaded_files:
         
+        # Chunks are tagged with this equipment so chat searches can be narrowed to the selected unit
+        with st.expander("Equipment covered by these documents"):
+            upload_equipment = equipment_picker("upload_equipment")
+
         if st.session_state.upload_state == "normal":
             if st.button("🚀 Process PDFs", type="primary", use_container_width=True):
+                # Ensure persistent PDF storage directory exists
+                pdf_dir = os.getenv("PDF_DIR", "pdfs")
+                job_ids = []
+
+                for uploaded_file in uploaded_files:
+                    # Save uploaded file using the original filename (spaces replaced), in a directory of its own
+                    # so concurrent uploads of the same file do not overwrite each other
+                    safe_name = uploaded_file.name.replace(' ', '_')
+                    job_dir = os.path.join(pdf_dir, uuid.uuid4().hex)
+                    os.makedirs(job_dir, exist_ok=True)
+                    saved_path = os.path.join(job_dir, safe_name)
+                    with open(saved_path, "wb") as f:
+                        f.write(uploaded_file.getbuffer())
+                    if any(upload_equipment.values()):
+                        set_document_equipment(safe_name, **upload_equipment)
+
+                    # The background worker processes the file and deletes it when done
+                    job_ids.append(enqueue_job(
+                        uploaded_file.name,
+                        saved_path,
+                        use_gemini=st.session_state.get("gemini_upload", False)
+                    ))
+
+                ensure_workers()
+                st.session_state.upload_jobs = job_ids
                 st.session_state.upload_state = "uploading"
                 st.rerun()
         elif st.session_state.upload_state == "uploading":
@@ -712,104 +889,31 @@ if page == "Upload PDFs":
             if st.button("❌ Processing Failed", disabled=False, use_container_width=True):
                 st.session_state.upload_state = "normal"
                 st.rerun()
-        
-        if st.session_state.upload_state == "uploading":
-            status_container = st.container()
-            
-            success_count = 0
-            total_files = len(uploaded_files)
-            processing_errors = []
-            
-            for i, uploaded_file in enumerate(uploaded_files):
-                with status_container:
-                    st.markdown(f"""
-                    <div class="upload-progress">
-                        <strong>Processing:</strong> {uploaded_file.name} ({i+1}/{total_files})
-                    </div>
-                    """, unsafe_allow_html=True)
-                # Ensure persistent PDF storage directory exists
-                pdf_dir = os.getenv("PDF_DIR", "pdfs")
-                os.makedirs(pdf_dir, exist_ok=True)
-
-                # Save uploaded file using the original filename (spaces replaced)
-                safe_name = uploaded_file.name.replace(' ', '_')
-                saved_path = os.path.join(pdf_dir, safe_name)
 
-                try:
-                    # Save canonical file for future rendering and reference
-                    with open(saved_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
+    if st.session_state.upload_state == "uploading":
+        st.info("PDFs are processed in the background — you can keep chatting and check back here.")
+        render_upload_jobs()
+    elif st.session_state.upload_state in ("completed", "partial", "failed") and st.session_state.get("upload_summary"):
+        success_count, total_files, processing_errors = st.session_state.upload_summary
+
+        # Better success/error reporting
+        if success_count == total_files:
+            st.markdown(f"""
+            <div class="success-message">
+                <h4>✅ All PDFs processed successfully!</h4>
+                <p>Processed {success_count}/{total_files} documents</p>
+                <p>You can now ask questions about your documents.</p>
+            </div>
+            """, unsafe_allow_html=True)
+        else:
+            st.warning(f"⚠️ Processed {success_count}/{total_files} documents successfully.")
+            if processing_errors:
+                st.error("Errors encountered:")
+                for error in processing_errors:
+                    st.error(f"• {error}")
 
-                    # Use processing pipeline on the saved canonical file
-                    result = process_pdf_and_upload(
-                        saved_path,
-                        gemini_api_key,
-                        openai_api_key,
-                        pinecone_api_key,
-                        pinecone_index_name,
-                        use_gemini=st.session_state.get("gemini_upload", False)
-                    )
-                    
-                    if result:
-                        success_count += 1
-                        st.session_state.processed_files.append({
-                            'name': uploaded_file.name,
-                            'status': 'success'
-                        })
-                    else:
-                        processing_errors.append(f"{uploaded_file.name}: Processing failed")
-                        st.session_state.processed_files.append({
-                            'name': uploaded_file.name,
-                            'status': 'error',
-                            'error': 'Processing failed'
-                        })
-                        
-                except Exception as e:
-                    error_msg = f"{uploaded_file.name}: {str(e)}"
-                    processing_errors.append(error_msg)
-                    st.session_state.processed_files.append({
-                        'name': uploaded_file.name,
-                        'status': 'error',
-                        'error': str(e)
-                    })
-                finally:
-                    # Clean up temporary file
-                    if os.path.exists(saved_path):
-                        try:
-                            os.remove(saved_path)
-                        except Exception as e:
-                            print(f"⚠️ Could not delete {saved_path}: {e}") 
-            
-            # Update upload state based on results
-            if success_count == total_files:
-                st.session_state.upload_state = "completed"
-            elif success_count > 0:
-                st.session_state.upload_state = "partial"
-            else:
-                st.session_state.upload_state = "failed"
-            
-            # Better success/error reporting
-            if success_count == total_files:
-                st.markdown(f"""
-                <div class="success-message">
-                    <h4>✅ All PDFs processed successfully!</h4>
-                    <p>Processed {success_count}/{total_files} documents</p>
-                    <p>You can now ask questions about your documents.</p>
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.warning(f"⚠️ Processed {success_count}/{total_files} documents successfully.")
-                if processing_errors:
-                    st.error("Errors encountered:")
-                    for error in processing_errors:
-                        st.error(f"• {error}")
-            
-            # Auto-redirect to chat if successful
-            if success_count > 0:
-                st.success("🎉 Ready to chat! Click 'Chat Assistant' to start asking questions.")
-            
-            # Trigger rerun to update button state
-            st.rerun()
+        if success_count > 0:
+            st.success("🎉 Ready to chat! Click 'Chat Assistant' to start asking questions.")
 
 # ---- Chat Assistant Page ----
 elif page == "Chat Assistant":
@@ -821,8 +925,18 @@ elif page == "Database Management":
     
     # Show detailed statistics
     try:
-        stats = get_index_stats(pinecone_api_key, pinecone_index_name)
+        stats = get_index_stats()
         
+        # Show the background ingestion queue (all users)
+        recent_jobs = get_jobs(limit=20)
+        if recent_jobs:
+            st.subheader("Ingestion Jobs")
+            st.dataframe(
+                pd.DataFrame(recent_jobs)[["id", "filename", "status", "pages_done", "pages_total", "attempts", "error"]],
+                hide_index=True,
+                use_container_width=True,
+            )
+
         # Show recently processed files
         if st.session_state.processed_files:
             st.subheader("Recently Processed Files")
@@ -853,9 +967,11 @@ elif page == "Database Management":
         if st.button("🗑️ Reset Entire Database", type="secondary"):
             with st.spinner("Resetting database..."):
                 try:
-                    pc = Pinecone(api_key=pinecone_api_key)
-                    index = pc.Index(pinecone_index_name)
-                    index.delete(delete_all=True)
+                    get_vector_store().delete_all()
+                    get_index_stats.clear()
+                    clear_manifests()
+                    get_lexical_index().clear()
+                    bump_index_version()
                     
                     # Clear session state
                     st.session_state.chat_history = []
@@ -867,6 +983,125 @@ elif page == "Database Management":
                     
                 except Exception as e:
                     st.error(f"Error resetting database: {e}")
+    st.subheader("Document Equipment")
+    ingested_documents = sorted({manifest["document"] for manifest in list_manifests()} | set(list_document_equipment()))
+    # Documents ingested before manifests existed are not listed; they are tagged by file name
+    legacy_document = st.text_input("Document ingested before manifests (file name)", key="legacy_equipment_document").strip()
+    if legacy_document and legacy_document not in ingested_documents:
+        ingested_documents.append(legacy_document)
+    if ingested_documents:
+        equipment_mapping = list_document_equipment()
+        st.dataframe(
+            pd.DataFrame([
+                {"document": document, **{
+                    EQUIPMENT_COLUMNS[field]: ", ".join(equipment_mapping.get(document, {}).get(field, [])) or "Any"
+                    for field in EQUIPMENT_FIELDS
+                }}
+                for document in ingested_documents
+            ]),
+            hide_index=True,
+            use_container_width=True,
+        )
+        mapped_document = legacy_document or st.selectbox("Document", ingested_documents, key="equipment_document")
+        document_equipment = equipment_picker(f"equipment_{mapped_document}", get_document_equipment(mapped_document))
+        if st.button("Save and Retag", key="retag_document_btn"):
+            set_document_equipment(mapped_document, **document_equipment)
+            from pdf_processor import retag_document
+            with st.spinner("Updating chunk tags..."):
+                retagged = retag_document(mapped_document)
+            if retagged is None:
+                st.error("Could not update the chunk tags; they are applied on the next upload of the document")
+            else:
+                st.success(f"Updated {retagged} chunks")
+    else:
+        st.markdown("No ingested documents.")
+
+    st.subheader("Lexical Index")
+    lexical_stats = get_lexical_index().stats()
+    st.markdown(
+        f"{lexical_stats['chunks']} chunks of {lexical_stats['documents']} documents are searchable by exact term "
+        f"(error codes, model and part numbers); documents ingested before it existed are added on their next upload"
+    )
+
+    st.subheader("Embedding Cache")
+    cache_stats = get_embedding_cache().stats()
+    st.markdown(
+        f"{cache_stats['entries']} vectors, {cache_stats['bytes'] / (1024 * 1024):.1f} MB of "
+        f"{cache_stats['max_bytes'] / (1024 * 1024):.0f} MB — "
+        f"{cache_stats['hits']} hits / {cache_stats['misses']} misses this process"
+    )
+
+    st.subheader("Answer Cache")
+    answer_stats = get_answer_cache().stats()
+    st.markdown(
+        f"{answer_stats['entries']} answers, {answer_stats['bytes'] / (1024 * 1024):.1f} MB — "
+        f"{answer_stats['hits']} hits this process"
+    )
+    if st.button("Clear Answer Cache", key="clear_answer_cache_btn"):
+        clear_answers()
+        st.rerun()
+
+    st.subheader("Audio Cache")
+    audio_stats = get_audio_cache().stats()
+    st.markdown(
+        f"{audio_stats['entries']} clips, {audio_stats['bytes'] / (1024 * 1024):.1f} MB of "
+        f"{audio_stats['max_bytes'] / (1024 * 1024):.0f} MB — "
+        f"{audio_stats['hits']} hits / {audio_stats['misses']} misses this process"
+    )
+
+    st.subheader("Precomputed Answers")
+    precomputed = precompute_status()
+    st.markdown(
+        f"{precomputed['fresh']} of {precomputed['entries']} checklist/FAQ answers match the current index; "
+        "run `python precomputed_answers.py refresh` to update them, or set PRECOMPUTE_AFTER_INGEST=true to "
+        "refresh the uploaded documents' equipment after each upload"
+    )
+
+    st.subheader("Reranker")
+    rerank_stats = reranker_stats()
+    st.markdown(
+        f"{rerank_stats['cohere']} Cohere calls, {rerank_stats['local']} local reranks, "
+        f"{rerank_stats['cached']} served from cache ({get_rerank_cache().stats()['entries']} cached), "
+        f"{rerank_stats['fallbacks']} local fallbacks after Cohere errors this process"
+    )
+
+    st.subheader("Small-talk Classifier")
+    smalltalk_stats = classifier_stats()
+    agreement = smalltalk_stats["agreement"]
+    st.markdown(
+        f"{smalltalk_stats['messages']} messages — {smalltalk_stats['local_smalltalk']} small talk and "
+        f"{smalltalk_stats['local_questions']} questions decided locally, {smalltalk_stats['escalated']} sent to the LLM "
+        f"(hit rate {smalltalk_stats['hit_rate']:.0%}); agreement with the LLM "
+        f"{'n/a' if agreement is None else f'{agreement:.0%}'} over {smalltalk_stats['audited']} audited messages"
+    )
+
+    st.subheader("Provider Rate Limits")
+    provider_stats = limiter_stats()
+    if provider_stats:
+        st.dataframe(pd.DataFrame(provider_stats), hide_index=True, use_container_width=True)
+    else:
+        st.info("No provider calls in this process yet")
+    provider_clients = client_stats()
+    if provider_clients:
+        st.markdown("Pooled clients: " + ", ".join(f"{c['provider']} (built in {c['build_ms']:.0f} ms)" for c in provider_clients))
+
+    st.subheader("Extraction Cache")
+    extraction_entries = list_extraction_entries()
+    if extraction_entries:
+        st.dataframe(
+            pd.DataFrame(extraction_entries)[["document", "page_number", "backend", "model", "prompt_version", "characters"]],
+            hide_index=True,
+            use_container_width=True,
+        )
+        cached_documents = sorted({entry["document"] for entry in extraction_entries})
+        invalidate_document = st.selectbox("Document", ["All documents"] + cached_documents, key="invalidate_extraction_document")
+        if st.button("Invalidate Extractions", key="invalidate_extraction_btn"):
+            removed = invalidate_extractions(document=None if invalidate_document == "All documents" else invalidate_document)
+            st.success(f"Removed {removed} cached pages")
+            st.rerun()
+    else:
+        st.markdown("No cached page extractions.")
+
     st.subheader("Change Header")
     st.button("Change", on_click=toggle_header)
 
@@ -891,11 +1126,7 @@ elif page == "Category Selection":
     st.session_state.verification_chat_open = False
     st.header("📂 Category Selection")
 
-    df = pd.read_excel('Model_Series.xlsx')
-
-    df['Model / Series'] = df['Model / Series'].str.split('; ')
-    master_df = df.explode('Model / Series').reset_index(drop=True)
-    master_df['Model / Series'] = master_df['Model / Series'].str.strip()
+    master_df = load_equipment()
 
     # A. Picklist 1 (Category)
     category_options = master_df['Category'].unique()
@@ -958,46 +1189,15 @@ elif page == "Checklist":
             st.session_state.verification_chat_open = True
             st.session_state.mobile_scroll_pending = True
 
-        if st.session_state.get('category') == "HVAC":
-            CHECKS = [
-                ("chk_temp_modes", "Check that the temperature is set correctly for Cooling, Heating, and Auto modes."),
-                ("chk_on_lamp", "Check if the ON lamp on the wired controller is flashing and record the error code."),
-                ("chk_wireless_lamp", "Check if the lamp near the wireless receiver on the indoor unit is flashing?."),
-                ("chk_mode", "Check that the correct operating mode (Cool / Heat / Dry / Fan / Auto / Vent) is selected."),
-                ("chk_remote_error", "Check if any error code is shown on the remote display."),
-                ("chk_timer", "Check that the timer settings are set correctly and only one timer type is in use."),
-                ("chk_filters", "Check that the air filters are clean, in good condition, and fitted properly."),
-                ("chk_alarm", "Check if any alarm or flashing light is present and record the details."),
-            ]
-            for chk_key, label in CHECKS:
-                st.checkbox(label, key=chk_key)
-                st.button(
-                    "Ask Agent",
-                    key=f"btn_{chk_key}",
-                    on_click=on_arrow_click,
-                    args=(label,),
-                    type='tertiary'
-                )
-        else:
-            CHECKS = [
-                ("chk_power", "Check that the camera power supply is stable at DC 12V and the unit powers ON correctly."),
-                ("chk_network", "Check if the network link LED is active and the camera IP is reachable on the network."),
-                ("chk_video", "Check if live video is displayed correctly in the web browser without freezing or delay."),
-                ("chk_video_settings", "Check that the correct video resolution, frame rate, and compression settings are applied."),
-                ("chk_lens", "Check the camera lens for dust or damage and confirm image focus and clarity."),
-                ("chk_motion", "Check if motion detection is enabled and verify correct detection response."),
-                ("chk_alarm_io", "Check alarm input and output connections and confirm correct NO/NC operation."),
-                ("chk_time", "Check system date and time settings and confirm synchronization is correct."),
-            ]
-            for chk_key, label in CHECKS:
-                st.checkbox(label, key=chk_key)
-                st.button(
-                    "Ask Agent",
-                    key=f"btn_{chk_key}",
-                    on_click=on_arrow_click,
-                    args=(label,),
-                    type='tertiary'
-                )
+        for chk_key, label in get_checks(st.session_state.get('category')):
+            st.checkbox(label, key=chk_key)
+            st.button(
+                "Ask Agent",
+                key=f"btn_{chk_key}",
+                on_click=on_arrow_click,
+                args=(label,),
+                type='tertiary'
+            )
     with col_chat:
         if st.session_state.verification_chat_open:
             render_chat_assistant(instance="side")
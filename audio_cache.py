@@ -0,0 +1,48 @@
+import os
+import json
+import hashlib
+import threading
+from local_cache import LocalCache
+from text_utils import normalize_text
+
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_audio_cache():
+    """
+    Process-wide synthesized speech cache, opened on first use
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LocalCache("audio", AUDIO_CACHE_MAX_BYTES)
+        return _cache
+
+def audio_key(text, voice, model, backend):
+    """
+    Content address of the speech for text with one voice/model/backend
+    """
+    spec = json.dumps([normalize_text(text), voice, model, backend])
+    return f"{backend}:{hashlib.sha256(spec.encode('utf-8')).hexdigest()}"
+
+def get_audio(key):
+    """
+    Cached audio bytes, or None on a miss (or after eviction)
+    """
+    if not key:
+        return None
+    try:
+        return get_audio_cache().get(key)
+    except Exception as e:
+        print(f"Audio cache read error: {e}")
+        return None
+
+def cache_audio(key, audio_bytes):
+    if not audio_bytes:
+        return
+    try:
+        get_audio_cache().put(key, audio_bytes)
+    except Exception as e:
+        print(f"Audio cache write error: {e}")
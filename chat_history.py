@@ -0,0 +1,72 @@
+import os
+from text_utils import estimate_tokens, html_to_text
+
+# Messages kept per chat session; older turns are folded into a short summary message
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "30"))
+# Tokens of conversation sent with each question, newest turns first
+CHAT_PROMPT_MAX_TOKENS = int(os.getenv("CHAT_PROMPT_MAX_TOKENS", "1500"))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))
+# Characters of each older question and answer that make it into the summary
+SUMMARY_EXCERPT_CHARS = 160
+
+SUMMARY_ROLE = "summary"
+
+def _excerpt(text):
+    text = html_to_text(text)
+    return text if len(text) <= SUMMARY_EXCERPT_CHARS else text[:SUMMARY_EXCERPT_CHARS].rsplit(" ", 1)[0] + "…"
+
+def compact_history(history, max_messages=None):
+    """
+    Bound a session's history in place: the oldest messages beyond max_messages are replaced by
+    one summary message (role "summary") listing what was asked and answered, itself capped in tokens
+    """
+    max_messages = max_messages or CHAT_HISTORY_MAX_MESSAGES
+    summary = history.pop(0) if history and history[0]["role"] == SUMMARY_ROLE else None
+    overflow = max(0, len(history) - max_messages)
+    # Keep question/answer pairs together
+    if overflow % 2 and overflow < len(history):
+        overflow += 1
+    dropped, history[:] = history[:overflow], history[overflow:]
+
+    lines = summary["content"].split("\n") if summary else []
+    for message in dropped:
+        if message["role"] in ("user", "assistant"):
+            lines.append(f"{'User' if message['role'] == 'user' else 'Assistant'}: {_excerpt(message['content'])}")
+    # The oldest lines go first when the summary outgrows its budget
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > CHAT_SUMMARY_MAX_TOKENS:
+        lines.pop(0)
+    if lines:
+        history.insert(0, {"role": SUMMARY_ROLE, "content": "\n".join(lines)})
+    return history
+
+def visible_messages(history):
+    """
+    (index, message) pairs to draw in the chat, without the summary
+    """
+    return [(i, message) for i, message in enumerate(history) if message["role"] != SUMMARY_ROLE]
+
+def build_prompt_history(history, max_tokens=None):
+    """
+    Role/content messages for the model: the newest turns that fit max_tokens, answers as plain text,
+    preceded by the summary of older turns
+    """
+    max_tokens = max_tokens or CHAT_PROMPT_MAX_TOKENS
+    messages, used = [], 0
+    summary = history[0]["content"] if history and history[0]["role"] == SUMMARY_ROLE else None
+    for message in reversed(history):
+        if message["role"] == SUMMARY_ROLE:
+            continue
+        content = message.get("content", "")
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', errors='ignore')
+        # HTML markup of answers costs tokens without helping to resolve follow-up questions
+        content = html_to_text(str(content))
+        tokens = estimate_tokens(content)
+        if used + tokens > max_tokens:
+            break
+        messages.append({"role": message["role"], "content": content})
+        used += tokens
+    messages.reverse()
+    if summary:
+        messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    return messages
@@ -1,30 +1,50 @@
 import os
-from openai import OpenAI, OpenAIError
-from google import genai
-from google.genai import types
-from pinecone import Pinecone
 import dotenv
 import json
-import cohere
 import io
+import re
 import wave
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from embedding_cache import get_cached_embeddings, cache_embeddings
+from text_utils import estimate_tokens
+from rate_limiter import rate_limited_call, rate_limited_stream
+from smalltalk import classify_smalltalk, should_audit, record_decision, record_audit
+from answer_cache import answer_scope, lookup_answer, store_answer
+from json_stream import JsonStringFieldStream
+from audio_cache import audio_key, get_audio, cache_audio
+from chat_history import build_prompt_history
+from context_packer import pack_context
+from document_equipment import equipment_filter
+from vector_store import get_vector_store
+from clients import get_openai_client, get_gemini_client, openai_error
+from reranker import rerank
+from lexical_index import get_lexical_index, reciprocal_rank_fusion, LEXICAL_SEARCH
 
 dotenv.load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
-pinecone_api_key = os.getenv("PINECONE_API_KEY")
-pinecone_index_name = os.getenv("PINECONE_INDEX_NAME")
-cohere_api_key = os.getenv("COHERE_API_KEY")
 gemini_transcription_model = os.getenv("GEMINI_TRANSCRIPTION_MODEL")
 openai_transcription_model = os.getenv("OPENAI_TRANSCRIPTION_MODEL")
 gemini_audio_generation_model = os.getenv("GEMINI_AUDIO_GENERATION_MODEL")
 openai_audio_generation_model = os.getenv("OPENAI_AUDIO_GENERATION_MODEL")
 gemini_api_key = os.getenv("GEMINI_API_KEY")
 
-openai_client = OpenAI(api_key=openai_api_key)
-pc = Pinecone(api_key=pinecone_api_key)
-index = pc.Index(pinecone_index_name)
-gemini_client = genai.Client(api_key=gemini_api_key)
+# Provider SDKs and clients are loaded on first use (see clients.py), so importing this module does no
+# network I/O and the Gemini stack is only loaded when a Gemini feature is used. Retries and backoff are
+# handled by rate_limited_call, shared by every provider.
+
+# Tokens reserved for a chat completion's answer when budgeting tokens per minute
+CHAT_OUTPUT_TOKENS = 1000
+# Threads running the greeting check and retrieval of concurrent queries side by side
+QUERY_MAX_WORKERS = int(os.getenv("QUERY_MAX_WORKERS", "8"))
+_query_executor = ThreadPoolExecutor(max_workers=QUERY_MAX_WORKERS, thread_name_prefix="query")
+GENERATION_ERROR = "Sorry, there was an error generating a response."
+# Follow-up questions that refer back to the conversation are not answered from the answer cache
+HISTORY_REFERENCE = re.compile(r"\b(it|its|that|this|these|those|they|them|their|above|previous|same|again)\b", re.IGNORECASE)
+
+def _chat_tokens(messages):
+    return sum(estimate_tokens(message["content"]) for message in messages) + CHAT_OUTPUT_TOKENS
 
 def transcribe_audio(audio_file):
     """
@@ -39,14 +59,19 @@ def transcribe_audio(audio_file):
         if st.session_state.change_transcription_model == False:    
             # Call the Whisper API
             # The 'audio_file' here is a file-like object provided by Streamlit
-            transcript = openai_client.audio.transcriptions.create(
-                model=openai_transcription_model, 
-                file=audio_file
-            )
+            def transcribe():
+                # A retry has to send the recording again from the start
+                audio_file.seek(0)
+                return get_openai_client(openai_api_key).audio.transcriptions.create(
+                    model=openai_transcription_model, 
+                    file=audio_file
+                )
+            transcript = rate_limited_call("openai", "transcription", transcribe, description="Transcription")
             print("Transcript :::::", transcript.text)
             return transcript.text
         else:
-            transcript = gemini_client.models.generate_content(
+            from google.genai import types
+            transcript = rate_limited_call("gemini", "transcription", lambda: get_gemini_client(gemini_api_key).models.generate_content(
                 model=gemini_transcription_model,
                 contents=[
                     types.Part.from_bytes(
@@ -73,7 +98,7 @@ def transcribe_audio(audio_file):
                 config=types.GenerateContentConfig(
                     response_mime_type="application/json",
                 ),
-            )
+            ), description="Transcription")
             data = json.loads(transcript.text)
             print("Data :::::", data)
             print("Audio Translation :::::", data.get("translation"))
@@ -84,20 +109,57 @@ def transcribe_audio(audio_file):
         print(f"Error during transcription: {e}")
         return f"Error: {str(e)}"
 
-def generate_audio_response(text):
-    if st.session_state.change_transcription_model == False:
-        audio_bytes = io.BytesIO()
-        with openai_client.audio.speech.with_streaming_response.create(
-            model=openai_audio_generation_model,
-            voice="shimmer",
-            input=text,
-            instructions="Speak in a cheerful and positive tone.",
-        ) as response:
-            for chunk in response.iter_bytes():
-                audio_bytes.write(chunk)
-        return audio_bytes
+def _pcm_to_wav(pcm):
+    # Gemini returns raw 24 kHz 16-bit mono PCM
+    audio_bytes = io.BytesIO()
+    with wave.open(audio_bytes, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(24000)
+        wf.writeframes(pcm)
+    return audio_bytes.getvalue()
+
+OPENAI_VOICE = "shimmer"
+OPENAI_VOICE_INSTRUCTIONS = "Speak in a cheerful and positive tone."
+GEMINI_VOICE = "Kore"
+
+def speech_key(text, use_gemini=False):
+    """
+    Audio cache key of the speech for text with the current voice settings
+    """
+    if use_gemini:
+        return audio_key(text, GEMINI_VOICE, gemini_audio_generation_model, "gemini")
+    return audio_key(text, f"{OPENAI_VOICE}|{OPENAI_VOICE_INSTRUCTIONS}", openai_audio_generation_model, "openai")
+
+def synthesize_speech(text, use_gemini=False):
+    """
+    Speech for text: MP3 bytes from OpenAI or WAV bytes from Gemini, served from the audio cache when
+    the same text was spoken before
+    """
+    key = speech_key(text, use_gemini)
+    audio = get_audio(key)
+    if audio is None:
+        audio = _synthesize_speech_uncached(text, use_gemini)
+        cache_audio(key, audio)
+    return audio
+
+def _synthesize_speech_uncached(text, use_gemini):
+    if not use_gemini:
+        def synthesize():
+            audio_bytes = io.BytesIO()
+            with get_openai_client(openai_api_key).audio.speech.with_streaming_response.create(
+                model=openai_audio_generation_model,
+                voice=OPENAI_VOICE,
+                input=text,
+                instructions=OPENAI_VOICE_INSTRUCTIONS,
+            ) as response:
+                for chunk in response.iter_bytes():
+                    audio_bytes.write(chunk)
+            return audio_bytes.getvalue()
+        return rate_limited_call("openai", "tts", synthesize, description="Speech synthesis")
     else:
-        response = gemini_client.models.generate_content(
+        from google.genai import types
+        response = rate_limited_call("gemini", "tts", lambda: get_gemini_client(gemini_api_key).models.generate_content(
                 model=gemini_audio_generation_model,
                 contents=text,
                 config=types.GenerateContentConfig(
@@ -105,107 +167,122 @@ def generate_audio_response(text):
                     speech_config=types.SpeechConfig(
                         voice_config=types.VoiceConfig(
                             prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                                voice_name='Kore',
+                                voice_name=GEMINI_VOICE,
                             )
                         )
                     ),
                 )
-            )
+            ), description="Speech synthesis")
 
-        # Extract the raw PCM data from the response
-        audio_data = response.candidates[0].content.parts[0].inline_data.data
+        # Extract the raw PCM data from the response and wrap it into a WAV container
+        return _pcm_to_wav(response.candidates[0].content.parts[0].inline_data.data)
 
-        # Wrap the raw PCM data into a WAV container in memory
-        audio_bytes = io.BytesIO()
-        with wave.open(audio_bytes, "wb") as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)
-            wf.setframerate(24000)
-            wf.writeframes(audio_data)
+def speech_mime_type(use_gemini=False):
+    return "audio/wav" if use_gemini else "audio/mpeg"
 
-        # Seek to start so the returned object is ready to be read/played
-        audio_bytes.seek(0)
-        return audio_bytes
+def join_speech_segments(segments, use_gemini=False):
+    """
+    One playable file from consecutive synthesize_speech results
+    """
+    if not use_gemini:
+        # MP3 frames can simply be concatenated
+        return b"".join(segments)
+    pcm = b""
+    for segment in segments:
+        with wave.open(io.BytesIO(segment), "rb") as wf:
+            pcm += wf.readframes(wf.getnframes())
+    return _pcm_to_wav(pcm)
+
+def generate_audio_response(text, use_gemini=None):
+    if use_gemini is None:
+        use_gemini = st.session_state.change_transcription_model
+    # Seek position is at the start so the returned object is ready to be read/played
+    return io.BytesIO(synthesize_speech(text, use_gemini))
 
 def embed_query(text, model="text-embedding-3-small"):
     """
     Create embedding for user query
     """
+    cached = get_cached_embeddings([text], model)[0]
+    if cached:
+        return cached
     try:
-        response = openai_client.embeddings.create(
+        response = rate_limited_call("openai", model, lambda: get_openai_client(openai_api_key).embeddings.create(
             input=text,
             model=model
-        )
-        return response.data[0].embedding
-    except OpenAIError as e:
+        ), tokens=estimate_tokens(text), description="Query embedding")
+        embedding = response.data[0].embedding
+        cache_embeddings([text], [embedding], model)
+        return embedding
+    except openai_error() as e:
         print(f"OpenAI error: {e}")
         return None
 
-def search_pinecone(query_embedding, top_k=5):
+def search_vectors(query_embedding, top_k=5, metadata_filter=None):
+    """
+    Search the vector store for similar chunks, restricted to metadata_filter when given.
+    A filter that matches nothing (only documents tagged for other equipment) returns no matches.
+    """
+    try:
+        matches = get_vector_store().query(query_embedding, top_k, metadata_filter=metadata_filter)
+        print("response ::::: Vector store", matches)
+        if metadata_filter and not matches:
+            print(f"No chunks tagged for {metadata_filter}")
+        return matches
+    except Exception as e:
+        print(f"Vector store query error: {e}")
+        return []
+
+def search_lexical(query, metadata_filter=None):
     """
-    Search Pinecone for similar chunks
+    BM25 search of the local chunk index, for exact terms such as error codes and model numbers
     """
     try:
-        response = index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
-        )
-        print("response ::::: Pinecone",response)
-        return response.matches
+        matches = get_lexical_index().search(query, metadata_filter=metadata_filter)
+        print("response ::::: Lexical", matches)
+        return matches
     except Exception as e:
-        print(f"Pinecone query error: {e}")
+        print(f"Lexical search error: {e}")
         return []
 
-def build_context_from_matches(matches):
+def build_context_from_matches(matches, max_tokens=None):
     """
-    Build context string from Pinecone matches
+    Build context string from retrieved matches: overlapping chunks of a page are merged and passages are
+    added in relevance order up to max_tokens (CONTEXT_MAX_TOKENS by default)
     """
     if not matches:
         return "No relevant information found."
-    
-    context_parts = []
-    
-    for i, match in enumerate(matches, 1):
-        text = match.metadata.get("text", "")
-        source = match.metadata.get("source", "Unknown")
-        page = match.metadata.get("page_number", "Unknown")
-        score = match.score
-        
-        if text:
-            context_parts.append(f"[Source: {source}, Page: {page}, Relevance: {score:.2f}]\n{text}\n")
-    return "\n---\n".join(context_parts)
+    return pack_context(matches, max_tokens)
 
-def rerank_matches(user_query, matches, top_k=5):
+def rerank_matches(user_query, matches, top_k=5, query_embedding=None):
     """
-    Rerank Pinecone matches using Cohere
+    Rerank retrieved matches with Cohere, or locally for simple queries and when Cohere is unavailable
     """
-    if not matches:
-        return []
-    
-    co = cohere.ClientV2(api_key=cohere_api_key)
-    
-    docs = [match.metadata.get("text", "") for match in matches]
-    
-    try:
-        rerank_response = co.rerank(
-            model="rerank-v3.5",
-            query=user_query,
-            documents=docs,
-            top_n=top_k
-        )
-        
-        reranked_indices = [item.index for item in rerank_response.results]
-        reranked_matches = [matches[i] for i in reranked_indices]
-        
-        return reranked_matches
-    except Exception as e:
-        print(f"Cohere rerank error: {e}")
-        return matches[:top_k]
+    return rerank(user_query, matches, top_k=top_k, query_embedding=query_embedding)
+
+def _stream_completion(messages, on_answer):
+    # Streams the JSON reply, passing the "answer" text decoded so far to on_answer as it arrives.
+    # The limiter slot is held until the stream is read to the end (or abandoned on an error).
+    stream = rate_limited_stream("openai", "gpt-4o", lambda: get_openai_client(openai_api_key).chat.completions.create(
+        model="gpt-4o",
+        messages=messages,
+        temperature=0.3,
+        response_format={"type": "json_object"},
+        stream=True
+    ), tokens=_chat_tokens(messages), description="Chat completion")
+    answer_stream = JsonStringFieldStream("answer")
+    with closing(stream):
+        for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            if answer_stream.feed(chunk.choices[0].delta.content):
+                on_answer(answer_stream.value)
+    return answer_stream.buffer
 
-def generate_response(chat_history, context, user_input, language, query_context=None):
+def generate_response(chat_history, context, user_input, language, query_context=None, on_answer=None):
     """
-    Generate response using GPT with retrieved context
+    Generate response using GPT with retrieved context.
+    With on_answer, the reply is streamed and on_answer receives the partial answer text as it grows.
     """
     system_prompt = f"""You are a helpful AI assistant that answers questions based on the provided document context.
 
@@ -243,20 +320,9 @@ Formatting rules for "answer":
 
 If you use multiple sources, pick the chunk from which more information is used to form the response. Extract the source, page number from the [Source: ..., Page: X, ...] markers in the context."""
 
-    # Filter chat history to only include 'role' and 'content' for OpenAI API
-    # Force 'content' to be a string to avoid JSON serialization errors
-    filtered_history = []
-    for msg in chat_history:
-        content = msg.get("content", "")
-        if isinstance(content, bytes):
-            content = content.decode('utf-8', errors='ignore')
-        filtered_history.append({
-            "role": msg["role"],
-            "content": str(content)
-        })
-    
+    # Only the newest turns that fit the token budget (plus a summary of older ones), as plain role/content messages
     messages = [{"role": "system", "content": system_prompt}]
-    messages += filtered_history
+    messages += build_prompt_history(chat_history)
     
     query_context_str = f"Query Context (Equipment Details): {query_context}\n\n" if query_context else ""
     print("Query Context received :::::", query_context_str)
@@ -264,21 +330,24 @@ If you use multiple sources, pick the chunk from which more information is used
     messages.append({"role": "user", "content": user_message_content})
     
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0.3,
-            response_format={"type": "json_object"}
-        )
-        result = response.choices[0].message.content.strip()
+        if on_answer is not None:
+            result = _stream_completion(messages, on_answer).strip()
+        else:
+            response = rate_limited_call("openai", "gpt-4o", lambda: get_openai_client(openai_api_key).chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                temperature=0.3,
+                response_format={"type": "json_object"}
+            ), tokens=_chat_tokens(messages), description="Chat completion")
+            result = response.choices[0].message.content.strip()
         parsed = json.loads(result)
         answer = parsed.get("answer", "")
         source = parsed.get("metadata", {})
         print("Open AI Source :::::", source)
         return answer, source
-    except OpenAIError as e:
+    except (openai_error(), json.JSONDecodeError) as e:
         print(f"OpenAI error: {e}")
-        return "Sorry, there was an error generating a response."
+        return GENERATION_ERROR, {"source": "", "page": ""}
 
 def check_query(user_input, lang):
     """
@@ -328,25 +397,60 @@ STRICT RULES:
     messages.append({"role": "user", "content": clean_input})
     
     try:
-        response = openai_client.chat.completions.create(
+        response = rate_limited_call("openai", "gpt-4o", lambda: get_openai_client(openai_api_key).chat.completions.create(
             model="gpt-4o",
             messages=messages,
             temperature=0.3,
             response_format={"type": "json_object"}
-        )
+        ), tokens=_chat_tokens(messages), description="Chat completion")
         result = response.choices[0].message.content.strip()
         parsed = json.loads(result)
         answer = parsed.get("response", "")
         is_greeting = parsed.get("is_greeting", False)
         
         return answer, is_greeting
-    except OpenAIError as e:
+    except (openai_error(), json.JSONDecodeError) as e:
+        # Not knowing whether it is small talk, answer it from the documents
         print(f"OpenAI error: {e}")
-        return "Sorry, there was an error generating a response."
+        return "", False
 
-def process_user_query(user_query, chat_history=None, rerank=False, category=None, type=None, brand=None, model_series=None, is_side = False):
+def retrieve_matches(query, rerank=False, cache_scope=None, metadata_filter=None):
     """
-    Main function to process user queries with RAG pipeline
+    Embed the query, then reuse the answer of a similar question cached in cache_scope or search the vector store
+    (restricted to metadata_filter, fused with lexical matches, optionally reranked). Returns (query_embedding, cached_answer, matches); query_embedding is None when
+    the query could not be embedded.
+    """
+    query_embedding = embed_query(query)
+    if query_embedding is None:
+        return None, None, None
+    
+    if cache_scope is not None:
+        cached_answer = lookup_answer(cache_scope, query, query_embedding)
+        if cached_answer is not None:
+            return query_embedding, cached_answer, None
+    
+    top_k = 5 if not rerank else 15
+    matches = search_vectors(query_embedding, top_k=top_k, metadata_filter=metadata_filter)
+    if LEXICAL_SEARCH:
+        # Exact-term hits are fused with the vector results by rank, so codes are found without reranking
+        matches = reciprocal_rank_fusion([matches, search_lexical(query, metadata_filter)], top_k)
+    
+    if matches and rerank:
+        matches = rerank_matches(query, matches, top_k=5, query_embedding=query_embedding)
+        print("Reranked matches ::::::", matches)
+    return query_embedding, None, matches
+
+def _audit_smalltalk(query, lang, local_decision):
+    # Runs in the background: compare a local decision with the LLM gate
+    _, is_greeting = check_query(query, lang)
+    record_audit(local_decision[1], is_greeting)
+    if bool(is_greeting) != bool(local_decision[1]):
+        print(f"Small-talk classifier disagreed with the LLM on: {query!r}")
+
+def process_user_query(user_query, chat_history=None, rerank=False, category=None, type=None, brand=None, model_series=None, is_side = False, on_answer=None):
+    """
+    Main function to process user queries with RAG pipeline.
+    on_answer, when given, receives the partial answer while it is generated (see generate_response).
     """
     if isinstance(user_query, dict):
         translation = user_query.get("translation", "")
@@ -363,36 +467,61 @@ def process_user_query(user_query, chat_history=None, rerank=False, category=Non
     if query.strip() == "":
         return ("Looks like there’s nothing to process — please enter a valid message", [])
 
-    # Checking whether query is a simple greeting or irrelevant 
-    response, is_greeting = check_query(query, lang)
+    # Answers are reused across sessions for the same equipment, unless the question leans on the conversation
+    cache_scope = None
+    if not (chat_history and HISTORY_REFERENCE.search(translation)):
+        cache_scope = answer_scope(category, type, brand, model_series, lang)
+        cached_answer = lookup_answer(cache_scope, translation)
+        if cached_answer is not None:
+            print("Answer cache hit ::::::")
+            return cached_answer
+
+    # Only chunks tagged for the selected equipment (or for any equipment) are searched
+    metadata_filter = equipment_filter(category, type, brand, model_series)
+
+    # Obvious small talk and questions are classified locally; the LLM gate only sees uncertain messages
+    local_decision = classify_smalltalk(query, lang, has_history=bool(chat_history))
+    record_decision(local_decision)
+    if local_decision is not None:
+        response, is_greeting = local_decision
+        retrieval_future = None if is_greeting else _query_executor.submit(retrieve_matches, translation, rerank, cache_scope, metadata_filter)
+        if should_audit():
+            _query_executor.submit(_audit_smalltalk, query, lang, local_decision)
+    else:
+        # The greeting check and retrieval run at the same time; retrieval is discarded for small talk
+        greeting_future = _query_executor.submit(check_query, query, lang)
+        retrieval_future = _query_executor.submit(retrieve_matches, translation, rerank, cache_scope, metadata_filter)
+        response, is_greeting = greeting_future.result()
     source = {"source": "", "page": ""}
 
     if not is_greeting:
         print("Processing RAG for query ::::::")
         
-        # Step 1: Embed the query
-        query_embedding = embed_query(translation)
+        # Step 1-2: Embed the query, then reuse a similar question's answer or search the vector store (optionally reranked)
+        query_embedding, cached_answer, matches = retrieval_future.result()
         if query_embedding is None:
             return ("Sorry, I couldn't process your query at the moment. Please try again.", [])
         
-        # Step 2: Search Pinecone for relevant chunks
-        matches = search_pinecone(query_embedding, top_k=5 if not rerank else 15)
+        if cached_answer is not None:
+            print("Answer cache hit ::::::")
+            return cached_answer
         
+        if not matches and metadata_filter:
+            # Answers from other equipment's manuals could be wrong for this unit, so the selection is not widened
+            selection = ", ".join(str(value) for value in (category, type, brand, model_series) if value is not None and str(value).strip())
+            return (f"I don't have any documents for the selected equipment ({selection}). Please upload its manual or change the equipment selection.", [])
         if not matches:
             return ("I don't have any information about that in my knowledge base. Please make sure you've uploaded relevant PDF documents.", [])
         
-        # Optional Step: Rerank matches using Cohere
-        if rerank:
-            matches = rerank_matches(translation, matches, top_k=5)
-            print("Reranked matches ::::::", matches)
-        
         # Step 3: Build context from matches
         context = build_context_from_matches(matches)
         
         # Step 4: Generate response
         # Pass filters as query context to the LLM
         query_context = f"Category: {category}, Type: {type}, Brand: {brand}, Model Series: {model_series}"
-        response, source = generate_response(chat_history, context, query, query_context=query_context, language = lang)
+        response, source = generate_response(chat_history, context, query, query_context=query_context, language = lang, on_answer=on_answer)
+        if cache_scope is not None and response != GENERATION_ERROR:
+            store_answer(cache_scope, translation, query_embedding, response, source)
 
     # Return both the generated response and the raw matches (so callers can show grounding)
     return (response, source)
\ No newline at end of file
@@ -0,0 +1,111 @@
+import os
+import time
+import threading
+
+# Pooled connections kept open by the shared HTTP client for plain downloads
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+
+_clients = {}
+_build_seconds = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+def _get(key, factory):
+    """
+    The client registered under key, built by factory on first use. Each key has its own lock, so a slow
+    client construction does not hold up lookups of other providers.
+    """
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        client = _clients.get(key)
+        if client is None:
+            start_time = time.perf_counter()
+            client = factory()
+            _build_seconds[key] = time.perf_counter() - start_time
+            _clients[key] = client
+            print(f"🔌 {key[0]} client ready in {_build_seconds[key] * 1000:.0f} ms")
+        return client
+
+def get_openai_client(api_key=None):
+    """
+    One OpenAI client per key; its HTTP connection pool is shared by every thread. Retries and backoff
+    are handled by rate_limited_call, so the SDK's own retries are off.
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+
+    def build():
+        from openai import OpenAI
+        return OpenAI(api_key=api_key, max_retries=0)
+    return _get(("openai", api_key), build)
+
+def get_gemini_client(api_key=None):
+    api_key = api_key or os.getenv("GEMINI_API_KEY")
+
+    def build():
+        from google import genai
+        return genai.Client(api_key=api_key)
+    return _get(("gemini", api_key), build)
+
+def get_generativeai(api_key=None):
+    """
+    The google.generativeai module used for whole-document extraction, configured once per process
+    """
+    api_key = api_key or os.getenv("GEMINI_API_KEY")
+
+    def build():
+        import google.generativeai as generativeai
+        generativeai.configure(api_key=api_key)
+        return generativeai
+    return _get(("generativeai", api_key), build)
+
+def get_cohere_client(api_key=None):
+    api_key = api_key or os.getenv("COHERE_API_KEY")
+
+    def build():
+        import cohere
+        return cohere.ClientV2(api_key=api_key)
+    return _get(("cohere", api_key), build)
+
+def get_pinecone_index(api_key=None, index_name=None):
+    """
+    The Pinecone index handle; the index host is resolved once instead of on every call
+    """
+    api_key = api_key or os.getenv("PINECONE_API_KEY")
+    index_name = index_name or os.getenv("PINECONE_INDEX_NAME")
+
+    def build():
+        from pinecone import Pinecone
+        return Pinecone(api_key=api_key).Index(index_name)
+    return _get(("pinecone", api_key, index_name), build)
+
+def get_http_client():
+    """
+    Shared keep-alive HTTP client for downloads such as source PDFs
+    """
+    def build():
+        import httpx
+        return httpx.Client(
+            timeout=HTTP_TIMEOUT_SECONDS,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+        )
+    return _get(("http",), build)
+
+def openai_error():
+    """
+    The OpenAI SDK's base exception class, imported on first use. Meant for except clauses, which are
+    only evaluated once an exception is raised: except (openai_error(), ValueError)
+    """
+    from openai import OpenAIError
+    return OpenAIError
+
+def client_stats():
+    """
+    Providers with a client in this process and how long each took to build
+    """
+    return [{"provider": key[0], "build_ms": round(seconds * 1000, 1)} for key, seconds in list(_build_seconds.items())]
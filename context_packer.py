@@ -0,0 +1,105 @@
+import os
+from text_utils import estimate_tokens
+
+# Tokens of document context sent with each question
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "2500"))
+# Shortest shared span treated as chunk overlap rather than a coincidence
+MIN_OVERLAP_CHARS = 20
+CONTEXT_SEPARATOR = "\n---\n"
+
+def _header(source, page, score):
+    return f"[Source: {source}, Page: {page}, Relevance: {score:.2f}]"
+
+def _render(part):
+    return f"{_header(part['source'], part['page'], part['score'])}\n{part['text']}\n"
+
+def _merge(first, second):
+    """
+    first and second joined without the span they share (first's end repeating second's start),
+    second's text if it already contains first, or None when they do not overlap
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    probe = second[:MIN_OVERLAP_CHARS]
+    position = first.find(probe, max(0, len(first) - len(second)))
+    while position != -1:
+        if second.startswith(first[position:]):
+            return first + second[len(first) - position:]
+        position = first.find(probe, position + 1)
+    return None
+
+def _merge_either_way(first, second):
+    merged = _merge(first, second)
+    return merged if merged is not None else _merge(second, first)
+
+def _truncate_to_tokens(text, max_tokens):
+    # Cut at a word boundary, shrinking proportionally until the text fits
+    while text and estimate_tokens(text) > max_tokens:
+        cut = max(1, int(len(text) * max_tokens / estimate_tokens(text) * 0.95))
+        text = text[:cut].rsplit(" ", 1)[0] if " " in text[:cut] else text[:cut]
+    return text
+
+def pack_context(matches, max_tokens=None):
+    """
+    Context string for the model from matches in relevance order. Chunks of the same source and page that
+    overlap (chunk_text repeats the end of one chunk at the start of the next) are merged into one passage,
+    and passages are added best first while they fit max_tokens.
+    """
+    max_tokens = max_tokens or CONTEXT_MAX_TOKENS
+    separator_tokens = estimate_tokens(CONTEXT_SEPARATOR)
+    parts, used, raw, packed = [], 0, 0, 0
+
+    for match in matches:
+        text = (match.metadata.get("text", "") or "").strip()
+        if not text:
+            continue
+        source = match.metadata.get("source", "Unknown")
+        page = match.metadata.get("page_number", "Unknown")
+        score = match.score or 0.0
+        raw += estimate_tokens(text)
+
+        candidate = {"source": source, "page": page, "score": score, "text": text}
+        # Fold the chunk, and any passages it bridges, into the passages of the same page it overlaps
+        merged_into = []
+        for part in parts:
+            if (part["source"], part["page"]) != (source, page):
+                continue
+            merged = _merge_either_way(part["text"], candidate["text"])
+            if merged is not None:
+                candidate["text"] = merged
+                candidate["score"] = max(candidate["score"], part["score"])
+                merged_into.append(part)
+
+        if merged_into:
+            # Merged passages keep the place of the most relevant one
+            cost = estimate_tokens(_render(candidate)) - sum(part["tokens"] for part in merged_into)
+            cost -= separator_tokens * (len(merged_into) - 1)
+        else:
+            cost = estimate_tokens(_render(candidate)) + (separator_tokens if parts else 0)
+        if used + cost > max_tokens:
+            if parts:
+                continue
+            # The best chunk is always sent, cut down to the budget
+            header_tokens = estimate_tokens(_header(source, page, score)) + 1
+            candidate["text"] = _truncate_to_tokens(text, max_tokens - header_tokens)
+            if not candidate["text"]:
+                continue
+            cost = estimate_tokens(_render(candidate))
+
+        candidate["tokens"] = estimate_tokens(_render(candidate))
+        if merged_into:
+            position = parts.index(merged_into[0])
+            parts = [part for part in parts if not any(part is merged for merged in merged_into)]
+            parts.insert(position, candidate)
+        else:
+            parts.append(candidate)
+        used += cost
+        packed += 1
+
+    if not parts:
+        return "No relevant information found."
+    context = CONTEXT_SEPARATOR.join(_render(part) for part in parts)
+    print(f"📦 Context: {estimate_tokens(context)} tokens in {len(parts)} passages from {packed} chunks ({raw} tokens of chunk text retrieved)")
+    return context
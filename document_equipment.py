@@ -0,0 +1,101 @@
+import os
+import json
+import threading
+from local_cache import CACHE_DIR
+
+# Which equipment each ingested document covers: {document: {"category": [...], "type": [...], ...}}
+DOCUMENT_EQUIPMENT_PATH = os.path.join(CACHE_DIR, "document_equipment.json")
+# Restrict searches to chunks tagged for the selected equipment
+EQUIPMENT_FILTER = os.getenv("EQUIPMENT_FILTER", "true").lower() == "true"
+
+EQUIPMENT_FIELDS = ("category", "type", "brand", "model_series")
+# Tag of a field a document does not narrow down, e.g. a manual that covers every series of a brand
+ANY_EQUIPMENT = "*"
+
+_lock = threading.Lock()
+
+def _load():
+    if not os.path.exists(DOCUMENT_EQUIPMENT_PATH):
+        return {}
+    try:
+        with open(DOCUMENT_EQUIPMENT_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"⚠️ Could not read document equipment mapping: {e}")
+        return {}
+
+def _save(mapping):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{DOCUMENT_EQUIPMENT_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(mapping, f, indent=2)
+    os.replace(tmp_path, DOCUMENT_EQUIPMENT_PATH)
+
+def _as_list(value):
+    if value is None:
+        return []
+    values = [value] if isinstance(value, str) else list(value)
+    return sorted({str(v).strip() for v in values if v is not None and str(v).strip()})
+
+def list_document_equipment():
+    with _lock:
+        return _load()
+
+def get_document_equipment(document):
+    """
+    The equipment a document covers (field -> list of values, empty for any), or None when it is not mapped
+    """
+    return list_document_equipment().get(document)
+
+def set_document_equipment(document, category=None, type=None, brand=None, model_series=None):
+    """
+    Record the equipment a document covers; each field takes one value or a list, None for any
+    """
+    equipment = {field: _as_list(value) for field, value in zip(EQUIPMENT_FIELDS, (category, type, brand, model_series))}
+    with _lock:
+        mapping = _load()
+        mapping[document] = equipment
+        _save(mapping)
+    return equipment
+
+def remove_document_equipment(document):
+    with _lock:
+        mapping = _load()
+        if mapping.pop(document, None) is not None:
+            _save(mapping)
+
+def covers_selection(equipment, selection):
+    """
+    Whether a document's equipment (None when unmapped) applies to a {field: value} selection
+    """
+    equipment = equipment or {}
+    return all(
+        not equipment.get(field) or ANY_EQUIPMENT in equipment[field] or str(selection.get(field)) in equipment[field]
+        for field in EQUIPMENT_FIELDS
+    )
+
+def equipment_metadata(equipment):
+    """
+    Chunk metadata tagging a document's equipment. Every field is always set so filters never have
+    to test for missing keys; unmapped fields are tagged as ANY_EQUIPMENT.
+    """
+    equipment = equipment or {}
+    return {field: equipment.get(field) or [ANY_EQUIPMENT] for field in EQUIPMENT_FIELDS}
+
+def equipment_filter(category=None, type=None, brand=None, model_series=None):
+    """
+    Pinecone metadata filter for chunks that apply to the selected equipment, or None when nothing is selected.
+    Chunks ingested before documents were tagged carry no equipment fields and match any selection.
+    """
+    if not EQUIPMENT_FILTER:
+        return None
+    selection = dict(zip(EQUIPMENT_FIELDS, (category, type, brand, model_series)))
+    conditions = {
+        field: {"$in": [str(value), ANY_EQUIPMENT]}
+        for field, value in selection.items()
+        if value is not None and str(value).strip()
+    }
+    if not conditions:
+        return None
+    # equipment_metadata always sets every field, so one missing field marks an untagged chunk
+    return {"$or": [conditions, {EQUIPMENT_FIELDS[0]: {"$exists": False}}]}
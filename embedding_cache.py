@@ -0,0 +1,51 @@
+import os
+import hashlib
+import threading
+from array import array
+from local_cache import LocalCache
+from text_utils import normalize_text
+
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_embedding_cache():
+    """
+    Process-wide embedding cache, opened on first use
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LocalCache("embeddings", EMBEDDING_CACHE_MAX_BYTES)
+        return _cache
+
+def embedding_key(model, text):
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+def get_cached_embeddings(texts, model):
+    """
+    Look up vectors for texts; returns a list aligned with texts with None for misses
+    """
+    keys = [embedding_key(model, text) for text in texts]
+    try:
+        found = get_embedding_cache().get_many(keys)
+    except Exception as e:
+        print(f"Embedding cache read error: {e}")
+        return [None] * len(texts)
+    return [array("f", found[key]).tolist() if key in found else None for key in keys]
+
+def cache_embeddings(texts, embeddings, model):
+    """
+    Store vectors as float32 blobs; None entries are skipped
+    """
+    items = {
+        embedding_key(model, text): array("f", embedding).tobytes()
+        for text, embedding in zip(texts, embeddings)
+        if embedding
+    }
+    try:
+        get_embedding_cache().put_many(items)
+    except Exception as e:
+        print(f"Embedding cache write error: {e}")
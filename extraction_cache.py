@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from local_cache import LocalCache
+
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_extraction_cache():
+    """
+    Process-wide extraction cache, opened on first use
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LocalCache("extractions", EXTRACTION_CACHE_MAX_BYTES)
+        return _cache
+
+def prompt_version(prompt):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+def extraction_key(page_hash, backend, model, version):
+    return f"{backend}:{model}:{version}:{page_hash}"
+
+def get_cached_pages(page_hashes, backend, model, version):
+    """
+    Look up extracted text for {page_number: page_hash}; returns {page_number: content} for hits
+    """
+    keys = {page_number: extraction_key(page_hash, backend, model, version) for page_number, page_hash in page_hashes.items()}
+    try:
+        found = get_extraction_cache().get_many(keys.values())
+    except Exception as e:
+        print(f"Extraction cache read error: {e}")
+        return {}
+    return {
+        page_number: json.loads(found[key])["content"]
+        for page_number, key in keys.items()
+        if key in found
+    }
+
+def cache_pages(contents, page_hashes, backend, model, version, document):
+    """
+    Store {page_number: content} together with enough metadata to list and invalidate entries
+    """
+    now = time.time()
+    items = {
+        extraction_key(page_hashes[page_number], backend, model, version): json.dumps({
+            "content": content,
+            "document": document,
+            "page_number": page_number,
+            "backend": backend,
+            "model": model,
+            "prompt_version": version,
+            "created_at": now,
+        }).encode("utf-8")
+        for page_number, content in contents.items()
+        if page_number in page_hashes
+    }
+    try:
+        get_extraction_cache().put_many(items)
+    except Exception as e:
+        print(f"Extraction cache write error: {e}")
+
+def list_entries(document=None, backend=None):
+    """
+    Metadata of cached pages (without the text), newest first
+    """
+    entries = []
+    for key, value in get_extraction_cache().items():
+        entry = json.loads(value)
+        if (document and entry["document"] != document) or (backend and entry["backend"] != backend):
+            continue
+        entry["key"] = key
+        entry["characters"] = len(entry.pop("content"))
+        entries.append(entry)
+    return entries
+
+def invalidate(document=None, backend=None):
+    """
+    Drop cached pages of a document and/or backend (everything when both are None); returns the count
+    """
+    if document is None and backend is None:
+        count = get_extraction_cache().stats()["entries"]
+        get_extraction_cache().clear()
+        return count
+    keys = [entry["key"] for entry in list_entries(document=document, backend=backend)]
+    get_extraction_cache().delete(keys)
+    return len(keys)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and manage the page extraction cache")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subcommands.add_parser("list", help="List cached pages")
+    list_parser.add_argument("--document")
+    list_parser.add_argument("--backend")
+
+    warm_parser = subcommands.add_parser("warm", help="Extract PDFs into the cache without uploading")
+    warm_parser.add_argument("pdfs", nargs="+")
+    warm_parser.add_argument("--backend", default="openai-vision", choices=["openai-vision", "gemini", "openai-file"])
+
+    invalidate_parser = subcommands.add_parser("invalidate", help="Remove cached pages")
+    invalidate_parser.add_argument("--document")
+    invalidate_parser.add_argument("--backend")
+    invalidate_parser.add_argument("--all", action="store_true", help="Remove every entry")
+
+    subcommands.add_parser("stats", help="Show cache size")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for entry in list_entries(document=args.document, backend=args.backend):
+            print(f"{entry['document']}\tpage {entry['page_number']}\t{entry['backend']}/{entry['model']}"
+                  f"\tprompt {entry['prompt_version']}\t{entry['characters']} chars")
+    elif args.command == "warm":
+        import dotenv
+        from pdf_processor import compute_page_hashes, extract_pages
+        dotenv.load_dotenv()
+        for pdf_path in args.pdfs:
+            page_hashes = compute_page_hashes(pdf_path)
+            pages = extract_pages(pdf_path, sorted(page_hashes), page_hashes, args.backend,
+                                  os.getenv("GEMINI_API_KEY"), os.getenv("OPENAI_API_KEY"))
+            print(f"{os.path.basename(pdf_path)}: {len(pages)}/{len(page_hashes)} pages cached")
+    elif args.command == "invalidate":
+        if not (args.all or args.document or args.backend):
+            parser.error("invalidate needs --document, --backend or --all")
+        print(f"Removed {invalidate(document=args.document, backend=args.backend)} entries")
+    elif args.command == "stats":
+        print(json.dumps(get_extraction_cache().stats(), indent=2))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import pandas as pd
+
+MODEL_SERIES_PATH = "Model_Series.xlsx"
+
+# Checklist items per category: (checkbox key, prompt sent by "Ask Agent")
+CHECKS = {
+    "HVAC": [
+        ("chk_temp_modes", "Check that the temperature is set correctly for Cooling, Heating, and Auto modes."),
+        ("chk_on_lamp", "Check if the ON lamp on the wired controller is flashing and record the error code."),
+        ("chk_wireless_lamp", "Check if the lamp near the wireless receiver on the indoor unit is flashing?."),
+        ("chk_mode", "Check that the correct operating mode (Cool / Heat / Dry / Fan / Auto / Vent) is selected."),
+        ("chk_remote_error", "Check if any error code is shown on the remote display."),
+        ("chk_timer", "Check that the timer settings are set correctly and only one timer type is in use."),
+        ("chk_filters", "Check that the air filters are clean, in good condition, and fitted properly."),
+        ("chk_alarm", "Check if any alarm or flashing light is present and record the details."),
+    ],
+    "CCTV System": [
+        ("chk_power", "Check that the camera power supply is stable at DC 12V and the unit powers ON correctly."),
+        ("chk_network", "Check if the network link LED is active and the camera IP is reachable on the network."),
+        ("chk_video", "Check if live video is displayed correctly in the web browser without freezing or delay."),
+        ("chk_video_settings", "Check that the correct video resolution, frame rate, and compression settings are applied."),
+        ("chk_lens", "Check the camera lens for dust or damage and confirm image focus and clarity."),
+        ("chk_motion", "Check if motion detection is enabled and verify correct detection response."),
+        ("chk_alarm_io", "Check alarm input and output connections and confirm correct NO/NC operation."),
+        ("chk_time", "Check system date and time settings and confirm synchronization is correct."),
+    ],
+}
+
+SUGGESTED_QUESTIONS = {
+    "HVAC": [
+        "What are the key safety procedures described in the documents?",
+        "Summarize maintenance schedule guidelines.",
+        "I need contact details.",
+        "Available temperature ranges?"
+    ],
+    "CCTV System": [
+        "Why is the camera not powering ON?",
+        "Why is the camera not accessible on the network?",
+        "Why is live video not displaying or freezing?",
+        "Why are motion detection or alarm events not triggering?"
+    ],
+}
+DEFAULT_SUGGESTED_QUESTIONS = [
+    "What are the key safety procedures described in the documents?",
+    "Summarize maintenance schedule guidelines.",
+    "What are the contact details for emergency?",
+    "Available temperature ranges?"
+]
+
+def get_checks(category):
+    # Every category other than HVAC shows the CCTV checklist
+    return CHECKS["HVAC"] if category == "HVAC" else CHECKS["CCTV System"]
+
+def get_suggested_questions(category):
+    return SUGGESTED_QUESTIONS.get(category, DEFAULT_SUGGESTED_QUESTIONS)
+
+def get_fixed_prompts(category):
+    """
+    Every prompt the UI can send for a category without the user typing it
+    """
+    return [label for _, label in get_checks(category)] + get_suggested_questions(category)
+
+def load_equipment(path=MODEL_SERIES_PATH):
+    """
+    Category / Type / Brand / Model / Series table with one row per model series
+    """
+    df = pd.read_excel(path)
+
+    df['Model / Series'] = df['Model / Series'].str.split('; ')
+    master_df = df.explode('Model / Series').reset_index(drop=True)
+    master_df['Model / Series'] = master_df['Model / Series'].str.strip()
+    return master_df
+
+def equipment_combinations(path=MODEL_SERIES_PATH):
+    """
+    Distinct (category, type, brand, model_series) selections offered on the Category Selection page
+    """
+    columns = ['Category', 'Type', 'Brand', 'Model / Series']
+    rows = load_equipment(path)[columns].drop_duplicates().itertuples(index=False)
+    return [
+        {"category": category, "type": type_, "brand": brand, "model_series": model_series}
+        for category, type_, brand, model_series in rows
+    ]
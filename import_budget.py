@@ -0,0 +1,76 @@
+import os
+import ast
+import sys
+import json
+import time
+import argparse
+import importlib
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+# Time a cold worker may spend importing the app's modules before it can render
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "2000"))
+# Provider SDKs and heavy libraries that must only be loaded when their feature is used
+LAZY_MODULES = ("openai", "google.genai", "google.generativeai", "pinecone", "cohere", "fitz", "tiktoken")
+
+def app_imports(path=APP_PATH):
+    """
+    Top-level modules imported by app.py, in order
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+def import_report(modules=None):
+    """
+    Import the modules one after another in this process and report what each added to the start-up time
+    and which lazy modules ended up loaded. Meaningful only in a fresh interpreter.
+    """
+    modules = modules or app_imports()
+    timings = []
+    start_time = time.perf_counter()
+    for module in modules:
+        module_start = time.perf_counter()
+        error = None
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        timings.append({"module": module, "ms": round((time.perf_counter() - module_start) * 1000, 1), "error": error})
+    total_ms = (time.perf_counter() - start_time) * 1000
+    return {
+        "total_ms": round(total_ms, 1),
+        "budget_ms": IMPORT_BUDGET_MS,
+        "within_budget": total_ms <= IMPORT_BUDGET_MS,
+        "modules": sorted(timings, key=lambda timing: timing["ms"], reverse=True),
+        "eager_modules": [module for module in LAZY_MODULES if module in sys.modules],
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report how long importing the app's modules takes")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = import_report()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for timing in report["modules"]:
+            error = f"  ⚠️ {timing['error']}" if timing["error"] else ""
+            print(f"{timing['ms']:8.1f} ms  {timing['module']}{error}")
+        status = "✅" if report["within_budget"] else "❌"
+        print(f"{status} {report['total_ms']:.0f} ms of {report['budget_ms']:.0f} ms budget")
+        if report["eager_modules"]:
+            print(f"❌ Loaded at import time: {', '.join(report['eager_modules'])}")
+    failed = [timing["module"] for timing in report["modules"] if timing["error"]]
+    if failed:
+        print(f"❌ Could not import: {', '.join(failed)}")
+    return 0 if report["within_budget"] and not report["eager_modules"] and not failed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
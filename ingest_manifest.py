@@ -0,0 +1,71 @@
+import os
+import json
+import hashlib
+from local_cache import CACHE_DIR
+
+# One JSON manifest per ingested document: page hashes and the vector ids each page produced
+MANIFEST_DIR = os.path.join(CACHE_DIR, "manifests")
+
+def _manifest_path(pdf_filename):
+    safe_name = hashlib.sha256(pdf_filename.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(MANIFEST_DIR, f"{safe_name}.json")
+
+def hash_page(data):
+    return hashlib.sha256(data).hexdigest()
+
+def new_manifest(pdf_filename, settings):
+    return {"document": pdf_filename, "settings": settings, "pages": {}}
+
+def load_manifest(pdf_filename):
+    """
+    Load the manifest of a previously ingested document, or None
+    """
+    path = _manifest_path(pdf_filename)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"⚠️ Could not read manifest for {pdf_filename}: {e}")
+        return None
+
+def save_manifest(pdf_filename, manifest):
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    path = _manifest_path(pdf_filename)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def list_manifests():
+    if not os.path.isdir(MANIFEST_DIR):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(MANIFEST_DIR)):
+        if name.endswith(".json"):
+            with open(os.path.join(MANIFEST_DIR, name), "r", encoding="utf-8") as f:
+                manifests.append(json.load(f))
+    return manifests
+
+def clear_manifests():
+    """
+    Forget every ingested document, e.g. after the index has been reset
+    """
+    if not os.path.isdir(MANIFEST_DIR):
+        return
+    for name in os.listdir(MANIFEST_DIR):
+        os.remove(os.path.join(MANIFEST_DIR, name))
+
+def diff_pages(manifest, page_hashes):
+    """
+    Compare current page hashes (page_number -> hash) with a manifest.
+    Returns (changed_pages, removed_pages) as sorted lists of page numbers.
+    """
+    known = manifest["pages"] if manifest else {}
+    changed = [
+        page_number for page_number, page_hash in sorted(page_hashes.items())
+        if known.get(str(page_number), {}).get("hash") != page_hash
+    ]
+    removed = sorted(int(page) for page in known if int(page) not in page_hashes)
+    return changed, removed
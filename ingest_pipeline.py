@@ -0,0 +1,150 @@
+import os
+import time
+import queue
+import threading
+import traceback
+
+# Items waiting between two stages; a full queue blocks the upstream stage (backpressure)
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+
+_DONE = object()
+
+class PipelineStage:
+    """
+    One step of a pipeline: fn runs on `workers` threads. With batch_size > 1, fn receives a list of up to
+    batch_size items that were waiting in the queue and returns the list of items to pass on.
+    Items are dicts; a stage marks a single failed item by setting item["error"].
+    """
+
+    def __init__(self, name, fn, workers=1, batch_size=1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def stats(self):
+        seconds = (self.finished_at or time.time()) - (self.started_at or time.time())
+        return {
+            "items": self.items,
+            "errors": self.errors,
+            "seconds": round(seconds, 2),
+            "items_per_second": round(self.items / seconds, 2) if seconds > 0 else 0.0,
+            "busy_seconds": round(self.busy_seconds, 2),
+            "workers": self.workers,
+        }
+
+def _take_batch(input_queue, first, batch_size):
+    # Collect whatever else is already waiting, up to batch_size; returns (batch, saw_done)
+    batch = [first]
+    while len(batch) < batch_size:
+        try:
+            item = input_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is _DONE:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+def run_pipeline(source, stages, queue_size=None):
+    """
+    Stream items from source through stages connected by bounded queues.
+    Returns (completed, failed, stats): items that left the last stage, items that failed
+    (with "error" and "failed_stage" set) and per-stage throughput.
+    """
+    queue_size = queue_size or PIPELINE_QUEUE_SIZE
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    completed, failed = [], []
+    results_lock = threading.Lock()
+    remaining_workers = [stage.workers for stage in stages]
+    remaining_lock = threading.Lock()
+
+    def fail(stage, item, error):
+        item["error"] = str(error)
+        item["failed_stage"] = stage.name
+        with results_lock:
+            failed.append(item)
+        with stage._lock:
+            stage.errors += 1
+
+    def forward(index, items):
+        for item in items:
+            if index + 1 < len(stages):
+                queues[index + 1].put(item)
+            else:
+                with results_lock:
+                    completed.append(item)
+
+    def worker(index):
+        stage = stages[index]
+        input_queue = queues[index]
+        try:
+            done = False
+            while not done:
+                item = input_queue.get()
+                if item is _DONE:
+                    break
+                batch, done = _take_batch(input_queue, item, stage.batch_size)
+                started = time.time()
+                with stage._lock:
+                    stage.started_at = stage.started_at or started
+                try:
+                    if stage.batch_size > 1:
+                        outputs = stage.fn(batch)
+                    else:
+                        outputs = [stage.fn(batch[0])]
+                except Exception as e:
+                    traceback.print_exc()
+                    for failed_item in batch:
+                        fail(stage, failed_item, e)
+                    outputs = []
+                passed = []
+                for output in outputs:
+                    if output is None:
+                        continue
+                    if output.get("error"):
+                        fail(stage, output, output["error"])
+                    else:
+                        passed.append(output)
+                with stage._lock:
+                    stage.items += len(passed)
+                    stage.busy_seconds += time.time() - started
+                    stage.finished_at = time.time()
+                forward(index, passed)
+        finally:
+            # The last worker of a stage tells every worker of the next stage to stop
+            with remaining_lock:
+                remaining_workers[index] -= 1
+                last = remaining_workers[index] == 0
+            if last and index + 1 < len(stages):
+                for _ in range(stages[index + 1].workers):
+                    queues[index + 1].put(_DONE)
+
+    threads = [
+        threading.Thread(target=worker, args=(index,), daemon=True, name=f"{stage.name}-{n}")
+        for index, stage in enumerate(stages)
+        for n in range(stage.workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for item in source:
+            queues[0].put(item)
+    finally:
+        for _ in range(stages[0].workers):
+            queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+
+    stats = {stage.name: stage.stats() for stage in stages}
+    for name, stage_stats in stats.items():
+        print(f"  {name:<8} {stage_stats['items']:>5} items  {stage_stats['errors']:>3} errors  "
+              f"{stage_stats['items_per_second']:>7.2f} items/s  ({stage_stats['workers']} workers)")
+    return completed, failed, stats
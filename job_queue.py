@@ -0,0 +1,274 @@
+import os
+import sys
+import time
+import shutil
+import socket
+import sqlite3
+import argparse
+import threading
+import subprocess
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from local_cache import CACHE_DIR
+
+JOB_DB_PATH = os.path.join(CACHE_DIR, "jobs.sqlite3")
+# Worker processes started by the app when none are alive
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+# Documents each worker ingests at the same time; they share its render pool and rate limiters
+INGEST_MAX_DOCUMENTS = int(os.getenv("INGEST_MAX_DOCUMENTS", "3"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# A worker or job without a heartbeat for this long is considered dead
+JOB_HEARTBEAT_TIMEOUT = float(os.getenv("JOB_HEARTBEAT_TIMEOUT", "60"))
+# A job whose worker died this many times (e.g. a PDF that crashes the renderer) is marked failed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Re-answer the fixed checklist/FAQ prompts for the equipment of newly ingested documents once the queue is empty.
+# Each refresh runs a full RAG answer per prompt and selection, so it is opt-in.
+PRECOMPUTE_AFTER_INGEST = os.getenv("PRECOMPUTE_AFTER_INGEST", "false").lower() == "true"
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+def _connect():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(JOB_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT NOT NULL, path TEXT NOT NULL, "
+        "use_gemini INTEGER NOT NULL, status TEXT NOT NULL, pages_done INTEGER NOT NULL DEFAULT 0, "
+        "pages_total INTEGER, error TEXT, worker TEXT, created_at REAL NOT NULL, started_at REAL, "
+        "finished_at REAL, heartbeat_at REAL, attempts INTEGER NOT NULL DEFAULT 0)"
+    )
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if "attempts" not in columns:
+        # Queues created before attempts were counted
+        conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, id)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, pid INTEGER NOT NULL, heartbeat_at REAL NOT NULL)"
+    )
+    return conn
+
+@contextmanager
+def _db():
+    # One short-lived connection per operation, committed on success and always closed
+    conn = _connect()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def enqueue_job(filename, path, use_gemini=False):
+    """
+    Queue a saved PDF for ingestion; returns the job id
+    """
+    with _db() as conn:
+        cursor = conn.execute(
+            "INSERT INTO jobs (filename, path, use_gemini, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+            (filename, path, int(use_gemini), time.time()),
+        )
+        return cursor.lastrowid
+
+def get_jobs(job_ids=None, limit=20):
+    """
+    Jobs by id, or the most recent ones, as dicts (newest first)
+    """
+    with _db() as conn:
+        if job_ids is not None:
+            if not job_ids:
+                return []
+            placeholders = ",".join("?" * len(job_ids))
+            rows = conn.execute(f"SELECT * FROM jobs WHERE id IN ({placeholders}) ORDER BY id DESC", list(job_ids))
+        else:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [dict(row) for row in rows]
+
+def _requeue_orphaned_jobs(conn):
+    # Jobs whose worker stopped sending heartbeats (crash, app restart) go back to the queue,
+    # unless they already used up their attempts
+    cutoff = time.time() - JOB_HEARTBEAT_TIMEOUT
+    exhausted = conn.execute(
+        "SELECT id, path, attempts FROM jobs WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+        (cutoff, JOB_MAX_ATTEMPTS),
+    ).fetchall()
+    for job in exhausted:
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', worker = NULL, finished_at = ?, error = ? WHERE id = ?",
+            (time.time(), f"Worker stopped during processing {job['attempts']} times", job["id"]),
+        )
+        print(f"❌ Job {job['id']} failed after {job['attempts']} attempts")
+        # run_job never got to remove the upload
+        shutil.rmtree(os.path.dirname(job["path"]), ignore_errors=True)
+    conn.execute(
+        "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat_at < ?",
+        (cutoff,),
+    )
+
+def claim_next_job(worker_id):
+    """
+    Atomically take the oldest queued job, or return None
+    """
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        _requeue_orphaned_jobs(conn)
+        row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            conn.commit()
+            return None
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ?, error = NULL, "
+            "attempts = attempts + 1 WHERE id = ?",
+            (worker_id, now, now, row["id"]),
+        )
+        conn.commit()
+        return dict(row)
+    finally:
+        conn.close()
+
+def update_progress(job_id, pages_done, pages_total):
+    with _db() as conn:
+        conn.execute(
+            "UPDATE jobs SET pages_done = ?, pages_total = ?, heartbeat_at = ? WHERE id = ?",
+            (pages_done, pages_total, time.time(), job_id),
+        )
+
+def finish_job(job_id, success, error=None):
+    with _db() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            ("succeeded" if success else "failed", error, time.time(), job_id),
+        )
+
+def _heartbeat(worker_id, running_jobs, stop_event):
+    # Keeps the worker (and its running jobs) from being considered dead during long pages
+    while not stop_event.wait(JOB_HEARTBEAT_TIMEOUT / 4):
+        now = time.time()
+        with _db() as conn:
+            conn.execute("UPDATE workers SET heartbeat_at = ? WHERE id = ?", (now, worker_id))
+            conn.executemany("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", [(now, job_id) for job_id in list(running_jobs)])
+
+def run_job(job):
+    """
+    Ingest one job's PDF, record the outcome and remove the uploaded file
+    """
+    import dotenv
+    from pdf_processor import process_pdf_and_upload
+    dotenv.load_dotenv()
+
+    print(f"▶️ Job {job['id']}: {job['filename']}")
+    try:
+        result = process_pdf_and_upload(
+            job["path"],
+            os.getenv("GEMINI_API_KEY"),
+            os.getenv("OPENAI_API_KEY"),
+            use_gemini=bool(job["use_gemini"]),
+            on_progress=lambda done, total: update_progress(job["id"], done, total),
+        )
+        finish_job(job["id"], result, None if result else "Processing failed")
+        return result
+    except Exception as e:
+        finish_job(job["id"], False, str(e))
+        return False
+    finally:
+        # Each job's upload lives in its own directory
+        shutil.rmtree(os.path.dirname(job["path"]), ignore_errors=True)
+
+def _refresh_precomputed_answers(documents):
+    try:
+        from precomputed_answers import precompute_answers
+        precompute_answers(documents=documents)
+    except Exception as e:
+        print(f"⚠️ Refreshing precomputed answers failed: {e}")
+
+def run_worker(max_documents=None):
+    """
+    Process queued jobs until the process is stopped, up to max_documents at a time
+    """
+    max_documents = max_documents or INGEST_MAX_DOCUMENTS
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    with _db() as conn:
+        conn.execute("INSERT OR REPLACE INTO workers (id, pid, heartbeat_at) VALUES (?, ?, ?)", (worker_id, os.getpid(), time.time()))
+    running_jobs = set()
+    stop_event = threading.Event()
+    threading.Thread(target=_heartbeat, args=(worker_id, running_jobs, stop_event), daemon=True).start()
+    print(f"👷 Ingestion worker {worker_id} started ({max_documents} documents at a time)")
+    # Documents ingested since the last refresh of precomputed answers
+    refresh_documents = set()
+    refresh_thread = None
+    try:
+        with ThreadPoolExecutor(max_workers=max_documents) as executor:
+            in_flight = {}
+            while True:
+                # Fill free slots with queued jobs, then wait for a slot or for new jobs
+                job = claim_next_job(worker_id) if len(in_flight) < max_documents else None
+                if job is not None:
+                    running_jobs.add(job["id"])
+                    in_flight[executor.submit(run_job, job)] = job
+                    continue
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=JOB_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished = in_flight.pop(future)
+                        running_jobs.discard(finished["id"])
+                        if future.result():
+                            # Documents are known by the saved file name, as in the equipment mapping
+                            refresh_documents.add(os.path.basename(finished["path"]))
+                else:
+                    if PRECOMPUTE_AFTER_INGEST and refresh_documents and not (refresh_thread and refresh_thread.is_alive()):
+                        documents, refresh_documents = sorted(refresh_documents), set()
+                        refresh_thread = threading.Thread(target=_refresh_precomputed_answers, args=(documents,), daemon=True)
+                        refresh_thread.start()
+                    time.sleep(JOB_POLL_SECONDS)
+    finally:
+        stop_event.set()
+        with _db() as conn:
+            conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+def live_worker_count():
+    with _db() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM workers WHERE heartbeat_at >= ?",
+            (time.time() - JOB_HEARTBEAT_TIMEOUT,),
+        ).fetchone()[0]
+
+def ensure_workers(count=None):
+    """
+    Start detached worker processes until `count` are alive. Workers outlive app reruns and restarts.
+    """
+    count = count or JOB_WORKERS
+    with _db() as conn:
+        conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (time.time() - JOB_HEARTBEAT_TIMEOUT,))
+    missing = count - live_worker_count()
+    for _ in range(max(0, missing)):
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "worker"],
+            cwd=os.getcwd(),
+            start_new_session=True,
+        )
+        # Register the worker right away so a second caller does not start another one before it boots
+        with _db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (id, pid, heartbeat_at) VALUES (?, ?, ?)",
+                (f"{socket.gethostname()}-{process.pid}", process.pid, time.time()),
+            )
+    return max(0, missing)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Background PDF ingestion queue")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subcommands.add_parser("worker", help="Run an ingestion worker")
+    worker_parser.add_argument("--documents", type=int, help="Documents to ingest at the same time")
+    subcommands.add_parser("list", help="Show recent jobs")
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        run_worker(args.documents)
+    elif args.command == "list":
+        for job in get_jobs():
+            print(f"{job['id']}\t{job['status']}\t{job['pages_done']}/{job['pages_total'] or '?'}\t{job['attempts']}\t{job['filename']}\t{job['error'] or ''}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import re
+import json
+
+class JsonStringFieldStream:
+    """
+    Pulls the value of one string field out of a JSON object while it is still being streamed.
+    feed() takes the next chunk of raw JSON and returns True when more of the value was decoded;
+    the decoded text so far is in .value and .complete turns True at the closing quote.
+    """
+
+    def __init__(self, field):
+        self._start = re.compile(r'(?<!\\)"' + re.escape(field) + r'"\s*:\s*"')
+        self.buffer = ""
+        self.value = ""
+        self.complete = False
+        self._position = None
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        if self.complete:
+            return False
+        if self._position is None:
+            match = self._start.search(self.buffer)
+            if match is None:
+                return False
+            self._position = match.end()
+
+        decoded = []
+        position = self._position
+        buffer = self.buffer
+        while position < len(buffer):
+            char = buffer[position]
+            if char == '"':
+                self.complete = True
+                position += 1
+                break
+            if char != "\\":
+                decoded.append(char)
+                position += 1
+                continue
+            # Escapes are decoded only once they have fully arrived
+            if position + 1 >= len(buffer):
+                break
+            if buffer[position + 1] == "u":
+                escape = buffer[position:position + 6]
+                if len(escape) < 6:
+                    break
+                # Surrogate pairs arrive as two \u escapes
+                if 0xD800 <= int(escape[2:], 16) <= 0xDBFF:
+                    pair = buffer[position:position + 12]
+                    if len(pair) < 12:
+                        break
+                    escape = pair
+                decoded.append(json.loads(f'"{escape}"'))
+                position += len(escape)
+            else:
+                decoded.append(json.loads(f'"{buffer[position:position + 2]}"'))
+                position += 2
+        self._position = position
+        if decoded:
+            self.value += "".join(decoded)
+            return True
+        return self.complete
+
+def trim_partial_html(text):
+    """
+    Drop a tag that is still being streamed ("<b" or "</li") so partial HTML renders cleanly
+    """
+    return re.sub(r"<[^>]*$", "", text)
@@ -0,0 +1,288 @@
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter
+from local_cache import CACHE_DIR
+from vector_store import Match, matches_filter
+
+# Search chunk text for exact terms (error codes, model and part numbers) next to the vector search
+LEXICAL_SEARCH = os.getenv("LEXICAL_SEARCH", "true").lower() == "true"
+LEXICAL_TOP_K = int(os.getenv("LEXICAL_TOP_K", "5"))
+# Rank constant of reciprocal-rank fusion; larger values flatten the advantage of the top ranks
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Chunks scoring below this share of the best score only matched terms found everywhere and are dropped
+MIN_RELATIVE_SCORE = 0.25
+
+# Codes such as "E6", "RP71" or "KD79D904H01" are kept whole; "om_pead-rp71-140jaa" also yields its parts,
+# and a code also yields its pieces ending in digits ("rp71jaa" -> "rp71", "jaa"; "kd79d904h01" -> "kd79", "d904", "h01")
+_TERM = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_CODE_PIECE = re.compile(r"[a-z]*[0-9]+|[a-z]+")
+# Bump when tokenize changes; stored chunks are re-tokenized when an index is opened
+TOKENIZER_VERSION = 2
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its of on or that the this to was what when "
+    "where which who why will with do does can my me you your".split()
+)
+
+def tokenize(text):
+    terms = []
+    for term in _TERM.findall(text.lower()):
+        parts = re.split(r"[-_./]", term)
+        if len(parts) > 1:
+            terms.append(term)
+        for part in parts:
+            if not part or part in _STOPWORDS:
+                continue
+            terms.append(part)
+            pieces = _CODE_PIECE.findall(part)
+            if len(pieces) > 1:
+                terms.extend(piece for piece in pieces if len(piece) > 1)
+    return terms
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk text. Chunks are stored in SQLite so the ingestion worker and the app
+    share them; each process searches an in-memory copy that applies the rows other processes changed.
+    """
+
+    def __init__(self, path=None):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.path = path or os.path.join(CACHE_DIR, "lexical.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id TEXT PRIMARY KEY, document TEXT NOT NULL, metadata TEXT NOT NULL, terms TEXT NOT NULL, length INTEGER NOT NULL, "
+            "generation INTEGER NOT NULL DEFAULT 0)"
+        )
+        if "generation" not in {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}:
+            # Indexes created before changes were applied incrementally
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN generation INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_document ON chunks(document)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_generation ON chunks(generation)")
+        # Deleted chunk ids, so other processes can drop them from their copy
+        self._conn.execute("CREATE TABLE IF NOT EXISTS deleted (id TEXT PRIMARY KEY, generation INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+        if self._meta("tokenizer") != TOKENIZER_VERSION:
+            self._retokenize()
+        self._generation = None
+        self._postings = {}
+        self._lengths = {}
+        self._metadata = {}
+        self._chunk_terms = {}
+        self._total_length = 0
+
+    def _meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump_generation(self):
+        # Caller holds the lock; returns the generation of the changes being written
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('generation', 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        )
+        return self._meta("generation")
+
+    def _retokenize(self):
+        # Chunks indexed by an older tokenize get their terms recomputed from the stored text
+        self._conn.execute("BEGIN IMMEDIATE")
+        if self._meta("tokenizer") == TOKENIZER_VERSION:
+            # Another process got here first
+            self._conn.commit()
+            return
+        generation = self._bump_generation()
+        rows = []
+        for chunk_id, chunk_metadata in self._conn.execute("SELECT id, metadata FROM chunks").fetchall():
+            terms = Counter(tokenize(json.loads(chunk_metadata).get("text", "")))
+            rows.append((json.dumps(terms), sum(terms.values()), generation, chunk_id))
+        self._conn.executemany("UPDATE chunks SET terms = ?, length = ?, generation = ? WHERE id = ?", rows)
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('tokenizer', ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (TOKENIZER_VERSION,),
+        )
+        self._conn.commit()
+        if rows:
+            print(f"🔤 Re-tokenized {len(rows)} lexical index chunks")
+
+    def add(self, chunks):
+        """
+        Index (or re-index) chunks given as {"id", "text", "metadata"}; metadata must contain "source"
+        """
+        rows = []
+        for chunk in chunks:
+            terms = Counter(tokenize(chunk["text"]))
+            metadata = {**chunk["metadata"], "text": chunk["text"]}
+            rows.append((chunk["id"], metadata["source"], json.dumps(metadata), json.dumps(terms), sum(terms.values())))
+        if not rows:
+            return
+        with self._lock:
+            generation = self._bump_generation()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, document, metadata, terms, length, generation) VALUES (?, ?, ?, ?, ?, ?)",
+                [row + (generation,) for row in rows],
+            )
+            self._conn.executemany("DELETE FROM deleted WHERE id = ?", [(row[0],) for row in rows])
+            self._conn.commit()
+
+    def delete(self, chunk_ids):
+        if not chunk_ids:
+            return
+        with self._lock:
+            generation = self._bump_generation()
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO deleted (id, generation) VALUES (?, ?)", [(chunk_id, generation) for chunk_id in chunk_ids]
+            )
+            self._conn.commit()
+
+    def update_metadata(self, chunk_ids, metadata):
+        """
+        Merge metadata (e.g. new equipment tags) into already indexed chunks
+        """
+        with self._lock:
+            generation = self._bump_generation()
+            for chunk_id in chunk_ids:
+                row = self._conn.execute("SELECT metadata FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
+                if row is not None:
+                    merged = {**json.loads(row[0]), **metadata}
+                    self._conn.execute(
+                        "UPDATE chunks SET metadata = ?, generation = ? WHERE id = ?", (json.dumps(merged), generation, chunk_id)
+                    )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            generation = self._bump_generation()
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM deleted")
+            # Copies older than this reload from scratch
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('cleared', ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (generation,),
+            )
+            self._conn.commit()
+
+    def _forget(self, chunk_id):
+        # Caller holds the lock; drop a chunk from the in-memory copy
+        terms = self._chunk_terms.pop(chunk_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            term_postings = self._postings.get(term)
+            if term_postings is not None:
+                term_postings.pop(chunk_id, None)
+                if not term_postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(chunk_id)
+        del self._metadata[chunk_id]
+
+    def _refresh(self):
+        # Caller holds the lock; apply the chunks other processes changed since this copy was last updated.
+        # The generation is read first, so a change committed in between is applied again next time (harmlessly).
+        generation = self._meta("generation")
+        if generation == self._generation:
+            return
+        since = self._generation
+        if since is None or self._meta("cleared") > since:
+            self._postings, self._lengths, self._metadata, self._chunk_terms = {}, {}, {}, {}
+            self._total_length = 0
+            since = -1
+        for (chunk_id,) in self._conn.execute("SELECT id FROM deleted WHERE generation > ?", (since,)):
+            self._forget(chunk_id)
+        rows = self._conn.execute("SELECT id, metadata, terms, length FROM chunks WHERE generation > ?", (since,))
+        for chunk_id, chunk_metadata, terms, length in rows:
+            self._forget(chunk_id)
+            terms = json.loads(terms)
+            for term, count in terms.items():
+                self._postings.setdefault(term, {})[chunk_id] = count
+            self._chunk_terms[chunk_id] = list(terms)
+            self._lengths[chunk_id] = length
+            self._total_length += length
+            self._metadata[chunk_id] = json.loads(chunk_metadata)
+        self._generation = generation
+
+    def search(self, query, top_k=None, metadata_filter=None):
+        """
+        The top_k chunks by BM25 score for the query terms, restricted to metadata_filter, as Match objects
+        """
+        top_k = top_k or LEXICAL_TOP_K
+        query_terms = set(tokenize(query))
+        # The copy is updated in place, so scoring stays under the lock; only the query's postings are read
+        with self._lock:
+            self._refresh()
+            lengths, metadata = self._lengths, self._metadata
+            if not lengths:
+                return []
+            total = len(lengths)
+            average_length = self._total_length / total
+            scores = {}
+            # Filtered out before ranking, so the relevance cutoff is relative to the best allowed chunk
+            allowed = {}
+            for term in query_terms:
+                term_postings = self._postings.get(term)
+                if not term_postings:
+                    continue
+                idf = math.log(1 + (total - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+                for chunk_id, count in term_postings.items():
+                    if metadata_filter:
+                        if chunk_id not in allowed:
+                            allowed[chunk_id] = matches_filter(metadata[chunk_id], metadata_filter)
+                        if not allowed[chunk_id]:
+                            continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[chunk_id] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * count * (BM25_K1 + 1) / (count + norm)
+            metadata = {chunk_id: metadata[chunk_id] for chunk_id in scores}
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        results = []
+        for chunk_id, score in ranked:
+            if score < ranked[0][1] * MIN_RELATIVE_SCORE:
+                break
+            results.append(Match(chunk_id, score, metadata[chunk_id]))
+            if len(results) >= top_k:
+                break
+        return results
+
+    def stats(self):
+        with self._lock:
+            chunks, documents = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT document) FROM chunks").fetchone()
+        return {"chunks": chunks, "documents": documents, "terms": len(self._postings)}
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_lexical_index():
+    """
+    Process-wide lexical index, opened on first use
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LexicalIndex()
+        return _index
+
+def reciprocal_rank_fusion(result_lists, top_k, k=None):
+    """
+    Merge ranked match lists by summing 1 / (k + rank) per chunk id. Scores are scaled so a chunk ranked
+    first in every list scores 1.0; the metadata of its first occurrence is kept.
+    """
+    k = k or RRF_K
+    result_lists = [results for results in result_lists if results]
+    if not result_lists:
+        return []
+    scores, matches = {}, {}
+    for results in result_lists:
+        for rank, match in enumerate(results, 1):
+            scores[match.id] = scores.get(match.id, 0.0) + 1 / (k + rank)
+            matches.setdefault(match.id, match)
+    best = len(result_lists) / (k + 1)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [Match(chunk_id, scores[chunk_id] / best, dict(matches[chunk_id].metadata)) for chunk_id in ranked]
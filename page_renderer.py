@@ -0,0 +1,92 @@
+import os
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import fitz
+from ingest_manifest import hash_page
+
+# Resolution of page images sent to the vision model (72 is PyMuPDF's default)
+RENDER_DPI = int(os.getenv("RENDER_DPI", "72"))
+# Processes for CPU-bound rendering and page hashing, shared by all documents; 0 renders in-process
+RENDER_PROCESSES = int(os.getenv("RENDER_PROCESSES", str(os.cpu_count() or 1)))
+
+# Documents kept open per process, so rendering page after page does not reopen the file
+_documents = OrderedDict()
+_documents_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+def render_page_png(pdf_document, page_number, dpi=None):
+    page = pdf_document.load_page(page_number - 1)
+    return page.get_pixmap(dpi=dpi or RENDER_DPI).tobytes("png")
+
+def iter_page_images(pdf_path, page_numbers=None, dpi=None):
+    """
+    Render pages one at a time, yielding (page_number, png_bytes) straight from the pixmap buffer.
+    page_numbers (1-based) limits rendering to those pages.
+    """
+    with fitz.open(pdf_path) as pdf_document:
+        if page_numbers is None:
+            page_numbers = range(1, len(pdf_document) + 1)
+        for page_number in page_numbers:
+            yield page_number, render_page_png(pdf_document, page_number, dpi)
+
+def _render_page(pdf_path, page_number, dpi):
+    # Runs in a pool process (or in-process); fitz documents are not thread-safe, hence the lock
+    with _documents_lock:
+        key = (pdf_path, os.path.getmtime(pdf_path))
+        pdf_document = _documents.pop(key, None) or fitz.open(pdf_path)
+        _documents[key] = pdf_document
+        while len(_documents) > 4:
+            _documents.popitem(last=False)[1].close()
+        return render_page_png(pdf_document, page_number, dpi)
+
+def _hash_pages(pdf_path, page_numbers):
+    with fitz.open(pdf_path) as pdf_document:
+        return {
+            page_number: hash_page(pdf_document.load_page(page_number - 1).get_pixmap().samples)
+            for page_number in page_numbers
+        }
+
+def get_render_pool():
+    """
+    Process pool shared by every document in this process, or None when RENDER_PROCESSES is 0
+    """
+    global _pool
+    if RENDER_PROCESSES <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the parent runs many threads and forking those is unsafe
+            _pool = ProcessPoolExecutor(max_workers=RENDER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def render_page(pdf_path, page_number, dpi=None):
+    """
+    Render one page to PNG bytes in the shared render pool
+    """
+    pool = get_render_pool()
+    if pool is None:
+        return _render_page(pdf_path, page_number, dpi or RENDER_DPI)
+    return pool.submit(_render_page, pdf_path, page_number, dpi or RENDER_DPI).result()
+
+def compute_page_hashes(pdf_path):
+    """
+    Hash the rendered pixels of every page: {page_number (1-based): sha256}.
+    Large documents are split across the render pool.
+    """
+    with fitz.open(pdf_path) as pdf_document:
+        page_numbers = list(range(1, len(pdf_document) + 1))
+    pool = get_render_pool()
+    if pool is None or len(page_numbers) < 8:
+        return _hash_pages(pdf_path, page_numbers)
+    slice_size = max(4, len(page_numbers) // (RENDER_PROCESSES * 2) + 1)
+    futures = [
+        pool.submit(_hash_pages, pdf_path, page_numbers[start:start + slice_size])
+        for start in range(0, len(page_numbers), slice_size)
+    ]
+    page_hashes = {}
+    for future in futures:
+        page_hashes.update(future.result())
+    return page_hashes
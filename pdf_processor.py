@@ -1,63 +1,44 @@
 import os
 import json
 import time
-from openai import OpenAI, OpenAIError
-from pinecone import Pinecone
-import google.generativeai as genai
-import httpx
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import base64
-from PIL import Image
-import fitz
-import io
+from text_utils import estimate_tokens
+from embedding_cache import get_cached_embeddings, cache_embeddings
+from ingest_manifest import load_manifest, save_manifest, new_manifest, diff_pages
+from extraction_cache import get_cached_pages, cache_pages, prompt_version
+from ingest_pipeline import PipelineStage, run_pipeline
+from page_renderer import RENDER_DPI, iter_page_images, render_page, compute_page_hashes
+from rate_limiter import rate_limited_call
+from answer_cache import bump_index_version
+from document_equipment import get_document_equipment, equipment_metadata
+from lexical_index import get_lexical_index
+from vector_store import get_vector_store
+from clients import get_openai_client, get_generativeai, get_http_client, openai_error
 
-def extract_text_from_pdf(pdf_path, gemini_api_key):
-    """
-    Extract text from PDF using Google Gemini API with comprehensive formatting
-    """
-    try:
-        genai.configure(api_key=gemini_api_key)
-        
-        # Upload the PDF file to Gemini
-        print(f"Uploading PDF: {os.path.basename(pdf_path)}")
-        uploaded_file = genai.upload_file(pdf_path)
-        
-        # Wait for file to be processed
-        print("⏳ Waiting for file to be processed...")
-        while uploaded_file.state.name == "PROCESSING":
-            time.sleep(2)
-            uploaded_file = genai.get_file(uploaded_file.name)
-        
-        if uploaded_file.state.name == "FAILED":
-            raise ValueError(f"File processing failed: {uploaded_file.state.name}")
-        
-        generation_config = {
-            "response_mime_type": "application/json",
-            "response_schema": {
-                "type": "object",
-                "properties": {
-                    "pages": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "page_number": {"type": "integer"},
-                                "content": {"type": "string"}
-                            },
-                            "required": ["page_number", "content"]
-                        }
-                    }
-                },
-                "required": ["pages"]
-            }
-        }
-        
-        # Use Gemini to extract text with comprehensive formatting
-        model = genai.GenerativeModel(
-            model_name='gemini-2.5-pro',
-            generation_config=generation_config
-            )
-        
-        prompt = """Extract ALL text from this document with clear formatting and logical structure.
+# Number of pages sent to the vision model at the same time
+EXTRACTION_MAX_WORKERS = int(os.getenv("EXTRACTION_MAX_WORKERS", "8"))
+# Retries per page on rate limits (429), server errors (5xx) and connection failures
+EXTRACTION_MAX_RETRIES = int(os.getenv("EXTRACTION_MAX_RETRIES", "5"))
+# Embedding batches are bounded by input count and by estimated tokens per request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "4"))
+EMBEDDING_MODEL = "text-embedding-3-small"
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "400"))
+# Re-process only pages whose content changed since the document was last ingested
+INCREMENTAL_INGESTION = os.getenv("INCREMENTAL_INGESTION", "true").lower() == "true"
+# Worker threads and batch sizes of the streaming ingestion stages
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "1"))
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", "1"))
+EMBED_BATCH_PAGES = int(os.getenv("EMBED_BATCH_PAGES", "16"))
+UPSERT_BATCH_PAGES = int(os.getenv("UPSERT_BATCH_PAGES", "8"))
+
+GEMINI_EXTRACTION_MODEL = "gemini-2.5-pro"
+GEMINI_EXTRACTION_PROMPT = """Extract ALL text from this document with clear formatting and logical structure.
 
 📋 FORMATTING GUIDELINES:
 
@@ -172,80 +153,9 @@ IMPORTANT:
 - DO preserve the semantic meaning and organization
 
 Begin extraction now."""
-        
-        print("🔍 Extracting content from PDF...")
-        response = model.generate_content([uploaded_file, prompt])
-        
-        # Clean up the uploaded file
-        try:
-            genai.delete_file(uploaded_file.name)
-            print("✅ Temporary file deleted from Gemini servers")
-        except:
-            print("⚠️ Could not delete temporary file (not critical)")
-        
-        return response.text
-        
-    except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
-        return None
-
-@staticmethod
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
-    
-def pdf_to_base64_images(pdf_path):
-    #Handles PDFs with multiple pages
-    pdf_document = fitz.open(pdf_path)
-    base64_images = []
-    temp_image_paths = []
-
-    total_pages = len(pdf_document)
-
-    for page_num in range(total_pages):
-        page = pdf_document.load_page(page_num)
-        pix = page.get_pixmap()
-        img = Image.open(io.BytesIO(pix.tobytes()))
-        temp_image_path = f"temp_page_{page_num}.png"
-        img.save(temp_image_path, format="PNG")
-        temp_image_paths.append(temp_image_path)
-        base64_image = encode_image(temp_image_path)
-        base64_images.append(base64_image)
-
-    for temp_image_path in temp_image_paths:
-        os.remove(temp_image_path)
-    return base64_images
 
-def extract_text_from_pdf_openai(pdf_path, openai_api_key):
-    """
-    Extract text from PDF using OpenAI API with comprehensive formatting
-    """
-    try:
-        client = OpenAI(api_key=openai_api_key)
-        
-        print(f"Uploading PDF: {os.path.basename(pdf_path)}")
-        
-        with open(pdf_path, "rb") as f:
-            data = f.read()
-        
-        base64_string = base64.b64encode(data).decode("utf-8")
-        
-        print("🔍 Extracting content from PDF...")
-        
-        response = client.responses.create(
-            model="gpt-5",
-            input=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_file",
-                            "filename": os.path.basename(pdf_path),
-                            "file_data": f"data:application/pdf;base64,{base64_string}",
-                        },
-                        {
-                            "type": "input_text",
-                            "text": """Extract ALL text from this document with clear formatting and logical structure.
+OPENAI_FILE_EXTRACTION_MODEL = "gpt-5"
+OPENAI_FILE_EXTRACTION_PROMPT = """Extract ALL text from this document with clear formatting and logical structure.
  
 📋 FORMATTING GUIDELINES:
  
@@ -359,52 +269,10 @@ IMPORTANT:
 - DO describe visual elements that contain information
 - DO preserve the semantic meaning and organization
  
-Begin extraction now.""",
-                        },
-                    ],
-                },
-            ],
-            text={
-                "format": {
-                    "type": "json_schema",
-                    "name": "pdf_extraction",
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "pages": {
-                                "type": "array",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "page_number": {"type": "integer"},
-                                        "content": {"type": "string"}
-                                    },
-                                    "required": ["page_number", "content"],
-                                    "additionalProperties": False
-                                }
-                            }
-                        },
-                        "required": ["pages"],
-                        "additionalProperties": False
-                    },
-                    "strict": True
-                }
-            }
-        )
-        
-        print("✅ PDF content extracted successfully")
-        return response.output_text
-        
-    except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
-        return None
-
-def extract_page_data(base64_image, openai_api_key):
-    print("Extracting next page...")
-    try:
-        client = OpenAI(api_key=openai_api_key)
+Begin extraction now."""
 
-        system_prompt = """
+VISION_EXTRACTION_MODEL = "gpt-4o"
+PAGE_EXTRACTION_PROMPT = """
     📋 FORMATTING GUIDELINES:
     
     1. PAGE MARKERS:
@@ -522,9 +390,167 @@ def extract_page_data(base64_image, openai_api_key):
     
     Begin extraction now.
         """
+
+EXTRACTION_BACKENDS = {
+    "openai-vision": (VISION_EXTRACTION_MODEL, PAGE_EXTRACTION_PROMPT),
+    "gemini": (GEMINI_EXTRACTION_MODEL, GEMINI_EXTRACTION_PROMPT),
+    "openai-file": (OPENAI_FILE_EXTRACTION_MODEL, OPENAI_FILE_EXTRACTION_PROMPT),
+}
+
+def extract_text_from_pdf(pdf_path, gemini_api_key):
+    """
+    Extract text from PDF using Google Gemini API with comprehensive formatting
+    """
+    try:
+        genai = get_generativeai(gemini_api_key)
+        
+        # Upload the PDF file to Gemini
+        print(f"Uploading PDF: {os.path.basename(pdf_path)}")
+        uploaded_file = rate_limited_call("gemini", "files", lambda: genai.upload_file(pdf_path), description="PDF upload")
+        
+        # Wait for file to be processed
+        print("⏳ Waiting for file to be processed...")
+        while uploaded_file.state.name == "PROCESSING":
+            time.sleep(2)
+            uploaded_file = rate_limited_call("gemini", "files", lambda name=uploaded_file.name: genai.get_file(name),
+                                              description="PDF upload status")
+        
+        if uploaded_file.state.name == "FAILED":
+            raise ValueError(f"File processing failed: {uploaded_file.state.name}")
         
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        generation_config = {
+            "response_mime_type": "application/json",
+            "response_schema": {
+                "type": "object",
+                "properties": {
+                    "pages": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "page_number": {"type": "integer"},
+                                "content": {"type": "string"}
+                            },
+                            "required": ["page_number", "content"]
+                        }
+                    }
+                },
+                "required": ["pages"]
+            }
+        }
+        
+        # Use Gemini to extract text with comprehensive formatting
+        model = genai.GenerativeModel(
+            model_name=GEMINI_EXTRACTION_MODEL,
+            generation_config=generation_config
+            )
+        
+        prompt = GEMINI_EXTRACTION_PROMPT
+        
+        print("🔍 Extracting content from PDF...")
+        response = rate_limited_call(
+            "gemini",
+            GEMINI_EXTRACTION_MODEL,
+            lambda: model.generate_content([uploaded_file, prompt]),
+            tokens=estimate_tokens(prompt),
+            max_retries=EXTRACTION_MAX_RETRIES,
+            description="Gemini extraction",
+        )
+        
+        # Clean up the uploaded file
+        try:
+            rate_limited_call("gemini", "files", lambda: genai.delete_file(uploaded_file.name), description="PDF delete")
+            print("✅ Temporary file deleted from Gemini servers")
+        except:
+            print("⚠️ Could not delete temporary file (not critical)")
+        
+        return response.text
+        
+    except Exception as e:
+        print(f"Error extracting text from PDF: {e}")
+        return None
+
+def extract_text_from_pdf_openai(pdf_path, openai_api_key):
+    """
+    Extract text from PDF using OpenAI API with comprehensive formatting
+    """
+    try:
+        client = get_openai_client(openai_api_key)
+        
+        print(f"Uploading PDF: {os.path.basename(pdf_path)}")
+        
+        with open(pdf_path, "rb") as f:
+            data = f.read()
+        
+        base64_string = base64.b64encode(data).decode("utf-8")
+        
+        print("🔍 Extracting content from PDF...")
+        
+        response = rate_limited_call("openai", OPENAI_FILE_EXTRACTION_MODEL, lambda: client.responses.create(
+            model=OPENAI_FILE_EXTRACTION_MODEL,
+            input=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "input_file",
+                            "filename": os.path.basename(pdf_path),
+                            "file_data": f"data:application/pdf;base64,{base64_string}",
+                        },
+                        {
+                            "type": "input_text",
+                            "text": OPENAI_FILE_EXTRACTION_PROMPT,
+                        },
+                    ],
+                },
+            ],
+            text={
+                "format": {
+                    "type": "json_schema",
+                    "name": "pdf_extraction",
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "pages": {
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {
+                                        "page_number": {"type": "integer"},
+                                        "content": {"type": "string"}
+                                    },
+                                    "required": ["page_number", "content"],
+                                    "additionalProperties": False
+                                }
+                            }
+                        },
+                        "required": ["pages"],
+                        "additionalProperties": False
+                    },
+                    "strict": True
+                }
+            }
+        ), tokens=estimate_tokens(OPENAI_FILE_EXTRACTION_PROMPT), max_retries=EXTRACTION_MAX_RETRIES,
+           description="OpenAI file extraction")
+        
+        print("✅ PDF content extracted successfully")
+        return response.output_text
+        
+    except Exception as e:
+        print(f"Error extracting text from PDF: {e}")
+        return None
+
+def extract_page_data(base64_image, openai_api_key, client=None, page_number=None):
+    page_label = f"page {page_number}" if page_number else "next page"
+    print(f"Extracting {page_label}...")
+    try:
+        if client is None:
+            client = get_openai_client(openai_api_key)
+
+        system_prompt = PAGE_EXTRACTION_PROMPT
+        
+        response = rate_limited_call("openai", VISION_EXTRACTION_MODEL, lambda: client.chat.completions.create(
+            model=VISION_EXTRACTION_MODEL,
             # Use Structured Outputs (json_schema) for better reliability
             response_format = {
                 "type": "json_schema",
@@ -553,6 +579,11 @@ def extract_page_data(base64_image, openai_api_key):
             ],
             temperature=0.0,
             max_tokens=4096, # Increased to handle dense pages
+        ),
+            # Prompt, one high-detail page image (roughly 1000 tokens) and the output allowance
+            tokens=estimate_tokens(system_prompt) + 1000 + 4096,
+            max_retries=EXTRACTION_MAX_RETRIES,
+            description=f"Extraction of {page_label}",
         )
         
         finish_reason = response.choices[0].finish_reason
@@ -565,7 +596,7 @@ def extract_page_data(base64_image, openai_api_key):
             print("⚠️ Warning: OpenAI returned empty content")
             return None
             
-        print("extracted page")
+        print(f"extracted {page_label}")
         return content
     except Exception as e:
             print(f"Error extracting text from PDF: {e}")
@@ -573,47 +604,125 @@ def extract_page_data(base64_image, openai_api_key):
             traceback.print_exc()
             return None
 
-def extract_from_multiple_pages(base64_images, openai_api_key):
-    whole_response = []
+def parse_page_response(page_response, page_number):
+    """
+    Parse the structured-output JSON of a single page, repairing simple truncation
+    """
+    if not page_response:
+        print(f"⚠️ Warning: No response for page {page_number}")
+        return None
 
-    for i, base64_image in enumerate(base64_images):
-        page_response = extract_page_data(base64_image, openai_api_key)
+    try:
+        page_data = json.loads(page_response)
+    except json.JSONDecodeError as e:
+        print(f"❌ JSON Decode Error on page {page_number}: {e}")
+        print(f"Raw response snippet: {page_response[:200]}...{page_response[-200:] if len(page_response) > 200 else ''}")
         
-        if not page_response:
-            print(f"⚠️ Warning: No response for page {i+1}")
-            continue
-            
-        try:
-            page_data = json.loads(page_response)
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON Decode Error on page {i+1}: {e}")
-            print(f"Raw response snippet: {page_response[:200]}...{page_response[-200:] if len(page_response) > 200 else ''}")
-            
-            # Simple "repair" for truncated JSON if using strict schema {"content": "..."}
-            if '{"content":' in page_response and not page_response.strip().endswith('}'):
-                print("🔧 Attempting simple JSON repair for truncation...")
-                try:
-                    # Try to close the string and the object
-                    repaired = page_response.strip()
-                    if not repaired.endswith('"'):
-                        repaired += '"'
-                    if not repaired.endswith('}'):
-                        repaired += '}'
-                    page_data = json.loads(repaired)
-                    print("✅ Repair successful")
-                except:
-                    print("❌ Repair failed")
-                    continue
-            else:
-                continue
-                
-        page_data['page_number'] = i + 1
-        print("Extracted ::::", page_data)
-        whole_response.append(page_data)
+        # Simple "repair" for truncated JSON if using strict schema {"content": "..."}
+        if '{"content":' in page_response and not page_response.strip().endswith('}'):
+            print("🔧 Attempting simple JSON repair for truncation...")
+            try:
+                # Try to close the string and the object
+                repaired = page_response.strip()
+                if not repaired.endswith('"'):
+                    repaired += '"'
+                if not repaired.endswith('}'):
+                    repaired += '}'
+                page_data = json.loads(repaired)
+                print("✅ Repair successful")
+            except:
+                print("❌ Repair failed")
+                return None
+        else:
+            return None
+
+    page_data['page_number'] = page_number
+    print("Extracted ::::", page_data)
+    return page_data
+
+def extract_from_multiple_pages(page_images, openai_api_key, max_workers=None):
+    """
+    Extract pages from an iterable of (page_number, png_bytes) with at most max_workers requests in flight.
+    The next page is only pulled from page_images when a slot frees up, so a lazy renderer such as
+    iter_page_images holds no more than max_workers page images in memory.
+    Results keep page order; pages that fail after retries are skipped.
+    """
+    max_workers = max_workers or EXTRACTION_MAX_WORKERS
+    # The process-wide client is shared by all workers; retries are handled per page by rate_limited_call
+    client = get_openai_client(openai_api_key)
+
+    def extract(page_number, png_bytes):
+        base64_image = base64.b64encode(png_bytes).decode("utf-8")
+        page_response = extract_page_data(base64_image, openai_api_key, client=client, page_number=page_number)
+        return parse_page_response(page_response, page_number)
+
+    start_time = time.time()
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+        for page_number, png_bytes in page_images:
+            if len(in_flight) >= max_workers:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[in_flight.pop(future)] = future.result()
+            in_flight[executor.submit(extract, page_number, png_bytes)] = page_number
+        for future, page_number in in_flight.items():
+            results[page_number] = future.result()
+
+    whole_response = [results[page_number] for page_number in sorted(results) if results[page_number]]
+    print(f"Extracted {len(whole_response)}/{len(results)} pages in {time.time() - start_time:.1f}s ({max_workers} workers)")
 
     output = {'pages': whole_response}
     return output
 
+def extraction_cache_version(backend):
+    """
+    (model, version) under which a backend's page extractions are cached
+    """
+    model, prompt = EXTRACTION_BACKENDS[backend]
+    version = prompt_version(prompt)
+    if backend == "openai-vision":
+        # The image resolution changes what the model sees, so it is part of the cache key
+        version = f"{version}-{RENDER_DPI}dpi"
+    return model, version
+
+def extract_pages(pdf_path, page_numbers, page_hashes, backend, gemini_api_key, openai_api_key):
+    """
+    Extract the given pages with one of the EXTRACTION_BACKENDS, serving pages from the extraction cache
+    when possible. Returns [{"page_number", "content"}] for the pages that could be extracted.
+    """
+    model, version = extraction_cache_version(backend)
+    cached = get_cached_pages({page_number: page_hashes[page_number] for page_number in page_numbers}, backend, model, version)
+    missing = [page_number for page_number in page_numbers if page_number not in cached]
+    print(f"Extraction cache: {len(cached)}/{len(page_numbers)} pages cached ({backend})")
+
+    fresh = {}
+    if missing:
+        if backend == "openai-vision":
+            json_response = extract_from_multiple_pages(iter_page_images(pdf_path, page_numbers=missing), openai_api_key)
+        elif backend == "gemini":
+            # Whole-document backends re-extract every page; all of them are cached below
+            json_response = extract_text_from_pdf(pdf_path, gemini_api_key)
+        else:
+            json_response = extract_text_from_pdf_openai(pdf_path, openai_api_key)
+
+        if json_response:
+            try:
+                parsed_data = json.loads(json_response) if isinstance(json_response, str) else json_response
+                for page in parsed_data.get("pages", []):
+                    if page.get("page_number") in page_hashes:
+                        fresh[page["page_number"]] = page.get("content", "")
+            except json.JSONDecodeError as e:
+                print(f"Failed to parse JSON response: {e}")
+        cache_pages(fresh, page_hashes, backend, model, version, os.path.basename(pdf_path))
+
+    contents = {**fresh, **cached}
+    return [
+        {"page_number": page_number, "content": contents[page_number]}
+        for page_number in page_numbers
+        if page_number in contents
+    ]
+
 def chunk_text(pages_data, chunk_size=1000, overlap=400):
     """
     Split text into overlapping chunks for better context preservation
@@ -663,39 +772,131 @@ def chunk_text(pages_data, chunk_size=1000, overlap=400):
     
     return all_chunks
 
-def embed_text(text, openai_api_key, model="text-embedding-3-small"):
+def embed_text(text, openai_api_key, model=EMBEDDING_MODEL):
     """
     Create embedding for text using OpenAI
     """
+    cached = get_cached_embeddings([text], model)[0]
+    if cached:
+        return cached
     try:
-        client = OpenAI(api_key=openai_api_key)
-        response = client.embeddings.create(
+        client = get_openai_client(openai_api_key)
+        response = rate_limited_call("openai", model, lambda: client.embeddings.create(
             input=text,
             model=model
-        )
-        return response.data[0].embedding
-    except OpenAIError as e:
+        ), tokens=estimate_tokens(text), description="Embedding")
+        embedding = response.data[0].embedding
+        cache_embeddings([text], [embedding], model)
+        return embedding
+    except openai_error() as e:
         print(f"OpenAI embedding error: {e}")
         return None
 
-def upload_to_pinecone(chunks, embeddings, pdf_filename, pinecone_api_key, pinecone_index_name):
+def _pack_embedding_batches(texts, max_batch_size, max_batch_tokens):
+    """
+    Group input positions into batches bounded by input count and estimated tokens
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_batch_size or current_tokens + tokens > max_batch_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def embed_texts(texts, openai_api_key, model=EMBEDDING_MODEL, max_workers=None,
+                max_batch_size=None, max_batch_tokens=None):
     """
-    Upload chunks and their embeddings to Pinecone
+    Create embeddings for many texts with batched, concurrent requests.
+    Returns one vector per input in input order; inputs that could not be embedded are None.
+    Cached vectors are reused and identical texts are only sent once.
+    """
+    if not texts:
+        return []
+
+    embeddings = get_cached_embeddings(texts, model)
+    pending = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+    if pending:
+        print(f"Embedding cache: requesting {len(pending)} of {len(texts)} texts")
+        fresh = _embed_texts_uncached(pending, openai_api_key, model, max_workers, max_batch_size, max_batch_tokens)
+        cache_embeddings(pending, fresh, model)
+        by_text = dict(zip(pending, fresh))
+        embeddings = [embedding if embedding is not None else by_text[text] for text, embedding in zip(texts, embeddings)]
+    return embeddings
+
+def _embed_texts_uncached(texts, openai_api_key, model, max_workers, max_batch_size, max_batch_tokens):
+    max_workers = max_workers or EMBEDDING_MAX_WORKERS
+    batches = _pack_embedding_batches(
+        texts,
+        max_batch_size or EMBEDDING_BATCH_SIZE,
+        max_batch_tokens or EMBEDDING_BATCH_MAX_TOKENS,
+    )
+    client = get_openai_client(openai_api_key)
+    embeddings = [None] * len(texts)
+
+    def embed_one(i):
+        try:
+            response = rate_limited_call(
+                "openai",
+                model,
+                lambda: client.embeddings.create(input=texts[i], model=model),
+                tokens=estimate_tokens(texts[i]),
+                max_retries=EXTRACTION_MAX_RETRIES,
+                description=f"Embedding of input {i}",
+            )
+            embeddings[i] = response.data[0].embedding
+        except openai_error() as e:
+            print(f"OpenAI embedding error for input {i}: {e}")
+
+    def embed_batch(batch):
+        try:
+            response = rate_limited_call(
+                "openai",
+                model,
+                lambda: client.embeddings.create(input=[texts[i] for i in batch], model=model),
+                tokens=sum(estimate_tokens(texts[i]) for i in batch),
+                max_retries=EXTRACTION_MAX_RETRIES,
+                description=f"Embedding batch of {len(batch)} inputs",
+            )
+        except openai_error() as e:
+            # One bad input fails the whole request; retry inputs individually so only it is lost
+            print(f"OpenAI embedding batch error, retrying {len(batch)} inputs individually: {e}")
+            response = None
+
+        missing = list(batch)
+        if response is not None:
+            for item in response.data:
+                embeddings[batch[item.index]] = item.embedding
+            missing = [i for i in batch if embeddings[i] is None]
+        for i in missing:
+            embed_one(i)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(embed_batch, batches))
+
+    return embeddings
+
+def upload_vectors(chunks, embeddings, pdf_filename, equipment=None):
+    """
+    Upload chunks and their embeddings to the vector store, tagged with the equipment the document covers
     """
     try:
-        pc = Pinecone(api_key=pinecone_api_key)
-        index = pc.Index(pinecone_index_name)
-        
         vectors_to_upsert = []
         
         for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            vector_id = f"{pdf_filename}_chunk_{i}"
+            vector_id = chunk.get("id", f"{pdf_filename}_chunk_{i}")
             
             metadata = {
                 "text": chunk["text"],
                 "source": pdf_filename,
-                "chunk_index": i,
-                "page_number": chunk["page_number"]
+                "chunk_index": chunk.get("chunk_index", i),
+                "page_number": chunk["page_number"],
+                **equipment_metadata(equipment),
             }
             
             vectors_to_upsert.append({
@@ -704,94 +905,267 @@ def upload_to_pinecone(chunks, embeddings, pdf_filename, pinecone_api_key, pinec
                 "metadata": metadata
             })
         
-        # Upsert in batches of 100
-        batch_size = 100
-        for i in range(0, len(vectors_to_upsert), batch_size):
-            batch = vectors_to_upsert[i:i + batch_size]
-            index.upsert(vectors=batch)
+        get_vector_store().upsert(vectors_to_upsert)
         
+        # The lexical index follows the vector index; search still works without it, so errors are only reported
+        try:
+            get_lexical_index().add([
+                {"id": vector["id"], "text": vector["metadata"]["text"], "metadata": {k: v for k, v in vector["metadata"].items() if k != "text"}}
+                for vector in vectors_to_upsert
+            ])
+        except Exception as e:
+            print(f"⚠️ Lexical index update failed: {e}")
         return True
         
     except Exception as e:
-        print(f"Error uploading to Pinecone: {e}")
+        print(f"Error uploading vectors: {e}")
+        return False
+
+def delete_vectors(vector_ids):
+    """
+    Delete vectors by id from the vector store
+    """
+    if not vector_ids:
+        return True
+    try:
+        get_vector_store().delete(vector_ids)
+        try:
+            get_lexical_index().delete(vector_ids)
+        except Exception as e:
+            print(f"⚠️ Lexical index delete failed: {e}")
+        return True
+    
+    except Exception as e:
+        print(f"Error deleting vectors: {e}")
         return False
 
-def process_pdf_and_upload(pdf_path, gemini_api_key, openai_api_key, pinecone_api_key, pinecone_index_name, use_gemini=False):
+def retag_document(pdf_filename):
     """
-    Main pipeline: Extract text from PDF, chunk it, embed, and upload to Pinecone
+    Update the equipment tags of an ingested document's vectors after its mapping changed.
+    Documents ingested before manifests existed are found by their legacy vector ids.
+    Returns the number of vectors updated, or None on failure.
     """
+    manifest = load_manifest(pdf_filename)
+    if manifest is not None:
+        vector_ids = [vector_id for page in manifest["pages"].values() for vector_id in page.get("vector_ids", [])]
+    else:
+        vector_ids = list_legacy_vector_ids(pdf_filename)
+    metadata = equipment_metadata(get_document_equipment(pdf_filename))
     try:
+        store = get_vector_store()
+        for vector_id in vector_ids:
+            store.update_metadata(vector_id, metadata)
+        get_lexical_index().update_metadata(vector_ids, metadata)
+        if vector_ids:
+            bump_index_version()
+        print(f"🏷️ Retagged {len(vector_ids)} vectors of {pdf_filename}")
+        return len(vector_ids)
+    except Exception as e:
+        print(f"Error retagging {pdf_filename}: {e}")
+        return None
+
+def list_legacy_vector_ids(pdf_filename):
+    """
+    Ids written before per-page ids existed ("{pdf_filename}_chunk_{i}").
+    Pinecone only supports listing by prefix on serverless indexes; elsewhere nothing is found.
+    """
+    try:
+        return get_vector_store().list_ids(f"{pdf_filename}_chunk_")
+    except Exception as e:
+        print(f"⚠️ Could not list previous vectors for {pdf_filename}: {e}")
+        return []
+
+def assign_vector_ids(chunks, pdf_filename):
+    """
+    Give each chunk a page-scoped id so a page's vectors can be replaced without touching other pages
+    """
+    counters = {}
+    for chunk in chunks:
+        page_number = chunk["page_number"]
+        chunk_index = counters.get(page_number, 0)
+        counters[page_number] = chunk_index + 1
+        chunk["chunk_index"] = chunk_index
+        chunk["id"] = f"{pdf_filename}_page_{page_number}_chunk_{chunk_index}"
+    return chunks
+
+def process_pdf_and_upload(pdf_path, gemini_api_key, openai_api_key, use_gemini=False, incremental=None, on_progress=None):
+    """
+    Main pipeline: Extract text from PDF, chunk it, embed, and upload to the vector store.
+    Pages stream through render → extract → chunk → embed → upsert stages connected by bounded queues,
+    so every page is searchable as soon as its batch is upserted and a failure only loses that page.
+    In incremental mode only pages whose rendered content changed since the last run are processed,
+    and vectors of changed or removed pages are deleted. Returns True when every page made it through.
+    on_progress(pages_done, pages_total) is called as pages are upserted.
+    """
+    try:
+        if incremental is None:
+            incremental = INCREMENTAL_INGESTION
+
         # Get filename for metadata
         pdf_filename = os.path.basename(pdf_path)
         print(f"Processing {pdf_filename}...")
+        # Chunks are tagged with the equipment mapped to the document when the run starts
+        equipment = get_document_equipment(pdf_filename)
         
-        # Step 1: Extract text using selected API
-        print("Extracting text from PDF...")
-        if use_gemini:
-            json_response = extract_text_from_pdf(pdf_path, gemini_api_key)
+        # Step 1: Find the pages that changed since the last ingestion
+        # Documents ingested before the lexical index existed are re-chunked once so their text gets indexed
+        settings = {"chunk_size": CHUNK_SIZE, "overlap": CHUNK_OVERLAP, "embedding_model": EMBEDDING_MODEL, "lexical_index": 1}
+        page_hashes = compute_page_hashes(pdf_path)
+        previous = load_manifest(pdf_filename)
+        changed_pages, removed_pages = diff_pages(previous, page_hashes)
+        if not incremental or previous is None or previous.get("settings") != settings:
+            changed_pages = sorted(page_hashes)
+        
+        if not changed_pages and not removed_pages and not (previous or {}).get("stale_ids"):
+            print(f"{pdf_filename} is unchanged, nothing to re-ingest")
+            return True
+        print(f"{len(changed_pages)}/{len(page_hashes)} pages to process, {len(removed_pages)} removed")
+        pages_done = 0
+        if on_progress:
+            on_progress(pages_done, len(changed_pages))
+        
+        # Step 2: Record the pages being replaced before touching the index, so an interrupted run retries them.
+        # Documents ingested before manifests existed still have vectors under the old id scheme; those are
+        # kept as stale_ids until the whole document has been re-ingested.
+        previous_pages = previous["pages"] if previous else {}
+        manifest = new_manifest(pdf_filename, settings)
+        manifest["stale_ids"] = previous.get("stale_ids", []) if previous else list_legacy_vector_ids(pdf_filename)
+        for page_number in page_hashes:
+            entry = previous_pages.get(str(page_number), {})
+            if page_number in changed_pages:
+                entry = {"hash": None, "vector_ids": entry.get("vector_ids", [])}
+            manifest["pages"][str(page_number)] = entry
+        save_manifest(pdf_filename, manifest)
+        manifest_lock = threading.Lock()
+        
+        # Step 3: Pages that are already extracted (cache, or a whole-document backend) skip render and extract
+        backend = "gemini" if use_gemini else "openai-vision"
+        model, version = extraction_cache_version(backend)
+        if changed_pages and backend != "openai-vision":
+            print("Extracting text from PDF...")
+            known_contents = {
+                page["page_number"]: page["content"]
+                for page in extract_pages(pdf_path, changed_pages, page_hashes, backend, gemini_api_key, openai_api_key)
+            }
         else:
-            base64_images = pdf_to_base64_images(pdf_path)
-            json_response = extract_from_multiple_pages(base64_images, openai_api_key)
+            known_contents = get_cached_pages({n: page_hashes[n] for n in changed_pages}, backend, model, version)
+        print(f"{len(known_contents)}/{len(changed_pages)} pages already extracted")
         
-        if not json_response:
-            print("Failed to extract text from PDF")
-            return False
+        client = get_openai_client(openai_api_key)
         
-        try:
-            parsed_data = json.loads(json_response) if isinstance(json_response, str) else json_response
-            pages_data = parsed_data.get("pages", [])
-            
-            if not pages_data:
-                print("No pages found in JSON response")
-                return False
-            
-            print(f"Extracted {len(pages_data)} pages")
-            
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON response: {e}")
-            return False
+        def render(page):
+            page_number = page["page_number"]
+            if page_number in known_contents:
+                page["content"] = known_contents[page_number]
+            elif backend != "openai-vision":
+                raise ValueError("page missing from the document extraction")
+            else:
+                # CPU-bound rendering runs in the shared process pool
+                page["png"] = render_page(pdf_path, page_number)
+            return page
         
-        # Step 2: Chunk the text
-        print("Chunking text...")
-        try:
-            chunks = chunk_text(pages_data, chunk_size=1000, overlap=400)
-            print(f"Created {len(chunks)} chunks")
-        except Exception as chunk_error:
-            print(f"Error during chunking: {chunk_error}")
-            import traceback
-            traceback.print_exc()
-            return False
+        def extract(page):
+            if "content" not in page:
+                page_number = page["page_number"]
+                base64_image = base64.b64encode(page.pop("png")).decode("utf-8")
+                page_data = parse_page_response(
+                    extract_page_data(base64_image, openai_api_key, client=client, page_number=page_number),
+                    page_number,
+                )
+                if page_data is None:
+                    raise ValueError("extraction failed")
+                page["content"] = page_data.get("content", "")
+                cache_pages({page_number: page["content"]}, page_hashes, backend, model, version, pdf_filename)
+            return page
         
-        if not chunks:
-            print("No chunks created")
-            return False
+        def chunk(page):
+            page["chunks"] = assign_vector_ids(chunk_text([page], chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP), pdf_filename)
+            return page
+        
+        def embed(pages):
+            # One batched embedding call for the chunks of several pages
+            chunks = [chunk_dict for page in pages for chunk_dict in page["chunks"]]
+            embeddings = iter(embed_texts([chunk_dict["text"] for chunk_dict in chunks], openai_api_key, max_workers=1))
+            for page in pages:
+                page["embeddings"] = [next(embeddings) for _ in page["chunks"]]
+                if any(embedding is None for embedding in page["embeddings"]):
+                    page["error"] = "embedding failed"
+            return pages
         
-        # Step 3: Create embeddings for each chunk
-        print("Creating embeddings...")
-        embeddings = []
-        for i, chunk_dict in enumerate(chunks):
-            if i % 10 == 0:
-                print(f"  Embedding chunk {i+1}/{len(chunks)} (Page {chunk_dict['page_number']})...")
+        def upsert(pages):
+            chunks = [chunk_dict for page in pages for chunk_dict in page["chunks"]]
+            embeddings = [embedding for page in pages for embedding in page["embeddings"]]
+            if chunks and not upload_vectors(chunks, embeddings, pdf_filename, equipment):
+                raise RuntimeError("Vector upsert failed")
             
-            embedding = embed_text(chunk_dict["text"], openai_api_key)
-            if embedding:
-                embeddings.append(embedding)
-            else:
-                print(f"Failed to create embedding for chunk {i} (Page {chunk_dict['page_number']})")
-                return False
+            # The pages are now searchable: drop their leftover vectors and record them in the manifest
+            new_ids = {chunk_dict["id"] for chunk_dict in chunks}
+            with manifest_lock:
+                stale_ids = [
+                    vector_id
+                    for page in pages
+                    for vector_id in manifest["pages"][str(page["page_number"])].get("vector_ids", [])
+                    if vector_id not in new_ids
+                ]
+                if stale_ids and not delete_vectors(stale_ids):
+                    manifest["stale_ids"] += stale_ids
+                for page in pages:
+                    manifest["pages"][str(page["page_number"])] = {
+                        "hash": page_hashes[page["page_number"]],
+                        "vector_ids": [chunk_dict["id"] for chunk_dict in page["chunks"]],
+                    }
+                save_manifest(pdf_filename, manifest)
+                if on_progress:
+                    nonlocal pages_done
+                    pages_done += len(pages)
+                    on_progress(pages_done, len(changed_pages))
+            
+            # Free the page payload as soon as it is stored
+            for page in pages:
+                for key in ("content", "chunks", "embeddings"):
+                    page.pop(key, None)
+            return pages
         
-        print(f"Created {len(embeddings)} embeddings")
+        stages = [
+            PipelineStage("render", render, workers=RENDER_WORKERS),
+            PipelineStage("extract", extract, workers=EXTRACTION_MAX_WORKERS),
+            PipelineStage("chunk", chunk, workers=CHUNK_WORKERS),
+            PipelineStage("embed", embed, workers=EMBEDDING_MAX_WORKERS, batch_size=EMBED_BATCH_PAGES),
+            PipelineStage("upsert", upsert, workers=UPSERT_WORKERS, batch_size=UPSERT_BATCH_PAGES),
+        ]
         
-        # Step 4: Upload to Pinecone
-        print("Uploading to Pinecone...")
-        success = upload_to_pinecone(chunks, embeddings, pdf_filename, pinecone_api_key, pinecone_index_name)
+        # Step 4: Stream the changed pages through the stages
+        print("Running ingestion pipeline...")
+        completed, failed, _ = run_pipeline(({"page_number": n} for n in changed_pages), stages)
         
-        if success:
-            print(f"Successfully processed {pdf_filename}")
-            return True
-        else:
-            print(f"Failed to upload {pdf_filename} to Pinecone")
+        # Step 5: Delete vectors of removed pages, and the old-scheme vectors once every page is in
+        removed_ids = [
+            vector_id
+            for page_number in removed_pages
+            for vector_id in previous_pages.get(str(page_number), {}).get("vector_ids", [])
+        ]
+        pending_ids = removed_ids + (manifest["stale_ids"] if not failed else [])
+        if pending_ids:
+            print(f"Deleting {len(pending_ids)} stale vectors...")
+            if delete_vectors(pending_ids):
+                if not failed:
+                    manifest["stale_ids"] = []
+            else:
+                manifest["stale_ids"] += removed_ids
+            save_manifest(pdf_filename, manifest)
+        
+        print(f"Upserted {len(completed)}/{len(changed_pages)} pages")
+        if completed or pending_ids:
+            # The documents behind cached answers changed
+            bump_index_version()
+        if failed:
+            for page in failed:
+                print(f"⚠️ Page {page['page_number']} failed at {page['failed_stage']}: {page['error']}")
+            print(f"Failed pages of {pdf_filename} will be retried on the next upload")
             return False
+        
+        print(f"Successfully processed {pdf_filename}")
+        return True
             
     except Exception as e:
         print(f"Error in process_pdf_and_upload: {e}")
@@ -810,8 +1184,9 @@ def render_pdf_page_to_png_bytes(pdf_url: str, page_number: int = 1, zoom: float
         raise ValueError("page_number must be >= 1")
 
     # Fetch PDF from URL
+    import httpx
     try:
-        response = httpx.get(pdf_url, timeout=30.0)
+        response = get_http_client().get(pdf_url)
         response.raise_for_status()
         pdf_bytes = response.content
     except httpx.HTTPError as e:
@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from local_cache import LocalCache
+from answer_cache import answer_scope, get_index_version
+from fixed_prompts import get_fixed_prompts, equipment_combinations
+from document_equipment import get_document_equipment, covers_selection
+
+PRECOMPUTE_MAX_BYTES = int(os.getenv("PRECOMPUTE_MAX_MB", "256")) * 1024 * 1024
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", "4"))
+# Also synthesize speech for every precomputed answer
+PRECOMPUTE_AUDIO = os.getenv("PRECOMPUTE_AUDIO", "false").lower() == "true"
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_precomputed_store():
+    """
+    Process-wide store of precomputed answers, opened on first use
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LocalCache("precomputed", PRECOMPUTE_MAX_BYTES)
+        return _store
+
+def precomputed_key(prompt, category=None, type=None, brand=None, model_series=None):
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return f"{answer_scope(category, type, brand, model_series)}:{prompt_hash}"
+
+def get_precomputed(prompt, category=None, type=None, brand=None, model_series=None):
+    """
+    The stored entry for a fixed prompt ({"answer", "source", "audio"}), or None when it is missing
+    or was computed against an older index
+    """
+    try:
+        value = get_precomputed_store().get(precomputed_key(prompt, category, type, brand, model_series))
+    except Exception as e:
+        print(f"Precomputed answer read error: {e}")
+        return None
+    if value is None:
+        return None
+    entry = json.loads(value)
+    if entry["index_version"] != get_index_version():
+        return None
+    if entry.get("audio"):
+        entry["audio"] = base64.b64decode(entry["audio"])
+    return entry
+
+def _precompute_one(combination, prompt, audio):
+    from chatbot_utils import process_user_query, generate_audio_response, GENERATION_ERROR
+
+    index_version = get_index_version()
+    key = precomputed_key(prompt, **combination)
+    stored = get_precomputed_store().get(key)
+    if stored is not None and json.loads(stored)["index_version"] == index_version:
+        return False
+
+    answer, source = process_user_query(prompt, [], **combination)
+    # Errors and "no information" replies come back without a source dict; those stay live
+    if not isinstance(source, dict) or answer == GENERATION_ERROR:
+        print(f"⚠️ No answer stored for {prompt!r} ({combination})")
+        return False
+    entry = {
+        "prompt": prompt,
+        "answer": answer,
+        "source": source,
+        "index_version": index_version,
+        "created_at": time.time(),
+        **combination,
+    }
+    if audio:
+        entry["audio"] = base64.b64encode(generate_audio_response(answer, use_gemini=False).getvalue()).decode("ascii")
+    get_precomputed_store().put(key, json.dumps(entry).encode("utf-8"))
+    return True
+
+def precompute_answers(category=None, audio=None, documents=None):
+    """
+    Answer every checklist and FAQ prompt for every equipment selection against the current index,
+    skipping entries that are already fresh. With documents, only the selections those documents are
+    mapped to are answered (every selection for an unmapped document). Returns the number of answers computed.
+    """
+    audio = PRECOMPUTE_AUDIO if audio is None else audio
+    combinations = [c for c in equipment_combinations() if category is None or c["category"] == category]
+    if documents is not None:
+        mappings = [get_document_equipment(document) for document in documents]
+        combinations = [c for c in combinations if any(covers_selection(equipment, c) for equipment in mappings)]
+    tasks = [(combination, prompt) for combination in combinations for prompt in get_fixed_prompts(combination["category"])]
+    print(f"🧮 Precomputing {len(tasks)} answers for {len(combinations)} equipment selections...")
+    start_time = time.time()
+
+    def run(task):
+        try:
+            return _precompute_one(*task, audio)
+        except Exception as e:
+            print(f"⚠️ Precompute failed for {task[1]!r}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=PRECOMPUTE_WORKERS) as executor:
+        computed = sum(executor.map(run, tasks))
+    print(f"✅ Precomputed {computed} answers in {time.time() - start_time:.1f}s")
+    return computed
+
+def precompute_status():
+    index_version = get_index_version()
+    entries = [json.loads(value) for _, value in get_precomputed_store().items()]
+    fresh = sum(entry["index_version"] == index_version for entry in entries)
+    return {"entries": len(entries), "fresh": fresh, "stale": len(entries) - fresh}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute answers for the checklist and FAQ prompts")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    refresh_parser = subcommands.add_parser("refresh", help="Answer prompts whose stored answer is missing or stale")
+    refresh_parser.add_argument("--category")
+    refresh_parser.add_argument("--document", action="append", help="Only the selections this document is mapped to (repeatable)")
+    refresh_parser.add_argument("--audio", action="store_true", help="Also synthesize speech")
+    subcommands.add_parser("status", help="Show how many stored answers match the current index")
+    args = parser.parse_args(argv)
+
+    if args.command == "refresh":
+        import dotenv
+        dotenv.load_dotenv()
+        precompute_answers(category=args.category, audio=args.audio or None, documents=args.document)
+    elif args.command == "status":
+        print(json.dumps(precompute_status(), indent=2))
+
+if __name__ == "__main__":
+    sys.exit(main())
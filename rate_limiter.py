@@ -0,0 +1,333 @@
+import os
+import re
+import time
+import random
+import sqlite3
+import threading
+from local_cache import CACHE_DIR
+
+# Budgets per provider/model: (requests per minute, tokens per minute, max concurrent requests).
+# Override with RATE_LIMIT_<PROVIDER>_<MODEL>_RPM / _TPM / _CONCURRENCY, e.g. RATE_LIMIT_OPENAI_GPT_4O_TPM=800000.
+# A tokens-per-minute budget of 0 means requests are only limited by count.
+# The request and token budgets are shared by every process using the same CACHE_DIR (the app and its
+# ingestion workers); the concurrency limit applies to each process on its own.
+DEFAULT_LIMITS = {
+    ("openai", "gpt-4o"): (500, 450000, 16),
+    ("openai", "gpt-5"): (500, 450000, 8),
+    ("openai", "text-embedding-3-small"): (3000, 1000000, 8),
+    ("openai", "tts"): (500, 0, 8),
+    ("openai", "transcription"): (500, 0, 8),
+    ("gemini", "gemini-2.5-pro"): (150, 2000000, 8),
+    ("gemini", "tts"): (10, 0, 4),
+    ("gemini", "transcription"): (150, 0, 8),
+    ("cohere", "rerank-v3.5"): (1000, 0, 8),
+    ("pinecone", "query"): (6000, 0, 32),
+    ("pinecone", "write"): (3000, 0, 8),
+}
+FALLBACK_LIMITS = (60, 0, 4)
+DEFAULT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+# Keep request and token budgets in SQLite so all processes draw from the same buckets
+RATE_LIMIT_SHARED = os.getenv("RATE_LIMIT_SHARED", "true").lower() == "true"
+RATE_LIMIT_DB_PATH = os.path.join(CACHE_DIR, "rate_limits.sqlite3")
+# Share of a shared bucket's capacity a process leases at once and then spends locally, so most calls
+# never touch the database; a process holds at most this much budget the others cannot use
+RATE_LIMIT_LEASE_SHARE = float(os.getenv("RATE_LIMIT_LEASE_SHARE", "0.1"))
+
+class TokenBucket:
+    """
+    Refills at `per_minute` units per minute up to `capacity`; take() blocks until enough units are available
+    """
+
+    def __init__(self, per_minute, capacity):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, capacity)
+        self.available = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+            time.sleep(wait)
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket whose state lives in SQLite, so processes sharing the file share the budget.
+    Units are leased from the shared row in batches of RATE_LIMIT_LEASE_SHARE of the capacity and
+    taken from the local remainder. Uses wall-clock time, which unlike the monotonic clock is
+    comparable between processes.
+    """
+
+    _conn = None
+    _conn_lock = threading.Lock()
+
+    def __init__(self, name, per_minute, capacity):
+        super().__init__(per_minute, capacity)
+        self.name = name
+        self.lease_size = max(1, int(self.capacity * RATE_LIMIT_LEASE_SHARE))
+        self.available = 0.0
+        self.leases = 0
+
+    @classmethod
+    def _connection(cls):
+        # Caller holds _conn_lock
+        if cls._conn is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            cls._conn = sqlite3.connect(RATE_LIMIT_DB_PATH, check_same_thread=False, timeout=30, isolation_level=None)
+            cls._conn.execute("PRAGMA journal_mode=WAL")
+            cls._conn.execute("PRAGMA synchronous=NORMAL")
+            cls._conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, available REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+        return cls._conn
+
+    def _lease(self, amount):
+        # Returns (units leased, 0) with at least amount units, or (0, seconds to wait for them)
+        with self._conn_lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = conn.execute("SELECT available, updated_at FROM buckets WHERE name = ?", (self.name,)).fetchone()
+                available = float(self.capacity) if row is None else row[0] + max(0.0, now - row[1]) * self.rate
+                available = min(self.capacity, available)
+                leased, wait = 0.0, 0.0
+                if available >= amount:
+                    leased = min(available, max(amount, self.lease_size))
+                    available -= leased
+                else:
+                    wait = (amount - available) / self.rate
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, available, updated_at) VALUES (?, ?, ?)",
+                    (self.name, available, now),
+                )
+                conn.execute("COMMIT")
+                return leased, wait
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def take(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                if self.available < amount:
+                    # The remainder stays with this process; only the missing units are leased
+                    leased, wait = self._lease(amount - self.available)
+                    self.available += leased
+                    self.leases += bool(leased)
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+            time.sleep(wait)
+
+def _bucket(name, per_minute, capacity):
+    if RATE_LIMIT_SHARED:
+        return SharedTokenBucket(name, per_minute, capacity)
+    return TokenBucket(per_minute, capacity)
+
+class ProviderLimiter:
+    """
+    Request and token budgets plus an adaptive concurrency limit for one provider model.
+    The concurrency limit halves and the limiter pauses (honouring Retry-After) whenever the provider
+    answers 429, then grows back by one after each window of successful calls.
+    """
+
+    def __init__(self, provider, model, requests_per_minute, tokens_per_minute, max_concurrency):
+        self.provider = provider
+        self.model = model
+        self.requests = _bucket(f"{provider}/{model}/requests", requests_per_minute, max(1, requests_per_minute // 10))
+        self.tokens = _bucket(f"{provider}/{model}/tokens", tokens_per_minute, tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = self.max_concurrency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.calls = 0
+        self.throttled = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def enter(self, tokens=0):
+        with self._condition:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause <= 0 and self.in_flight < self.concurrency:
+                    break
+                self._condition.wait(timeout=pause if pause > 0 else None)
+            self.in_flight += 1
+        try:
+            self.requests.take(1)
+            if self.tokens and tokens:
+                self.tokens.take(tokens)
+        except BaseException:
+            # No call is made, so exit() is never reached: give the slot back here
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+            raise
+
+    def exit(self, throttled=False, retry_after=None):
+        with self._condition:
+            self.in_flight -= 1
+            self.calls += 1
+            if throttled:
+                self.throttled += 1
+                self.concurrency = max(1, self.concurrency // 2)
+                self._successes = 0
+                pause = retry_after if retry_after is not None else 1.0
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+                print(f"🚦 {self.provider}/{self.model} throttled: concurrency {self.concurrency}, pausing {pause:.1f}s")
+            else:
+                self._successes += 1
+                if self._successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+    def stats(self):
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "concurrency": self.concurrency,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "throttled": self.throttled,
+        }
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def _env_name(provider, model, suffix):
+    return "RATE_LIMIT_" + re.sub(r"[^A-Z0-9]+", "_", f"{provider}_{model}".upper()).strip("_") + f"_{suffix}"
+
+def get_limiter(provider, model):
+    """
+    Process-wide limiter for a provider model
+    """
+    key = (provider, model)
+    with _limiters_lock:
+        if key not in _limiters:
+            rpm, tpm, concurrency = DEFAULT_LIMITS.get(key, FALLBACK_LIMITS)
+            _limiters[key] = ProviderLimiter(
+                provider,
+                model,
+                int(os.getenv(_env_name(provider, model, "RPM"), rpm)),
+                int(os.getenv(_env_name(provider, model, "TPM"), tpm)),
+                int(os.getenv(_env_name(provider, model, "CONCURRENCY"), concurrency)),
+            )
+        return _limiters[key]
+
+def limiter_stats():
+    with _limiters_lock:
+        return [limiter.stats() for limiter in _limiters.values()]
+
+def _status_code(error):
+    # openai/cohere expose status_code, pinecone status, google code
+    for attribute in ("status_code", "status", "code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+def is_rate_limited(error):
+    return _status_code(error) == 429 or type(error).__name__ in ("RateLimitError", "TooManyRequestsError", "ResourceExhausted")
+
+def is_retryable(error):
+    """
+    429, 5xx, timeouts and dropped connections are worth retrying
+    """
+    if is_rate_limited(error) or isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    name = type(error).__name__
+    if "Connection" in name or "Timeout" in name or name in ("ServiceUnavailable", "InternalServerError"):
+        return True
+    status = _status_code(error)
+    return status is not None and status >= 500
+
+def retry_after(error):
+    """
+    Seconds from the Retry-After header, if the provider sent one
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+def _backoff(attempt, base_delay=1.0, max_delay=60.0):
+    return min(max_delay, base_delay * (2 ** attempt)) + random.uniform(0, base_delay)
+
+def rate_limited_call(provider, model, fn, tokens=0, max_retries=None, description=None):
+    """
+    Run fn() within the provider model's budgets, retrying 429/5xx/connection errors with backoff.
+    Other errors, and the last retryable one, are raised to the caller.
+    """
+    limiter = get_limiter(provider, model)
+    max_retries = DEFAULT_MAX_RETRIES if max_retries is None else max_retries
+    description = description or f"{provider}/{model} request"
+    for attempt in range(max_retries + 1):
+        limiter.enter(tokens)
+        try:
+            result = fn()
+        except Exception as e:
+            throttled = is_rate_limited(e)
+            delay = retry_after(e)
+            limiter.exit(throttled=throttled, retry_after=delay)
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = min(60.0, delay) if delay is not None else _backoff(attempt)
+            print(f"⏳ {description} failed ({e}), retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+            time.sleep(delay)
+            continue
+        limiter.exit()
+        return result
+
+def rate_limited_stream(provider, model, fn, tokens=0, max_retries=None, description=None):
+    """
+    rate_limited_call for calls that return a stream: yields the items of fn() while holding the limiter
+    slot until the stream is consumed or closed, so errors raised mid-stream also count as throttling.
+    Errors before the first item are retried; later ones are raised, since the caller already saw output.
+    """
+    limiter = get_limiter(provider, model)
+    max_retries = DEFAULT_MAX_RETRIES if max_retries is None else max_retries
+    description = description or f"{provider}/{model} stream"
+    for attempt in range(max_retries + 1):
+        limiter.enter(tokens)
+        started = False
+        stream = None
+        try:
+            stream = fn()
+            for item in stream:
+                started = True
+                yield item
+        except GeneratorExit:
+            # Closed by the caller before the end
+            limiter.exit()
+            raise
+        except Exception as e:
+            throttled = is_rate_limited(e)
+            delay = retry_after(e)
+            limiter.exit(throttled=throttled, retry_after=delay)
+            if started or attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = min(60.0, delay) if delay is not None else _backoff(attempt)
+            print(f"⏳ {description} failed ({e}), retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+            time.sleep(delay)
+            continue
+        finally:
+            # Release the provider's connection when the stream is abandoned
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+        limiter.exit()
+        return
@@ -0,0 +1,153 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from local_cache import LocalCache
+from text_utils import normalize_text
+from rate_limiter import rate_limited_call
+from embedding_cache import get_cached_embeddings
+from lexical_index import tokenize
+from vector_store import Match
+from answer_cache import get_index_version
+from clients import get_cohere_client
+
+RERANK_MODEL = "rerank-v3.5"
+RERANK_CACHE_MAX_BYTES = int(os.getenv("RERANK_CACHE_MAX_MB", "32")) * 1024 * 1024
+# Queries with at most this many terms ("E6 error", "filter cleaning") are reranked locally
+RERANK_SIMPLE_MAX_TERMS = int(os.getenv("RERANK_SIMPLE_MAX_TERMS", "3"))
+# Share of the local score that comes from query terms found in the chunk, the rest is embedding similarity
+LOCAL_RERANK_LEXICAL_WEIGHT = float(os.getenv("LOCAL_RERANK_LEXICAL_WEIGHT", "0.3"))
+# Chunk vectors are looked up in the embedding cache the ingestion filled
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Part of the cache key; bump when the local scoring changes so stored rankings are not reused
+LOCAL_RERANK_VERSION = 2
+
+_cache = None
+_lock = threading.Lock()
+_stats = {"cached": 0, "cohere": 0, "local": 0, "fallbacks": 0}
+
+def get_rerank_cache():
+    """
+    Process-wide cache of rerank results, opened on first use
+    """
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = LocalCache("rerank", RERANK_CACHE_MAX_BYTES)
+        return _cache
+
+def _record(outcome):
+    with _lock:
+        _stats[outcome] += 1
+
+def reranker_stats():
+    with _lock:
+        return dict(_stats)
+
+def rerank_key(query, matches, top_k, backend):
+    # The order of the candidates does not change the result; re-ingested chunks keep their ids, so the index version is part of the key
+    spec = json.dumps([normalize_text(query).lower(), sorted(match.id for match in matches), top_k, backend, LOCAL_RERANK_VERSION, get_index_version()])
+    return hashlib.sha256(spec.encode("utf-8")).hexdigest()
+
+def _lexical_overlap(query_terms, text):
+    # Share of the query terms found in the chunk; terms with digits (codes, model numbers) count double
+    if not query_terms:
+        return 0.0
+    text_terms = set(tokenize(text))
+    weights = {term: 2.0 if any(char.isdigit() for char in term) else 1.0 for term in query_terms}
+    return sum(weight for term, weight in weights.items() if term in text_terms) / sum(weights.values())
+
+def _semantic_scores(matches, query_embedding):
+    # Retrieval scores are on different scales (cosine, BM25, fused ranks), so only the retrieval order is used:
+    # 1.0 for the first candidate down to 0.0 for the last. Candidates with a cached embedding get their cosine
+    # similarity to the query instead, min-max scaled to the same 0..1 range.
+    count = len(matches)
+    scores = np.array([1.0 - i / max(count - 1, 1) for i in range(count)], dtype=np.float32)
+    if query_embedding is None:
+        return scores
+    query_vector = np.asarray(query_embedding, dtype=np.float32)
+    query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+    cached = get_cached_embeddings([match.metadata.get("text", "") for match in matches], EMBEDDING_MODEL)
+    known = [i for i, embedding in enumerate(cached) if embedding is not None]
+    if len(known) < 2:
+        return scores
+    vectors = np.asarray([cached[i] for i in known], dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarities = vectors @ query_vector
+    spread = float(similarities.max() - similarities.min())
+    scores[known] = (similarities - similarities.min()) / spread if spread > 1e-6 else 1.0
+    return scores
+
+def rerank_local(query, matches, top_k, query_embedding=None):
+    """
+    Rerank on the CPU: cosine similarity between the query and chunk embeddings (the retrieval rank when
+    a chunk's embedding is not cached), blended with the overlap of query terms. Returns (index, score) pairs.
+    """
+    texts = [match.metadata.get("text", "") for match in matches]
+    similarities = _semantic_scores(matches, query_embedding)
+    query_terms = set(tokenize(query))
+    overlaps = np.array([_lexical_overlap(query_terms, text) for text in texts], dtype=np.float32)
+    scores = (1 - LOCAL_RERANK_LEXICAL_WEIGHT) * similarities + LOCAL_RERANK_LEXICAL_WEIGHT * overlaps
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    return [(int(i), float(scores[i])) for i in order]
+
+def rerank_cohere(query, matches, top_k):
+    documents = [match.metadata.get("text", "") for match in matches]
+    client = get_cohere_client()
+    response = rate_limited_call("cohere", RERANK_MODEL, lambda: client.rerank(
+        model=RERANK_MODEL,
+        query=query,
+        documents=documents,
+        top_n=top_k
+    ), description="Rerank")
+    return [(item.index, item.relevance_score) for item in response.results]
+
+def is_simple_query(query):
+    return len(set(tokenize(query))) <= RERANK_SIMPLE_MAX_TERMS
+
+def rerank(query, matches, top_k=5, query_embedding=None, backend=None):
+    """
+    Reorder matches by relevance to the query and keep top_k, as Match objects carrying the rerank score.
+    backend is "cohere" or "local" (RERANKER, default "cohere"); simple queries are always reranked locally
+    and Cohere failures fall back to the local reranker. Results are cached per query and candidate set.
+    """
+    if not matches:
+        return []
+    backend = backend or os.getenv("RERANKER", "cohere").lower()
+    if backend == "cohere" and is_simple_query(query):
+        backend = "local"
+
+    key = rerank_key(query, matches, top_k, backend)
+    try:
+        cached = get_rerank_cache().get(key)
+    except Exception as e:
+        print(f"Rerank cache read error: {e}")
+        cached = None
+    by_id = {match.id: match for match in matches}
+    if cached is not None:
+        ranking = json.loads(cached)
+        if all(match_id in by_id for match_id, _ in ranking):
+            _record("cached")
+            return [Match(match_id, score, dict(by_id[match_id].metadata)) for match_id, score in ranking]
+
+    ranked = None
+    if backend == "cohere":
+        try:
+            ranked = rerank_cohere(query, matches, top_k)
+            _record("cohere")
+        except Exception as e:
+            print(f"Cohere rerank error, reranking locally: {e}")
+            _record("fallbacks")
+            # A fallback result is not cached under the Cohere key, so the next call tries Cohere again
+            return [Match(matches[i].id, score, dict(matches[i].metadata)) for i, score in rerank_local(query, matches, top_k, query_embedding)]
+    if ranked is None:
+        ranked = rerank_local(query, matches, top_k, query_embedding)
+        _record("local")
+
+    ranking = [(matches[i].id, score) for i, score in ranked]
+    try:
+        get_rerank_cache().put(key, json.dumps(ranking).encode("utf-8"))
+    except Exception as e:
+        print(f"Rerank cache write error: {e}")
+    return [Match(match_id, score, dict(by_id[match_id].metadata)) for match_id, score in ranking]
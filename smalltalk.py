@@ -0,0 +1,190 @@
+import os
+import re
+import math
+import random
+import threading
+from collections import Counter
+
+# Classify obvious greetings and questions locally; only uncertain messages go to the LLM gate
+SMALLTALK_CLASSIFIER = os.getenv("SMALLTALK_CLASSIFIER", "true").lower() == "true"
+# Share of local decisions that are also sent to the LLM to measure agreement
+SMALLTALK_AUDIT_RATE = float(os.getenv("SMALLTALK_AUDIT_RATE", "0.05"))
+
+SMALLTALK_LEXICON = {
+    "greeting": [
+        "hi", "hello", "hey", "hiya", "howdy", "greetings", "yo", "hi there", "hello there", "hey there",
+        "good morning", "good afternoon", "good evening", "morning", "salam", "salaam", "marhaba",
+    ],
+    "wellbeing": [
+        "how are you", "how are you doing", "how is it going", "hows it going", "whats up", "what is up", "sup",
+        "how is your day", "hows your day",
+    ],
+    "thanks": [
+        "thanks", "thank you", "thank you so much", "thanks a lot", "many thanks", "thx", "ty", "cheers",
+        "much appreciated", "appreciate it", "thank you very much",
+    ],
+    "farewell": [
+        "bye", "goodbye", "bye bye", "see you", "see you later", "see ya", "good night", "take care",
+    ],
+    # Answers such as "yes", "no", "sure" or "later" usually reply to a clarifying question and are left out
+    "acknowledgement": [
+        "ok", "okay", "k", "kk", "cool", "got it", "great", "nice", "alright", "all right",
+        "sounds good", "perfect", "awesome", "understood", "noted", "ok thanks", "okay thank you",
+    ],
+    "meta": [
+        "who are you", "what are you", "what can you do", "are you real", "are you a bot", "are you human",
+        "what is your name", "whats your name",
+    ],
+}
+
+SMALLTALK_REPLIES = {
+    "greeting": "<p>Hello! 👋 How can I help you with your equipment documents today?</p>",
+    "wellbeing": "<p>I'm doing great, thank you for asking! How can I help you today?</p>",
+    "thanks": "<p>You're welcome! Let me know if there is anything else I can help with.</p>",
+    "farewell": "<p>Goodbye! Feel free to come back any time you have a question.</p>",
+    "acknowledgement": "<p>Great! Let me know if you have any other questions.</p>",
+    "meta": "<p>I'm an AI assistant that answers questions about your uploaded equipment manuals and documents. "
+            "Ask me about operation, maintenance, troubleshooting or specifications.</p>",
+}
+
+# Typical document questions, the counterweight for the character n-gram comparison
+DOMAIN_EXAMPLES = [
+    "how do i clean the air filter",
+    "what is the recommended maintenance schedule",
+    "what does this error code mean",
+    "how to reset the unit after a fault",
+    "what is the operating temperature range",
+    "what should i check during inspection",
+    "how do i replace the battery",
+    "what are the safety precautions",
+    "why is the unit not cooling",
+    "what is the refrigerant pressure",
+    "how to install the outdoor unit",
+    "what are the technical specifications",
+    "check the drain pan for water leakage",
+    "what is the model number and capacity",
+    "how often should the belts be inspected",
+]
+
+# Character n-gram similarity needed to accept a message as small talk despite a typo in one word
+NGRAM_MIN_SIMILARITY = 0.6
+NGRAM_MIN_MARGIN = 0.2
+# Lexicon words shorter than this ("hi", "yo", "ty") are too close to other words to correct typos of
+NGRAM_MIN_WORD_LENGTH = 4
+# Once the conversation has started, messages up to this many words may answer the assistant and are escalated
+HISTORY_SHORT_MAX_WORDS = 4
+QUESTION_WORDS = frozenset("what how why when where which who whose whom is are can could does do did should will".split())
+ENGLISH_LANGUAGES = (None, "", "None", "English", "english", "en")
+
+_phrase_categories = {phrase: category for category, phrases in SMALLTALK_LEXICON.items() for phrase in phrases}
+_smalltalk_vocabulary = {word for phrase in _phrase_categories for word in phrase.split()} | {"please", "so", "much", "very"}
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+def normalize_message(text):
+    text = str(text).lower().replace("'", "").replace("’", "")
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+def _ngrams(text, n=3):
+    padded = f" {text} "
+    return Counter(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+def _cosine(a, b):
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    if not dot:
+        return 0.0
+    return dot / (math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values())))
+
+_smalltalk_profiles = [(phrase.split(), _ngrams(phrase), category) for phrase, category in _phrase_categories.items()]
+_domain_profiles = [_ngrams(example) for example in DOMAIN_EXAMPLES]
+
+def _is_single_typo(words, phrase_words):
+    # Same words except one unknown word standing in for a longer lexicon word ("helo", "hello ther")
+    if len(words) != len(phrase_words):
+        return False
+    differing = [(word, phrase_word) for word, phrase_word in zip(words, phrase_words) if word != phrase_word]
+    return len(differing) == 1 and differing[0][0] not in _smalltalk_vocabulary \
+        and len(differing[0][1]) >= NGRAM_MIN_WORD_LENGTH
+
+def classify_smalltalk(text, lang=None, has_history=False):
+    """
+    Decide locally whether a message is small talk: returns (reply, is_greeting), or None when unsure.
+    Small talk in a language other than English is left to the LLM so the reply matches the user's language.
+    Only exact lexicon phrases count as small talk when the message contains a question word ("what is it")
+    or, with has_history, is short enough to answer the assistant; such short answers are otherwise escalated.
+    """
+    if not SMALLTALK_CLASSIFIER:
+        return None
+    message = normalize_message(text)
+    if not message:
+        return None
+    words = message.split()
+
+    category = _phrase_categories.get(message)
+    short_answer = has_history and len(words) <= HISTORY_SHORT_MAX_WORDS
+    guarded = bool(QUESTION_WORDS & set(words)) or short_answer
+    if category is None and not guarded and all(word in _smalltalk_vocabulary for word in words) and len(words) <= 6:
+        # Combinations such as "hi there thanks" or "ok thank you so much"
+        category = next((_phrase_categories[word] for word in words if word in _phrase_categories), None)
+
+    grams = _ngrams(message)
+    smalltalk_score = max(_cosine(grams, profile) for _, profile, _ in _smalltalk_profiles)
+    domain_score = max(_cosine(grams, profile) for profile in _domain_profiles)
+    if category is None and not guarded:
+        typo_score, nearest = max(
+            ((_cosine(grams, profile), name) for phrase_words, profile, name in _smalltalk_profiles
+             if _is_single_typo(words, phrase_words)),
+            default=(0.0, None),
+        )
+        if typo_score >= NGRAM_MIN_SIMILARITY and typo_score - domain_score >= NGRAM_MIN_MARGIN:
+            category = nearest
+
+    if category is not None:
+        if lang not in ENGLISH_LANGUAGES:
+            return None
+        return SMALLTALK_REPLIES[category], True
+    if short_answer:
+        return None
+
+    smalltalk_words = sum(word in _smalltalk_vocabulary for word in words)
+    if any(char.isdigit() for char in message) or (len(words) >= 3 and smalltalk_words == 0) or (
+        len(words) >= 4 and smalltalk_words * 2 < len(words) and domain_score >= smalltalk_score
+    ):
+        return "", False
+    return None
+
+def should_audit():
+    return random.random() < SMALLTALK_AUDIT_RATE
+
+def record_decision(local_decision):
+    """
+    Count a local decision, or an escalation to the LLM when local_decision is None
+    """
+    with _stats_lock:
+        _stats["messages"] += 1
+        if local_decision is None:
+            _stats["escalated"] += 1
+        else:
+            _stats["local_smalltalk" if local_decision[1] else "local_questions"] += 1
+
+def record_audit(local_is_greeting, llm_is_greeting):
+    with _stats_lock:
+        _stats["audited"] += 1
+        _stats["agreed"] += int(bool(local_is_greeting) == bool(llm_is_greeting))
+
+def classifier_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    messages = stats.get("messages", 0)
+    local = stats.get("local_smalltalk", 0) + stats.get("local_questions", 0)
+    audited = stats.get("audited", 0)
+    return {
+        "messages": messages,
+        "local_smalltalk": stats.get("local_smalltalk", 0),
+        "local_questions": stats.get("local_questions", 0),
+        "escalated": stats.get("escalated", 0),
+        "hit_rate": round(local / messages, 3) if messages else 0.0,
+        "audited": audited,
+        "agreement": round(stats.get("agreed", 0) / audited, 3) if audited else None,
+    }
@@ -0,0 +1,94 @@
+import os
+import re
+import html
+from concurrent.futures import ThreadPoolExecutor
+
+# Sentences synthesized at the same time
+SPEECH_MAX_WORKERS = int(os.getenv("SPEECH_MAX_WORKERS", "4"))
+# Short sentences are merged up to this length so there are fewer, less choppy requests;
+# the first piece is sent as soon as it is a full sentence to start playback early
+SPEECH_MIN_CHARS = int(os.getenv("SPEECH_MIN_CHARS", "80"))
+
+_BLOCK_END = re.compile(r"<br\s*/?>|</(?:p|li|h\d|div|tr|ul|ol)>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>?")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;:])\s+|\s*\n\s*")
+
+def html_to_speech_text(text):
+    """
+    Plain text of an HTML answer for speech; block ends become line breaks, a tag still being streamed is dropped
+    """
+    text = _BLOCK_END.sub("\n", text)
+    text = _TAG.sub(" ", text)
+    text = html.unescape(text)
+    return re.sub(r"[ \t\r\f\v]+", " ", text)
+
+def split_sentences(text, final=False):
+    """
+    Speech pieces of a (possibly still growing) answer. Without final, only pieces that can no longer
+    change are returned, so the result for a prefix of the answer is a prefix of the result for the whole.
+    """
+    sentences = [sentence.strip() for sentence in _SENTENCE_BREAK.split(html_to_speech_text(text))]
+    if not final:
+        # The last piece may still be growing
+        sentences = sentences[:-1]
+    pieces, current = [], ""
+    for sentence in sentences:
+        if not sentence:
+            continue
+        current = f"{current} {sentence}".strip()
+        if not pieces or len(current) >= SPEECH_MIN_CHARS:
+            pieces.append(current)
+            current = ""
+    if final and current:
+        pieces.append(current)
+    return pieces
+
+class SpeechStream:
+    """
+    Turns an answer that is still being generated into audio, sentence by sentence.
+    feed() takes the answer text so far and starts synthesizing every newly completed piece;
+    on_segment receives finished audio in order, on the calling thread, as soon as it is ready.
+    """
+
+    def __init__(self, synthesize, on_segment=None, max_workers=None):
+        self.synthesize = synthesize
+        self.on_segment = on_segment
+        self.segments = []
+        self._futures = []
+        self._submitted = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or SPEECH_MAX_WORKERS, thread_name_prefix="speech")
+
+    def _submit(self, text, final):
+        pieces = split_sentences(text, final=final)
+        for piece in pieces[self._submitted:]:
+            self._futures.append(self._executor.submit(self.synthesize, piece))
+        self._submitted = max(self._submitted, len(pieces))
+
+    def _deliver(self, wait):
+        while len(self.segments) < len(self._futures):
+            future = self._futures[len(self.segments)]
+            if not wait and not future.done():
+                return
+            try:
+                audio = future.result()
+            except Exception as e:
+                print(f"Speech synthesis error: {e}")
+                audio = None
+            self.segments.append(audio)
+            if audio and self.on_segment:
+                self.on_segment(audio)
+
+    def feed(self, text):
+        self._submit(text, final=False)
+        self._deliver(wait=False)
+
+    def finish(self, text):
+        """
+        Synthesize the rest of the final answer, deliver everything and return the audio segments in order
+        """
+        try:
+            self._submit(text, final=True)
+            self._deliver(wait=True)
+        finally:
+            self._executor.shutdown(wait=False)
+        return [segment for segment in self.segments if segment]
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Modules read CACHE_DIR when they are imported, so it points at a scratch directory before any test imports them
+os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="rag-tests-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
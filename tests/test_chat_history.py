@@ -0,0 +1,43 @@
+import chat_history
+from chat_history import compact_history, visible_messages, SUMMARY_ROLE
+from text_utils import estimate_tokens
+
+def turns(count, start=0):
+    messages = []
+    for i in range(start, start + count):
+        messages.append({"role": "user", "content": f"Question {i} about the unit"})
+        messages.append({"role": "assistant", "content": f"<p>Answer {i} with <b>details</b></p>"})
+    return messages
+
+def test_history_stays_bounded_with_a_summary():
+    history = []
+    for i in range(40):
+        history.extend(turns(1, i))
+        compact_history(history, 10)
+        assert len(history) <= 11
+    assert history[0]["role"] == SUMMARY_ROLE
+    # The newest turns folded into the summary, answers as plain text
+    assert history[0]["content"].endswith("User: Question 34 about the unit\nAssistant: Answer 34 with details")
+    assert estimate_tokens(history[0]["content"]) <= chat_history.CHAT_SUMMARY_MAX_TOKENS
+    assert [message["content"] for message in history[-2:]] == ["Question 39 about the unit", "<p>Answer 39 with <b>details</b></p>"]
+    assert all(message["role"] != SUMMARY_ROLE for _, message in visible_messages(history))
+
+def test_question_and_answer_pairs_stay_together():
+    history = turns(4)
+    compact_history(history, 5)
+    assert [message["role"] for message in history] == [SUMMARY_ROLE, "user", "assistant", "user", "assistant"]
+
+def test_short_history_is_unchanged():
+    history = turns(2)
+    assert compact_history(history, 10) == turns(2)
+
+def test_summary_is_capped_in_tokens(monkeypatch):
+    monkeypatch.setattr(chat_history, "CHAT_SUMMARY_MAX_TOKENS", 60)
+    history = []
+    for i in range(30):
+        history.extend(turns(1, i))
+        compact_history(history, 2)
+        assert estimate_tokens(history[0]["content"]) <= 60
+    # The oldest lines were dropped first
+    assert "Question 0 " not in history[0]["content"]
+    assert "Answer 28" in history[0]["content"]
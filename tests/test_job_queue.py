@@ -0,0 +1,40 @@
+import os
+import pytest
+import job_queue
+
+@pytest.fixture
+def queue_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    # Every running job looks orphaned, as if its worker died right after claiming it
+    monkeypatch.setattr(job_queue, "JOB_HEARTBEAT_TIMEOUT", -1)
+    return tmp_path
+
+def test_orphaned_job_is_retried_then_failed(queue_db):
+    upload_dir = queue_db / "upload-1"
+    upload_dir.mkdir()
+    path = upload_dir / "manual.pdf"
+    path.write_bytes(b"%PDF")
+    job_id = job_queue.enqueue_job("manual.pdf", str(path))
+
+    for attempt in range(job_queue.JOB_MAX_ATTEMPTS):
+        job = job_queue.claim_next_job("worker-a")
+        assert job["id"] == job_id
+        assert job_queue.get_jobs([job_id])[0]["attempts"] == attempt + 1
+        assert os.path.exists(upload_dir)
+
+    assert job_queue.claim_next_job("worker-a") is None
+    job = job_queue.get_jobs([job_id])[0]
+    assert job["status"] == "failed"
+    assert job["attempts"] == job_queue.JOB_MAX_ATTEMPTS
+    assert "stopped during processing" in job["error"]
+    assert not os.path.exists(upload_dir)
+
+def test_claims_oldest_queued_job_once(queue_db, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_HEARTBEAT_TIMEOUT", 60)
+    first = job_queue.enqueue_job("a.pdf", str(queue_db / "a" / "a.pdf"))
+    second = job_queue.enqueue_job("b.pdf", str(queue_db / "b" / "b.pdf"))
+    assert job_queue.claim_next_job("worker-a")["id"] == first
+    assert job_queue.claim_next_job("worker-b")["id"] == second
+    assert job_queue.claim_next_job("worker-a") is None
+    job_queue.finish_job(first, True)
+    assert [job["status"] for job in job_queue.get_jobs()] == ["running", "succeeded"]
@@ -0,0 +1,45 @@
+import json
+from json_stream import JsonStringFieldStream, trim_partial_html
+
+RAW = json.dumps({"sources": ['a "b"'], "answer": "Line 1\nQuote \" slash \\ café \U0001F600 end", "x": "y"})
+EXPECTED = json.loads(RAW)["answer"]
+
+def feed_all(chunks):
+    stream = JsonStringFieldStream("answer")
+    for chunk in chunks:
+        stream.feed(chunk)
+        # Only fully decoded text ever shows up
+        assert EXPECTED.startswith(stream.value)
+    return stream
+
+def test_value_decoded_at_every_split():
+    for split in range(len(RAW) + 1):
+        stream = feed_all([RAW[:split], RAW[split:]])
+        assert stream.value == EXPECTED
+        assert stream.complete
+
+def test_value_decoded_one_character_at_a_time():
+    stream = feed_all(list(RAW))
+    assert stream.value == EXPECTED
+    assert stream.complete
+    assert stream.buffer == RAW
+
+def test_split_escape_waits_for_the_rest():
+    stream = JsonStringFieldStream("answer")
+    assert stream.feed(r'{"answer": "caf\u00')
+    assert stream.value == "caf"
+    assert not stream.feed("")
+    assert stream.feed(r'e9 \ud83d')
+    assert stream.value == "café "
+    assert stream.feed(r'\ude00"')
+    assert stream.value == "café \U0001F600"
+    assert stream.complete
+    assert not stream.feed(', "more": "x"}')
+
+def test_field_name_inside_a_string_is_not_matched():
+    stream = JsonStringFieldStream("answer")
+    stream.feed(r'{"note": "\"answer\": \"no\"", "answer": "yes"}')
+    assert stream.value == "yes"
+
+def test_trim_partial_html():
+    assert trim_partial_html("<b>Bold</b> and </l") == "<b>Bold</b> and "
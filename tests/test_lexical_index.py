@@ -0,0 +1,49 @@
+import pytest
+from lexical_index import LexicalIndex, tokenize
+
+@pytest.fixture
+def index(tmp_path):
+    return LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+
+def chunk(chunk_id, text, **metadata):
+    return {"id": chunk_id, "text": text, "metadata": {"source": "manual.pdf", **metadata}}
+
+def test_tokenize_splits_model_codes():
+    terms = tokenize("Model PEAD-RP71JAA")
+    assert {"pead-rp71jaa", "pead", "rp71jaa", "rp71", "jaa"} <= set(terms)
+    assert {"kd79", "d904", "h01"} <= set(tokenize("KD79D904H01"))
+    assert tokenize("E6") == ["e6"]
+
+def test_model_number_prefix_is_found(index):
+    index.add([chunk("a", "Model PEAD-RP71JAA outdoor unit"), chunk("b", "Filter cleaning steps")])
+    assert [match.id for match in index.search("RP71")] == ["a"]
+
+def test_filter_applies_before_relative_cutoff(index):
+    index.add([
+        chunk("a", "E6 error E6 error E6 error means the fan motor failed", category=["X"]),
+        chunk("b", "E6 is shown on the display", category=["Y"]),
+    ])
+    assert [match.id for match in index.search("E6 error", metadata_filter={"category": "Y"})] == ["b"]
+    assert [match.id for match in index.search("E6 error", metadata_filter={"category": "X"})] == ["a"]
+
+def test_other_process_sees_adds_and_deletes(tmp_path):
+    path = str(tmp_path / "lexical.sqlite3")
+    writer, reader = LexicalIndex(path), LexicalIndex(path)
+    writer.add([chunk("a", "error E6"), chunk("b", "error E4")])
+    assert [match.id for match in reader.search("E6")] == ["a"]
+    writer.delete(["a"])
+    assert reader.search("E6") == []
+    writer.add([chunk("a", "code E6 again")])
+    assert [match.id for match in reader.search("E6")] == ["a"]
+    writer.clear()
+    assert reader.search("E4") == []
+
+def test_old_chunks_are_retokenized(tmp_path):
+    path = str(tmp_path / "lexical.sqlite3")
+    index = LexicalIndex(path)
+    index.add([chunk("a", "Model PEAD-RP71JAA")])
+    # Simulate an index written by the previous tokenizer
+    index._conn.execute("""UPDATE chunks SET terms = '{"pead-rp71jaa": 1, "pead": 1, "rp71jaa": 1}'""")
+    index._conn.execute("UPDATE meta SET value = 1 WHERE key = 'tokenizer'")
+    index._conn.commit()
+    assert [match.id for match in LexicalIndex(path).search("RP71")] == ["a"]
@@ -0,0 +1,53 @@
+import os
+import sys
+import sqlite3
+import subprocess
+import pytest
+import rate_limiter
+from rate_limiter import ProviderLimiter, SharedTokenBucket
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def shared_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_DB_PATH", str(tmp_path / "rate_limits.sqlite3"))
+    monkeypatch.setattr(SharedTokenBucket, "_conn", None)
+    yield tmp_path
+    if SharedTokenBucket._conn is not None:
+        SharedTokenBucket._conn.close()
+
+def test_failed_budget_take_releases_the_slot():
+    limiter = ProviderLimiter("test", "model", 60, 0, 1)
+
+    def locked(amount=1):
+        raise sqlite3.OperationalError("database is locked")
+    limiter.requests.take = locked
+    with pytest.raises(sqlite3.OperationalError):
+        limiter.enter()
+    assert limiter.in_flight == 0
+
+def test_shared_bucket_leases_in_batches(shared_db):
+    bucket = SharedTokenBucket("test/leases", 6000, 100)
+    for _ in range(50):
+        bucket.take()
+    # 10% of the capacity per lease: one database write per 10 calls
+    assert bucket.leases == 5
+
+def test_shared_bucket_is_shared_between_processes(tmp_path):
+    # 20 units per second with a burst of 10: two processes taking 15 each wait for 20 refilled units (~1s),
+    # one process alone would wait for 5 (~0.25s)
+    script = (
+        "import time, rate_limiter\n"
+        "bucket = rate_limiter.SharedTokenBucket('test/processes', 1200, 10)\n"
+        "start = time.time()\n"
+        "for _ in range(15):\n"
+        "    bucket.take()\n"
+        "print(time.time() - start)\n"
+    )
+    env = {**os.environ, "CACHE_DIR": str(tmp_path), "RATE_LIMIT_LEASE_SHARE": "0"}
+    processes = [
+        subprocess.Popen([sys.executable, "-c", script], cwd=REPO_DIR, env=env, stdout=subprocess.PIPE, text=True)
+        for _ in range(2)
+    ]
+    elapsed = [float(process.communicate(timeout=30)[0]) for process in processes]
+    assert max(elapsed) >= 0.8
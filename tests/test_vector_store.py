@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import pytest
+import vector_store
+from vector_store import LocalVectorStore, matches_filter
+
+def unit(*values):
+    vector = np.zeros(4, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector.tolist()
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalVectorStore(str(tmp_path))
+
+def rows(store):
+    return dict(store._conn.execute("SELECT id, row FROM vectors"))
+
+def test_upsert_and_query(store):
+    store.upsert([
+        {"id": "a", "values": unit(1), "metadata": {"text": "a"}},
+        {"id": "b", "values": unit(0, 1), "metadata": {"text": "b"}},
+    ])
+    matches = store.query(unit(0.1, 1), top_k=2)
+    assert [match.id for match in matches] == ["b", "a"]
+    assert matches[0].metadata["text"] == "b"
+    assert store.describe_stats()["total_vector_count"] == 2
+
+def test_deleted_and_replaced_rows_are_not_reused(store):
+    store.upsert([{"id": "a", "values": unit(1), "metadata": {}}, {"id": "b", "values": unit(0, 1), "metadata": {}}])
+    stale = store._refresh()
+    store.delete(["a"])
+    store.upsert([{"id": "c", "values": unit(0, 0, 1), "metadata": {}}, {"id": "b", "values": unit(0, 0, 0, 1), "metadata": {}}])
+    assert rows(store) == {"c": 2, "b": 3}
+    # A view taken before the writes still reads the vectors its ids pointed to
+    assert stale["ids"] == ["a", "b"]
+    assert np.allclose(stale["vectors"], [unit(1), unit(0, 1)])
+    assert [match.id for match in store.query(unit(0, 0, 0, 1), top_k=1)] == ["b"]
+
+def test_compaction_moves_live_rows_to_a_new_file(store, monkeypatch):
+    monkeypatch.setattr(vector_store, "LOCAL_VECTOR_COMPACT_MIN_ROWS", 1)
+    store.upsert([{"id": f"v{i}", "values": unit(1, i), "metadata": {}} for i in range(4)])
+    stale = store._refresh()
+    store.delete(["v0", "v1", "v2"])
+    assert store._meta("epoch") == 1
+    assert rows(store) == {"v3": 0}
+    assert not os.path.exists(store._matrix_path(0))
+    assert [match.id for match in store.query(unit(1, 3), top_k=5)] == ["v3"]
+    # The unlinked file stays readable through the old view
+    assert np.allclose(stale["vectors"][1], np.asarray(unit(1, 1)) / np.linalg.norm(unit(1, 1)))
+
+def test_delete_all_then_upsert(store):
+    store.upsert([{"id": "a", "values": unit(1), "metadata": {}}])
+    store.delete_all()
+    assert store.query(unit(1), top_k=1) == []
+    store.upsert([{"id": "b", "values": unit(0, 1), "metadata": {}}])
+    assert [match.id for match in store.query(unit(0, 1), top_k=5)] == ["b"]
+    assert rows(store) == {"b": 0}
+
+def test_filters_match_local_and_pinecone_semantics(store):
+    untagged = {"text": "legacy"}
+    tagged = {"category": ["*"], "brand": ["LG"]}
+    metadata_filter = {"$or": [{"brand": {"$in": ["Daikin", "*"]}}, {"category": {"$exists": False}}]}
+    assert matches_filter(untagged, metadata_filter)
+    assert not matches_filter(tagged, metadata_filter)
+    store.upsert([{"id": "legacy", "values": unit(1), "metadata": untagged}, {"id": "lg", "values": unit(1, 0.1), "metadata": tagged}])
+    assert [match.id for match in store.query(unit(1), top_k=5, metadata_filter=metadata_filter)] == ["legacy"]
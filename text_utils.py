@@ -0,0 +1,40 @@
+import re
+import html
+
+_encoding = None
+_encoding_loaded = False
+
+def _get_encoding():
+    # tiktoken reads (and on first run downloads) its vocabulary, so it is loaded on first use
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+def estimate_tokens(text):
+    """
+    Count tokens with tiktoken; if its vocabulary cannot be loaded (e.g. offline first run), approximate at ~4 characters per token
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+def normalize_text(text):
+    """
+    Collapse whitespace so cosmetic differences do not change cache keys
+    """
+    return re.sub(r"\s+", " ", str(text)).strip()
+
+def html_to_text(text):
+    """
+    Plain text of an HTML snippet, whitespace collapsed
+    """
+    return normalize_text(html.unescape(re.sub(r"<[^>]+>", " ", str(text))))
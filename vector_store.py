@@ -0,0 +1,479 @@
+import os
+import json
+import sqlite3
+import threading
+import numpy as np
+from local_cache import CACHE_DIR
+from rate_limiter import rate_limited_call
+from clients import get_pinecone_index
+
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", os.path.join(CACHE_DIR, "vectors"))
+# Inverted-file (IVF) lists for approximate local search; 0 searches every vector exactly
+LOCAL_VECTOR_IVF_LISTS = int(os.getenv("LOCAL_VECTOR_IVF_LISTS", "0"))
+# Lists scanned per query; more probes find more of the true neighbours at the cost of speed
+LOCAL_VECTOR_IVF_PROBES = int(os.getenv("LOCAL_VECTOR_IVF_PROBES", "8"))
+# Below this many vectors exact search is already fast and IVF is not built
+LOCAL_VECTOR_IVF_MIN_VECTORS = int(os.getenv("LOCAL_VECTOR_IVF_MIN_VECTORS", "20000"))
+# Rewrite the matrix file once this share of its rows belongs to deleted or replaced vectors
+LOCAL_VECTOR_COMPACT_SHARE = float(os.getenv("LOCAL_VECTOR_COMPACT_SHARE", "0.5"))
+LOCAL_VECTOR_COMPACT_MIN_ROWS = 1024
+
+class Match:
+    """
+    A retrieved chunk, shaped like a Pinecone match: id, score and metadata (text, source, page_number, ...)
+    """
+
+    __slots__ = ("id", "score", "metadata")
+
+    def __init__(self, id, score, metadata):
+        self.id = id
+        self.score = score
+        self.metadata = metadata
+
+    def __repr__(self):
+        return f"Match(id={self.id!r}, score={self.score:.3f}, source={self.metadata.get('source')!r}, page={self.metadata.get('page_number')!r})"
+
+def _condition_values(condition):
+    # {"$in": [...]}, {"$eq": value} or a bare value
+    if isinstance(condition, dict):
+        if "$in" in condition:
+            return list(condition["$in"])
+        if "$eq" in condition:
+            return [condition["$eq"]]
+        raise ValueError(f"Unsupported metadata filter: {condition}")
+    return [condition]
+
+def matches_filter(metadata, metadata_filter):
+    """
+    Whether metadata passes a Pinecone-style filter of {field: {"$in": [...]} / {"$eq": value} / {"$exists": bool} / value}
+    or {"$or": [filter, ...]}, where a list-valued field matches when any of its values does
+    """
+    for field, condition in (metadata_filter or {}).items():
+        if field == "$or":
+            if not any(matches_filter(metadata, alternative) for alternative in condition):
+                return False
+            continue
+        if isinstance(condition, dict) and "$exists" in condition:
+            if (field in metadata) != bool(condition["$exists"]):
+                return False
+            continue
+        values = metadata.get(field)
+        values = values if isinstance(values, list) else [values]
+        if not set(values) & set(_condition_values(condition)):
+            return False
+    return True
+
+class VectorStore:
+    """
+    Chunk vectors with metadata. Vectors are {"id", "values", "metadata"} dicts; queries return
+    matches with id, score (cosine similarity) and metadata.
+    """
+
+    name = None
+
+    def upsert(self, vectors):
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def delete_all(self):
+        raise NotImplementedError
+
+    def update_metadata(self, vector_id, metadata):
+        raise NotImplementedError
+
+    def query(self, vector, top_k, metadata_filter=None):
+        raise NotImplementedError
+
+    def list_ids(self, prefix):
+        raise NotImplementedError
+
+    def describe_stats(self):
+        """
+        {"total_vector_count": ..., "dimension": ...}
+        """
+        raise NotImplementedError
+
+class PineconeVectorStore(VectorStore):
+    name = "pinecone"
+
+    def __init__(self, api_key=None, index_name=None):
+        self.index = get_pinecone_index(api_key, index_name)
+
+    def upsert(self, vectors):
+        # Upsert in batches of 100
+        batch_size = 100
+        for i in range(0, len(vectors), batch_size):
+            batch = vectors[i:i + batch_size]
+            rate_limited_call("pinecone", "write", lambda: self.index.upsert(vectors=batch), description="Pinecone upsert")
+
+    def delete(self, ids):
+        # Delete in batches of 1000 (Pinecone's per-request limit)
+        batch_size = 1000
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i:i + batch_size]
+            rate_limited_call("pinecone", "write", lambda: self.index.delete(ids=batch), description="Pinecone delete")
+
+    def delete_all(self):
+        rate_limited_call("pinecone", "write", lambda: self.index.delete(delete_all=True), description="Pinecone reset")
+
+    def update_metadata(self, vector_id, metadata):
+        rate_limited_call("pinecone", "write", lambda: self.index.update(id=vector_id, set_metadata=metadata),
+                          description="Pinecone update")
+
+    def query(self, vector, top_k, metadata_filter=None):
+        response = rate_limited_call("pinecone", "query", lambda: self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True,
+            filter=metadata_filter
+        ), description="Pinecone query")
+        return response.matches
+
+    def list_ids(self, prefix):
+        # Listing by prefix is only supported on serverless indexes
+        pages = rate_limited_call("pinecone", "query", lambda: list(self.index.list(prefix=prefix)),
+                                  description="Pinecone list")
+        return [vector_id for ids in pages for vector_id in ids]
+
+    def describe_stats(self):
+        stats = rate_limited_call("pinecone", "query", self.index.describe_index_stats, description="Pinecone index stats")
+        return {"total_vector_count": stats.get("total_vector_count", 0), "dimension": stats.get("dimension")}
+
+class LocalVectorStore(VectorStore):
+    """
+    Normalized float32 vectors in a memory-mapped matrix file, with ids, rows and metadata in SQLite.
+    The ingestion worker writes and the app reads the same directory; each process keeps a view that is
+    reloaded when the stored generation changes. A row is written once: upserts append, and the space of
+    deleted or replaced rows is reclaimed by compacting into a new matrix file, so a view taken before
+    a write keeps reading the vectors its ids point to.
+    """
+
+    name = "local"
+
+    def __init__(self, directory=None):
+        self.directory = directory or LOCAL_VECTOR_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.directory, "vectors.sqlite3"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+        self._generation = None
+        self._view = None
+
+    def _meta(self, key, default=0):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value)
+        )
+
+    def _bump_generation(self):
+        self._set_meta("generation", self._meta("generation") + 1)
+
+    def _matrix_path(self, epoch):
+        # Each compaction writes a new file; epoch 0 keeps the original name
+        return os.path.join(self.directory, "vectors.f32" if not epoch else f"vectors.{epoch}.f32")
+
+    def _capacity(self, path, dimension):
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // (dimension * 4)
+
+    def upsert(self, vectors):
+        if not vectors:
+            return
+        values = np.asarray([vector["values"] for vector in vectors], dtype=np.float32)
+        values /= np.maximum(np.linalg.norm(values, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            # BEGIN IMMEDIATE serializes writers across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                dimension = self._meta("dimension") or values.shape[1]
+                if values.shape[1] != dimension:
+                    raise ValueError(f"Vector dimension {values.shape[1]} does not match the store ({dimension})")
+                # Vectors always go to new rows; a replaced id leaves its old row behind for compaction
+                high_water = self._meta("rows")
+                assigned = list(range(high_water, high_water + len(vectors)))
+                high_water += len(vectors)
+
+                path = self._matrix_path(self._meta("epoch"))
+                capacity = self._capacity(path, dimension)
+                if high_water > capacity:
+                    # Grow by doubling so appends stay cheap
+                    with open(path, "ab") as f:
+                        f.truncate(max(high_water, capacity * 2, 1024) * dimension * 4)
+                    capacity = self._capacity(path, dimension)
+                matrix = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, dimension))
+                matrix[assigned] = values
+                matrix.flush()
+                del matrix
+
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO vectors (id, row, metadata) VALUES (?, ?, ?)",
+                    [(vector["id"], row, json.dumps(vector.get("metadata", {}))) for vector, row in zip(vectors, assigned)],
+                )
+                self._set_meta("dimension", dimension)
+                self._set_meta("rows", high_water)
+                self._bump_generation()
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._compact_if_sparse()
+
+    def delete(self, ids):
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = list(ids[start:start + 500])
+                placeholders = ",".join("?" * len(batch))
+                self._conn.execute(f"DELETE FROM vectors WHERE id IN ({placeholders})", batch)
+            self._bump_generation()
+            self._conn.commit()
+            self._compact_if_sparse()
+
+    def delete_all(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                old_path = self._matrix_path(self._meta("epoch"))
+                self._conn.execute("DELETE FROM vectors")
+                self._set_meta("rows", 0)
+                self._set_meta("epoch", self._meta("epoch") + 1)
+                self._bump_generation()
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._remove_matrix(old_path)
+
+    def _remove_matrix(self, path):
+        # Views mapping the file keep reading it after it is unlinked; where that is not allowed it stays behind
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _compact_if_sparse(self):
+        # Caller holds the lock
+        high_water = self._meta("rows")
+        free = high_water - self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+        if free >= LOCAL_VECTOR_COMPACT_MIN_ROWS and free > high_water * LOCAL_VECTOR_COMPACT_SHARE:
+            self._compact()
+
+    def compact(self):
+        """
+        Copy the live vectors into a new matrix file without the rows of deleted and replaced vectors
+        """
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        # Caller holds the lock
+        self._conn.execute("BEGIN IMMEDIATE")
+        epoch, dimension = self._meta("epoch"), self._meta("dimension")
+        old_path, new_path = self._matrix_path(epoch), self._matrix_path(epoch + 1)
+        try:
+            entries = self._conn.execute("SELECT id, row FROM vectors ORDER BY row").fetchall()
+            if dimension:
+                old = np.memmap(old_path, dtype=np.float32, mode="r", shape=(self._capacity(old_path, dimension), dimension))
+                new = np.memmap(new_path, dtype=np.float32, mode="w+", shape=(max(len(entries), 1024), dimension))
+                new[:len(entries)] = old[[entry[1] for entry in entries]]
+                new.flush()
+                del old, new
+            # Rows only move down and in order, so the UNIQUE constraint holds at every step
+            self._conn.executemany("UPDATE vectors SET row = ? WHERE id = ?", [(row, entry[0]) for row, entry in enumerate(entries)])
+            self._set_meta("rows", len(entries))
+            self._set_meta("epoch", epoch + 1)
+            self._bump_generation()
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            self._remove_matrix(new_path)
+            raise
+        print(f"🗜️ Compacted local vector store to {len(entries)} vectors")
+        self._remove_matrix(old_path)
+
+    def update_metadata(self, vector_id, metadata):
+        with self._lock:
+            row = self._conn.execute("SELECT metadata FROM vectors WHERE id = ?", (vector_id,)).fetchone()
+            if row is None:
+                return
+            merged = {**json.loads(row[0]), **metadata}
+            self._conn.execute("UPDATE vectors SET metadata = ? WHERE id = ?", (json.dumps(merged), vector_id))
+            self._bump_generation()
+            self._conn.commit()
+
+    def list_ids(self, prefix):
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM vectors WHERE id LIKE ? ESCAPE '\\'", (pattern,))]
+
+    def describe_stats(self):
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+            return {"total_vector_count": count, "dimension": self._meta("dimension") or None}
+
+    def _refresh(self):
+        # Caller holds the lock; rebuild the view when any process changed the vectors
+        generation = self._meta("generation")
+        if generation == self._generation:
+            return self._view
+        for attempt in range(3):
+            try:
+                return self._load_view()
+            except FileNotFoundError:
+                # A compaction removed the file after the rows were read; the next read sees the new file
+                if attempt == 2:
+                    raise
+
+    def _load_view(self):
+        # Caller holds the lock; one read transaction, so the rows and the matrix file they refer to belong together
+        self._conn.execute("BEGIN")
+        try:
+            generation, epoch, dimension = self._meta("generation"), self._meta("epoch"), self._meta("dimension")
+            entries = self._conn.execute("SELECT id, row, metadata FROM vectors ORDER BY row").fetchall()
+            view = {"ids": [entry[0] for entry in entries], "metadata": [json.loads(entry[2]) for entry in entries],
+                    "fields": {}, "ivf": None}
+            rows = np.fromiter((entry[1] for entry in entries), dtype=np.int64, count=len(entries))
+            if len(entries):
+                path = self._matrix_path(epoch)
+                matrix = np.memmap(path, dtype=np.float32, mode="r", shape=(self._capacity(path, dimension), dimension))
+                # Without holes the rows are a prefix of the file and are used in place; otherwise they are gathered
+                contiguous = rows[-1] == len(rows) - 1
+                view["vectors"] = matrix[:len(rows)] if contiguous else np.ascontiguousarray(matrix[rows])
+            else:
+                view["vectors"] = np.zeros((0, dimension or 1), dtype=np.float32)
+        finally:
+            self._conn.commit()
+        self._view, self._generation = view, generation
+        return view
+
+    def _field_positions(self, view, field):
+        # value -> positions of the vectors carrying it, built on first use of a field in a filter
+        if field not in view["fields"]:
+            positions = {}
+            for position, metadata in enumerate(view["metadata"]):
+                values = metadata.get(field)
+                for value in values if isinstance(values, list) else [values]:
+                    positions.setdefault(value, []).append(position)
+            view["fields"][field] = {value: np.asarray(p, dtype=np.int64) for value, p in positions.items()}
+        return view["fields"][field]
+
+    def _filter_mask(self, view, metadata_filter):
+        mask = np.ones(len(view["ids"]), dtype=bool)
+        for field, condition in metadata_filter.items():
+            if field == "$or":
+                field_mask = np.zeros(len(view["ids"]), dtype=bool)
+                for alternative in condition:
+                    field_mask |= self._filter_mask(view, alternative)
+                mask &= field_mask
+                continue
+            field_mask = np.zeros(len(view["ids"]), dtype=bool)
+            positions = self._field_positions(view, field)
+            if isinstance(condition, dict) and "$exists" in condition:
+                # Vectors without the field are indexed under None
+                if None in positions:
+                    field_mask[positions[None]] = True
+                if condition["$exists"]:
+                    field_mask = ~field_mask
+            else:
+                for value in _condition_values(condition):
+                    if value in positions:
+                        field_mask[positions[value]] = True
+            mask &= field_mask
+        return mask
+
+    def _ivf(self, view):
+        if LOCAL_VECTOR_IVF_LISTS <= 0 or len(view["ids"]) < max(LOCAL_VECTOR_IVF_MIN_VECTORS, LOCAL_VECTOR_IVF_LISTS):
+            return None
+        if view["ivf"] is None:
+            view["ivf"] = train_ivf(view["vectors"], LOCAL_VECTOR_IVF_LISTS)
+        return view["ivf"]
+
+    def query(self, vector, top_k, metadata_filter=None):
+        query = np.asarray(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        with self._lock:
+            view = self._refresh()
+            ivf = self._ivf(view)
+        if not view["ids"]:
+            return []
+
+        mask = self._filter_mask(view, metadata_filter) if metadata_filter else None
+        positions = None
+        if ivf is not None:
+            centroids, lists = ivf
+            probes = np.argsort(centroids @ query)[::-1][:LOCAL_VECTOR_IVF_PROBES]
+            positions = np.concatenate([lists[probe] for probe in probes])
+            if mask is not None:
+                positions = positions[mask[positions]]
+            if len(positions) < top_k:
+                # Too few candidates in the probed lists; search exactly
+                positions = None
+        if positions is None:
+            positions = np.flatnonzero(mask) if mask is not None else np.arange(len(view["ids"]))
+        if not len(positions):
+            return []
+
+        if len(positions) * 4 >= len(view["ids"]):
+            # Scoring every vector is cheaper than gathering a large share of the rows first
+            scores = (view["vectors"] @ query)[positions]
+        else:
+            scores = view["vectors"][positions] @ query
+        top = np.argpartition(-scores, min(top_k, len(scores)) - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            Match(view["ids"][positions[i]], float(scores[i]), dict(view["metadata"][positions[i]]))
+            for i in top
+        ]
+
+def train_ivf(vectors, list_count, iterations=10, seed=0):
+    """
+    Spherical k-means over (a sample of) normalized vectors. Returns (centroids, positions per list).
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), list_count * 64)
+    sample = np.ascontiguousarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(sample_size, list_count, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for j in range(list_count):
+            members = sample[assignment == j]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[j] = centroid / max(float(np.linalg.norm(centroid)), 1e-12)
+    # Assign every vector in slices to bound memory
+    assignment = np.concatenate([
+        np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), 65536)
+    ])
+    return centroids, [np.flatnonzero(assignment == j) for j in range(list_count)]
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_vector_store():
+    """
+    Process-wide vector store, opened on first use. VECTOR_STORE selects "pinecone" (hosted, the default)
+    or "local" (a float32 matrix on disk that works offline); it is read here, after .env has been loaded.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.getenv("VECTOR_STORE", "pinecone").lower()
+            if backend == "local":
+                _store = LocalVectorStore()
+            elif backend == "pinecone":
+                _store = PineconeVectorStore()
+            else:
+                raise ValueError(f"Unknown VECTOR_STORE {backend!r}; use 'pinecone' or 'local'")
+            print(f"🗄️ Vector store: {_store.name}")
+        return _store